@@ -0,0 +1,141 @@
+'''
+Binder Database
+Writes the SQLite3 database of peptides, HLA alleles and binders made by
+makeDatabaseOfBinders.py and makeDatabaseFromFlatFiles.py.
+
+A BulkWriter keeps one connection to the new database for the whole build, with the
+journal and syncing to disk turned off (a build that fails part way leaves a database
+to delete, not one to recover), a large page cache, and rows inserted in transactions
+of many rows. The indexes are built once all rows are in, which is much faster than
+keeping them up to date while inserting. The rows per second of each table and the time
+taken by each index are printed.
+
+    writer = binderDatabase.BulkWriter("HUMAN_binders.db")
+    writer.createTables(binderDatabase.tableStatements(2), 2)
+    writer.insert("hla", ("id", "allele"), rows)
+    ...
+    writer.close(binderDatabase.indexStatements(2))
+
+The schema version is kept in PRAGMA user_version (0 in databases made before there
+were versions, which are version 1):
+    1  peptide(id INT, sequence TEXT), hla(id INT, allele TEXT), binders(hla_id INT, pep_id INT, ic50 REAL),
+       with an index on each of peptide.id, peptide.sequence, binders.hla_id and binders.pep_id
+    2  peptide(id INTEGER PRIMARY KEY, sequence TEXT UNIQUE), hla(id INTEGER PRIMARY KEY, allele TEXT),
+       binders(hla_id INT, pep_id INT, ic50 REAL, PRIMARY KEY(hla_id, pep_id)) WITHOUT ROWID,
+       so the binders of an allele are stored together in pep_id order and no other indexes
+       are needed. The IC50 can instead be stored quantised, as ic50_q INT in tenths of a nM
+       (at most 65535, i.e. 6553.5 nM), which SQLite stores in 2 bytes up to 3276.7 nM (so
+       for every binder below 500 nM) and 3 bytes above, instead of 8 bytes for a REAL.
+       WITHOUT ROWID tables need SQLite 3.8.2 or later.
+Migrate a version 1 database with migrateBinderDatabase.py.
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import sqlite3
+import time
+import numpy as np
+
+SCHEMA_VERSIONS = [1, 2]
+INDEXES = ["CREATE INDEX peptide_ind ON peptide(id)",
+           "CREATE INDEX peptide_seq ON peptide(sequence)",
+           "CREATE INDEX binder_hla_ind ON binders(hla_id)",
+           "CREATE INDEX binder_pep_ind ON binders(pep_id)"]
+
+## quantised IC50s: integer tenths of a nM, at most the largest uint16
+IC50_Q_SCALE = 10
+IC50_Q_MAX = 65535
+
+## rows per transaction, and page cache size
+TRANSACTION_ROWS = 1000000
+CACHE_MB = 1024
+
+
+def ic50Column(quantised = False):
+    return "ic50_q" if quantised else "ic50"
+
+
+def tableStatements(version = 1, ic50 = "ic50"):
+    '''CREATE TABLE statements of a schema version; ic50 is the IC50 column of binders ("ic50", "ic50_q" or None for none).'''
+    binderColumns = "hla_id INT, pep_id INT"
+    if ic50:
+        binderColumns += ", {} {}".format(ic50, "INT" if ic50 == "ic50_q" else "REAL")
+    if version == 1:
+        return ["CREATE TABLE peptide(id INT, sequence TEXT)",
+                "CREATE TABLE hla(id INT, allele TEXT)",
+                "CREATE TABLE binders({})".format(binderColumns)]
+    return ["CREATE TABLE peptide(id INTEGER PRIMARY KEY, sequence TEXT UNIQUE)",
+            "CREATE TABLE hla(id INTEGER PRIMARY KEY, allele TEXT)",
+            "CREATE TABLE binders({}, PRIMARY KEY(hla_id, pep_id)) WITHOUT ROWID".format(binderColumns)]
+
+
+def indexStatements(version = 1):
+    ## version 2 tables are indexed by their primary keys
+    return INDEXES if version == 1 else []
+
+
+def quantiseIC50(ic50):
+    '''Integer tenths of a nM (rounded half up) for an array of IC50s, at most IC50_Q_MAX.'''
+    return np.minimum(np.floor(np.asarray(ic50, dtype = np.float64) * IC50_Q_SCALE + 0.5), IC50_Q_MAX).astype(np.int64)
+
+
+def schemaVersion(db):
+    '''Schema version of an open database.'''
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    return version if version else 1
+
+
+class BulkWriter:
+    def __init__(self, fileName, transactionRows = TRANSACTION_ROWS, cacheMB = CACHE_MB):
+        self.fileName = fileName
+        self.transactionRows = transactionRows
+        ## transactions are begun and committed here, not by the sqlite3 module
+        self.db = sqlite3.connect(fileName, isolation_level = None)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("PRAGMA cache_size = {}".format(-1024 * cacheMB))
+        self.db.execute("PRAGMA temp_store = MEMORY")
+        self.db.execute("PRAGMA locking_mode = EXCLUSIVE")
+        self.db.execute("BEGIN")
+        self.uncommitted = 0
+        ## table -> [rows, seconds inserting]
+        self.tableRows = {}
+        self.timecheck = time.time()
+
+    def createTables(self, statements, version = 1):
+        for statement in statements:
+            self.db.execute(statement)
+        self.db.execute("PRAGMA user_version = {:d}".format(version))
+
+    def insert(self, table, columns, rows, replace = False):
+        '''Insert rows (tuples of the given columns) into a table; with replace, a row that
+        repeats a primary key or unique value replaces the earlier row.'''
+        start = time.time()
+        cursor = self.db.executemany("INSERT {}INTO {}({}) VALUES ({})".format("OR REPLACE " if replace else "", table, ", ".join(columns), ", ".join("?" for c in columns)), rows)
+        numRows = cursor.rowcount
+        self.uncommitted += numRows
+        if self.uncommitted >= self.transactionRows:
+            self.commit()
+        counts = self.tableRows.setdefault(table, [0, 0.0])
+        counts[0] += numRows
+        counts[1] += time.time() - start
+
+    def commit(self):
+        self.db.execute("COMMIT")
+        self.db.execute("BEGIN")
+        self.uncommitted = 0
+
+    def close(self, indexes = INDEXES):
+        '''Commit the last rows, build the indexes and close the database.'''
+        self.db.execute("COMMIT")
+        for table in sorted(self.tableRows):
+            numRows, seconds = self.tableRows[table]
+            print("{:,} rows into {} in {:.2f} seconds ({:,.0f} rows per second).".format(numRows, table, seconds, numRows / max(seconds, 1e-9)))
+        for statement in indexes:
+            start = time.time()
+            self.db.execute(statement)
+            print("{} took {:.2f} seconds.".format(statement, time.time() - start))
+        self.db.close()
+        print("Database {} written in {:.2f} seconds.".format(self.fileName, time.time() - self.timecheck))
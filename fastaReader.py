@@ -0,0 +1,179 @@
+'''
+Fasta Reader
+Memory-mapped fasta access shared by the proteome scripts.
+
+The first time a fasta file is opened, an index is built and saved next to it
+(fasta.idx): a line with the size and modification time of the fasta, then the
+samtools .fai columns (name, length, offset, line bases, line width) of each record.
+Later runs load the index instead of parsing the file, as long as the fasta still
+has the same size and modification time. Sequences are returned as slices of the
+mapped file: a memoryview when the record is on one line (no copy), otherwise bytes
+with the line breaks removed (one linear copy).
+
+Headers are decoded as UTF-8 (undecodable bytes replaced), sequences as latin-1 so
+that every byte is one residue.
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import os
+import sys
+import mmap
+
+
+def indexFileName(fastaFile):
+    return fastaFile + ".idx"
+
+
+def fastaStamp(fastaFile):
+    ## first line of the index; the index is rebuilt when it no longer matches
+    st = os.stat(fastaFile)
+    return "#fasta\t{}\t{}".format(st.st_size, st.st_mtime_ns)
+
+
+def decodeHeader(header):
+    return bytes(header).decode("utf-8", errors = "replace")
+
+
+def decodeSequence(seq):
+    return bytes(seq).decode("latin-1")
+
+
+class FastaFile:
+    def __init__(self, fastaFile, cacheIndex = True):
+        self.fileName = fastaFile
+        self._fh = open(fastaFile, "rb")
+        self.size = os.path.getsize(fastaFile)
+        ## mmap cannot map an empty file
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access = mmap.ACCESS_READ) if self.size > 0 else b""
+
+        indexFile = indexFileName(fastaFile)
+        stamp = fastaStamp(fastaFile)
+        if not (os.path.exists(indexFile) and self._loadIndex(indexFile, stamp)):
+            self._buildIndex()
+            if cacheIndex:
+                self._saveIndex(indexFile, stamp)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        ## (header, sequence) for each record, in file order
+        for i in range(len(self)):
+            yield self.header(i), self.sequence(i)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        ## any memoryviews returned by sequence() must be released first
+        if self.size > 0:
+            self._mm.close()
+        self._fh.close()
+
+    def _buildIndex(self):
+        mm = self._mm
+        self.names = []
+        self.lengths = []
+        self.offsets = []
+        self.lineBases = []
+        self.lineWidths = []
+
+        headerStart = mm.find(b">")
+        while headerStart != -1:
+            headerEnd = mm.find(b"\n", headerStart)
+            if headerEnd == -1:
+                headerEnd = self.size
+            bodyStart = min(headerEnd + 1, self.size)
+
+            nextHeader = mm.find(b"\n>", headerEnd)
+            bodyEnd = self.size if nextHeader == -1 else nextHeader + 1
+
+            firstLineEnd = mm.find(b"\n", bodyStart, bodyEnd)
+            if firstLineEnd == -1:
+                firstLineEnd = bodyEnd
+            firstLine = mm[bodyStart : firstLineEnd + 1]
+
+            body = mm[bodyStart : bodyEnd]
+            header = mm[headerStart + 1 : headerEnd].rstrip()
+            self.names.append(decodeHeader(header.split()[0]) if header.split() else "")
+            self.lengths.append(len(body) - body.count(b"\n") - body.count(b"\r"))
+            self.offsets.append(bodyStart)
+            self.lineBases.append(len(firstLine.rstrip()))
+            self.lineWidths.append(len(firstLine))
+
+            headerStart = -1 if nextHeader == -1 else nextHeader + 1
+
+    def _saveIndex(self, indexFile, stamp):
+        try:
+            out = open(indexFile, "w", encoding = "utf-8")
+            out.write("{}\n".format(stamp))
+            for i in range(len(self.offsets)):
+                out.write("{}\t{}\t{}\t{}\t{}\n".format(self.names[i], self.lengths[i], self.offsets[i], self.lineBases[i], self.lineWidths[i]))
+            out.close()
+        except (IOError, OSError) as e:
+            print("Warning: could not cache fasta index {} ({}).".format(indexFile, e), file = sys.stderr)
+
+    def _loadIndex(self, indexFile, stamp):
+        ## False if the index is of another version of the fasta (or unreadable)
+        self.names = []
+        self.lengths = []
+        self.offsets = []
+        self.lineBases = []
+        self.lineWidths = []
+        try:
+            with open(indexFile, "r", encoding = "utf-8") as lines:
+                if lines.readline().rstrip("\n") != stamp:
+                    return False
+                for line in lines:
+                    name, length, offset, lineBases, lineWidth = line.rstrip("\n").split("\t")
+                    self.names.append(name)
+                    self.lengths.append(int(length))
+                    self.offsets.append(int(offset))
+                    self.lineBases.append(int(lineBases))
+                    self.lineWidths.append(int(lineWidth))
+        except (IOError, OSError, ValueError) as e:
+            print("Warning: could not read fasta index {} ({}), rebuilding it.".format(indexFile, e), file = sys.stderr)
+            return False
+        return True
+
+    def _headerStart(self, i):
+        ## the header line is the line just before the sequence offset
+        return self._mm.rfind(b"\n", 0, self.offsets[i] - 1) + 1
+
+    def _bodyEnd(self, i):
+        if i + 1 < len(self.offsets):
+            return self._headerStart(i + 1)
+        return self.size
+
+    def header(self, i):
+        '''Header line of record i, without the leading ">".'''
+        start = self._headerStart(i)
+        return decodeHeader(self._mm[start + 1 : self.offsets[i]].rstrip())
+
+    def rawSequence(self, i):
+        '''Zero-copy view of record i as stored, including line breaks.'''
+        return memoryview(self._mm)[self.offsets[i] : self._bodyEnd(i)]
+
+    def sequence(self, i):
+        '''Residues of record i (memoryview or bytes).'''
+        start = self.offsets[i]
+        if self.lineBases[i] == self.lengths[i]:
+            ## whole sequence on one line
+            return memoryview(self._mm)[start : start + self.lengths[i]]
+        return self._mm[start : self._bodyEnd(i)].replace(b"\n", b"").replace(b"\r", b"")
+
+    def totalLength(self):
+        return sum(self.lengths)
+
+
+def readFasta(fastaFile):
+    '''(header, sequence) for each record of fastaFile, sequences as str.'''
+    with FastaFile(fastaFile) as fasta:
+        for i in range(len(fasta)):
+            yield fasta.header(i), decodeSequence(fasta.sequence(i))
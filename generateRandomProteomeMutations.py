@@ -4,6 +4,10 @@ Take the reference proteome and generate a random mutation list along with pepti
 
 Date: November 30, 2017
 @author: sbrown
+
+Edited October 17, 2026:
+    - Read the reference with fastaReader. The proteome length comes from the cached
+      fasta index, so the fasta is only walked once.
 '''
 
 ## Import Libraries
@@ -12,6 +16,7 @@ import argparse
 import os
 import time
 import random
+import fastaReader
 
 DEBUG = False
 VERB = False
@@ -159,10 +164,8 @@ if __name__ == "__main__":
 
     ## determine proteome length
     log_print("STATUS","Determining total proteome length...")
-    TOTAL_PROTEOME_LENGTH = 0
-    for line in open(args.reference_fasta, "r"):
-        if not line.startswith(">"):
-            TOTAL_PROTEOME_LENGTH += len(line.rstrip())
+    reference = fastaReader.FastaFile(args.reference_fasta)
+    TOTAL_PROTEOME_LENGTH = reference.totalLength()
 
 
     ## make sure that number of mutations requested < total proteome length
@@ -190,49 +193,30 @@ if __name__ == "__main__":
     MUT_IND = 0
     PEPTIDES = {8:[], 9:[], 10:[], 11:[]}
 
-    cur_prot = ""
-    prot_seq = ""
-    for line in open(args.reference_fasta, "r"):
-        line = line.rstrip()
-        if line.startswith(">"):
-            ## see if next mutation(s) position is in the cur_prot
-            while mut_positions[MUT_IND] <= PROT_IND + len(prot_seq):
-                ## it is on this line
-                MUTATIONS[MUT_IND] = processMutation(MUT_IND, PROT_IND)
-
-                ## Generate all 8-11mers
-                varPos = MUTATIONS[MUT_IND]["variant_position"] - 1 ## conver to 0-based
-                for n in [8,9,10,11]:
-                    for i in range(0,len(MUTATIONS[MUT_IND]["minimal_peptide"])+1-n):
-                        ## if mutation is within the peptide:
-                        if varPos >= i and varPos <= i+n-1:
-                            PEPTIDES[n].append(MUTATIONS[MUT_IND]["minimal_peptide"][i:i+n])
-
-                ## Move on to next mutation
-                MUT_IND += 1
-
-            cur_prot = line
-            PROT_IND += len(prot_seq)
-            prot_seq = ""
-        else:
-            prot_seq += line
-            
-
-    ## handle the last sequence (that may contain a mutation)
-    while mut_positions[MUT_IND] <= PROT_IND + len(prot_seq):
-        ## it is on this line
-        MUTATIONS[MUT_IND] = processMutation()
-
-        ## Generate all 8-11mers
-        varPos = MUTATIONS[MUT_IND]["variant_position"] - 1 ## conver to 0-based
-        for n in [8,9,10,11]:
-            for i in range(0,len(MUTATIONS[MUT_IND]["minimal_peptide"])+1-n):
-                ## if mutation is within the peptide:
-                if varPos >= i and varPos <= i+n-1:
-                    PEPTIDES[n].append(MUTATIONS[MUT_IND]["minimal_peptide"][i:i+n])
-
-        ## Move on to next mutation
-        MUT_IND += 1
+    for cur_prot, prot_seq in reference:
+        ## header without ">", sequence as str
+        cur_prot = ">" + cur_prot
+        prot_seq = fastaReader.decodeSequence(prot_seq)
+
+        ## see if next mutation(s) position is in the cur_prot
+        while mut_positions[MUT_IND] <= PROT_IND + len(prot_seq):
+            ## it is on this line
+            MUTATIONS[MUT_IND] = processMutation(MUT_IND, PROT_IND)
+
+            ## Generate all 8-11mers
+            varPos = MUTATIONS[MUT_IND]["variant_position"] - 1 ## conver to 0-based
+            for n in [8,9,10,11]:
+                for i in range(0,len(MUTATIONS[MUT_IND]["minimal_peptide"])+1-n):
+                    ## if mutation is within the peptide:
+                    if varPos >= i and varPos <= i+n-1:
+                        PEPTIDES[n].append(MUTATIONS[MUT_IND]["minimal_peptide"][i:i+n])
+
+            ## Move on to next mutation
+            MUT_IND += 1
+
+        PROT_IND += len(prot_seq)
+
+    reference.close()
 
     ## print out mutation list
     log_print("STATUS", "Writing mutation metadata...")
@@ -0,0 +1,165 @@
+'''
+IC50 Histograms
+Counts of predicted IC50s per (HLA allele, peptide length) in fine log-spaced bins, so
+the number of binders at any cutoff can be read off without reading the score files
+again. Written by tallyParsedData_multiProc.py; histograms of several runs can be merged.
+
+NetMHCpan reports IC50 to 2 decimals, so the bin edges lie halfway between 2 decimal
+values (100 per decade, rounded to 2 decimals, plus 0.005). The count at or below a
+cutoff is exact when cutoff + 0.005 is an edge: every value on the grid and every cutoff
+given when the histogram was made (50, 100 and 500 by default). Other cutoffs are
+rounded down to the nearest edge.
+
+Stored as .npz:
+    edges      float64 (E,) upper bin edges; bin i holds edges[i-1] < IC50 <= edges[i], bin E the rest
+    hlas       str (K,) allele of each row
+    lengths    int64 (K,) peptide length of each row
+    counts     int64 (K, E + 1) histogram of each row
+    scored     int64 (K,) number of peptides scored
+    complete   float64 (K,) IC50 up to which the counts are complete (lower for sparse score files)
+
+Merge histograms and count binders at any cutoffs:
+    python ic50Histograms.py singleHLAdata.tsv run1.hist.npz run2.hist.npz --cutoffs 50 500 1000
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import argparse
+import numpy as np
+
+DEBUG = False
+VERB = False
+
+DEFAULT_CUTOFFS = [50, 100, 500]
+BINS_PER_DECADE = 100
+MIN_LOG10 = -2
+MAX_LOG10 = 5
+HALF_STEP = 0.005
+
+
+def histogramEdges(cutoffs = DEFAULT_CUTOFFS):
+    '''Bin edges of the log grid plus the given cutoffs (rounded to 2 decimals).'''
+    grid = np.round(10.0 ** (np.arange(MIN_LOG10 * BINS_PER_DECADE, MAX_LOG10 * BINS_PER_DECADE + 1) / float(BINS_PER_DECADE)), 2)
+    return np.unique(np.concatenate([grid, np.round(np.asarray(cutoffs, dtype = np.float64), 2)])) + HALF_STEP
+
+
+def histogram(edges, ic50):
+    '''Histogram of 2 decimal IC50 values (float64).'''
+    return np.bincount(np.searchsorted(edges, ic50), minlength = len(edges) + 1).astype(np.int64)
+
+
+class IC50Histograms:
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype = np.float64)
+        ## (hla, length) -> [counts, scored, complete]
+        self.rows = {}
+
+    def add(self, hla, n, counts, scored, complete = np.inf):
+        key = (hla, int(n))
+        if key not in self.rows:
+            self.rows[key] = [np.zeros(len(self.edges) + 1, dtype = np.int64), 0, np.inf]
+        row = self.rows[key]
+        row[0] += counts
+        row[1] += scored
+        row[2] = min(row[2], complete)
+
+    def keys(self):
+        return sorted(self.rows)
+
+    def save(self, fileName):
+        keys = self.keys()
+        np.savez(fileName, edges = self.edges,
+                 hlas = np.array([hla for hla, n in keys], dtype = str), lengths = np.array([n for hla, n in keys], dtype = np.int64),
+                 counts = np.array([self.rows[k][0] for k in keys], dtype = np.int64).reshape(len(keys), len(self.edges) + 1),
+                 scored = np.array([self.rows[k][1] for k in keys], dtype = np.int64), complete = np.array([self.rows[k][2] for k in keys], dtype = np.float64))
+
+    @classmethod
+    def load(cls, fileName):
+        data = np.load(fileName)
+        hists = cls(data["edges"])
+        for hla, n, counts, scored, complete in zip(data["hlas"].tolist(), data["lengths"].tolist(), data["counts"], data["scored"].tolist(), data["complete"].tolist()):
+            hists.add(hla, n, counts, scored, complete)
+        return hists
+
+    def rebin(self, edges):
+        '''Copy with the given edges, which must all be edges of this histogram.'''
+        idx = np.searchsorted(self.edges, edges)
+        if np.any(idx >= len(self.edges)) or np.any(self.edges[np.minimum(idx, len(self.edges) - 1)] != edges):
+            raise ValueError("Histograms can only be rebinned to a subset of their edges.")
+        hists = IC50Histograms(edges)
+        for key in self.keys():
+            counts, scored, complete = self.rows[key]
+            ## counts at or below each new edge, then back to bins
+            cumulative = np.cumsum(counts)[idx]
+            newCounts = np.diff(np.concatenate([[0], cumulative, [counts.sum()]]))
+            hists.add(key[0], key[1], newCounts, scored, complete)
+        return hists
+
+    def merge(self, other):
+        '''Sum of two histograms, on the edges they share.'''
+        edges = np.intersect1d(self.edges, other.edges)
+        merged = self.rebin(edges)
+        otherRebinned = other.rebin(edges)
+        for key in otherRebinned.keys():
+            merged.add(key[0], key[1], *otherRebinned.rows[key])
+        return merged
+
+    def countAtOrBelow(self, hla, n, cutoff):
+        '''Number of peptides with IC50 <= cutoff (rounded down to an edge), or None if not complete that far.'''
+        row = self.rows.get((hla, int(n)))
+        if row is None:
+            return 0
+        if cutoff > row[2]:
+            return None
+        ## edges at or below cutoff + half a step
+        numEdges = np.searchsorted(self.edges, round(cutoff, 2) + HALF_STEP + 1e-9)
+        return int(row[0][:numEdges].sum())
+
+    def isExact(self, cutoff):
+        return bool(np.any(np.isclose(self.edges, round(cutoff, 2) + HALF_STEP)))
+
+
+def cutoffName(cutoff):
+    return "{:g}".format(cutoff)
+
+
+def writeCutoffTable(hists, fileName, cutoffs, lengths = range(8, 12)):
+    '''Table of binders per allele at each cutoff and length, like singleHLAdata.tsv (NA where not known).'''
+    out = open(fileName, "w")
+    out.write("hla\t{}\n".format("\t".join("co{}_{}mer".format(cutoffName(c), n) for c in cutoffs for n in lengths)))
+    for hla in sorted(set(hla for hla, n in hists.keys())):
+        counts = [hists.countAtOrBelow(hla, n, c) for c in cutoffs for n in lengths]
+        out.write("{}\t{}\n".format(hla, "\t".join("NA" if x is None else str(x) for x in counts)))
+    out.close()
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Count binders at any cutoffs from IC50 histograms")
+    parser.add_argument("outFile", help = "File to write the binders per allele to", type = str)
+    parser.add_argument("histogramFiles", nargs = "+", help = "Histogram files (.npz) from tallyParsedData_multiProc.py", type = str)
+    parser.add_argument("--cutoffs", metavar = "nM", nargs = "+", help = "IC50 cutoffs (default: 50 100 500)", type = float, default = DEFAULT_CUTOFFS)
+    parser.add_argument("--merged", metavar = "file", help = "Also save the merged histograms (.npz)", type = str, default = None)
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    hists = IC50Histograms.load(args.histogramFiles[0])
+    for fileName in args.histogramFiles[1:]:
+        hists = hists.merge(IC50Histograms.load(fileName))
+    if VERB: print("{} alleles and lengths, {} bins.".format(len(hists.keys()), len(hists.edges) + 1))
+
+    for cutoff in args.cutoffs:
+        if not hists.isExact(cutoff):
+            print("Cutoff {} is not a bin edge; counts are at the nearest edge below.".format(cutoffName(cutoff)))
+    writeCutoffTable(hists, args.outFile, args.cutoffs)
+    if args.merged:
+        hists.save(args.merged)
+    print("done.")
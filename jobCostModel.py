@@ -0,0 +1,186 @@
+'''
+Job Cost Model
+Predicted NetMHCpan run time of a job (one peptide length, one contig file) as
+intercept + secondsPerWindow * number of peptides * number of alleles, with separate
+terms per peptide length. Used by prepareJobs.py to pack contigs into jobs of similar run time.
+
+A model is stored as JSON:
+    {"lengths": {"8": {"intercept": 12.0, "secondsPerWindow": 0.0002}, ...},
+     "default": {"intercept": 10.0, "secondsPerWindow": 0.0002},
+     "alleles": {"HLA-A01-01": {"8": 0.00019, ...}, ...}}
+"alleles" is optional: the seconds per peptide of an allele at a length, used instead of
+the length's secondsPerWindow for that allele. The time of a job of several alleles is
+shared equally between them when fitting.
+
+Fit a model from the timeCharacteristics.tsv written by tallyParsedData_multiProc.py
+and the job files written by prepareJobs.py:
+    python jobCostModel.py timeCharacteristics.tsv jobs_dir model.json
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import argparse
+import os
+import json
+import numpy as np
+import fastaReader
+
+DEBUG = False
+VERB = False
+
+DEFAULT_INTERCEPT = 10.0
+DEFAULT_SECONDS_PER_WINDOW = 2e-4
+
+
+class CostModel:
+    def __init__(self, lengths = None, default = None, alleles = None):
+        ## lengths maps peptide length to {"intercept": s, "secondsPerWindow": s}
+        self.lengths = dict((int(n), dict(terms)) for n, terms in (lengths or {}).items())
+        self.default = dict(default or {"intercept": DEFAULT_INTERCEPT, "secondsPerWindow": DEFAULT_SECONDS_PER_WINDOW})
+        ## alleles maps allele (as in job names, HLA-A01-01) to {peptide length: secondsPerWindow}
+        self.alleles = dict((allele, dict((int(n), rate) for n, rate in rates.items())) for allele, rates in (alleles or {}).items())
+
+    @classmethod
+    def load(cls, fileName):
+        model = json.load(open(fileName, "r"))
+        return cls(model.get("lengths"), model.get("default"), model.get("alleles"))
+
+    def save(self, fileName):
+        out = open(fileName, "w")
+        model = {"lengths": dict((str(n), self.lengths[n]) for n in sorted(self.lengths)), "default": self.default}
+        if self.alleles:
+            model["alleles"] = dict((allele, dict((str(n), rates[n]) for n in sorted(rates))) for allele, rates in self.alleles.items())
+        json.dump(model, out, indent = 2, sort_keys = True)
+        out.write("\n")
+        out.close()
+
+    def terms(self, n):
+        return self.lengths.get(n, self.default)
+
+    def intercept(self, n):
+        return self.terms(n)["intercept"]
+
+    def windowSeconds(self, n, allele = None):
+        if allele in self.alleles and n in self.alleles[allele]:
+            return self.alleles[allele][n]
+        return self.terms(n)["secondsPerWindow"]
+
+    def jobSeconds(self, n, numWindows, numAlleles = 1, alleles = None):
+        '''Predicted seconds for numAlleles alleles (or the given alleles) over numWindows peptides of length n.'''
+        if alleles:
+            return self.intercept(n) + sum(self.windowSeconds(n, allele) for allele in alleles) * numWindows
+        return self.intercept(n) + self.windowSeconds(n) * numWindows * numAlleles
+
+
+def fitLine(windows, seconds):
+    ## least squares seconds = intercept + secondsPerWindow * windows, with neither term negative
+    windows = np.asarray(windows, dtype = np.float64)
+    seconds = np.asarray(seconds, dtype = np.float64)
+    if len(np.unique(windows)) > 1:
+        slope, intercept = np.polyfit(windows, seconds, 1)
+        if intercept >= 0 and slope > 0:
+            return float(intercept), float(slope)
+    ## through the origin
+    return 0.0, float(np.dot(windows, seconds) / max(np.dot(windows, windows), 1.0))
+
+
+def jobWindows(jobsDir, species, n, fnum):
+    ## number of peptides of a job, from its peptide order file or else its fasta
+    peptideFile = os.path.join(jobsDir, "prot{}_{}_{}_peptides.npy".format(n, fnum, species))
+    if os.path.exists(peptideFile):
+        return len(np.load(peptideFile, mmap_mode = "r"))
+    fastaFile = os.path.join(jobsDir, "prot{}_{}_{}.fa".format(n, fnum, species))
+    if os.path.exists(fastaFile):
+        with fastaReader.FastaFile(fastaFile, cacheIndex = False) as fasta:
+            return sum(max(length - n + 1, 0) for length in fasta.lengths)
+    return None
+
+
+def jobTimings(timeFile, jobsDir):
+    '''(jobname, alleles, peptide length, date, number of peptides, seconds) of each job in a
+    timeCharacteristics.tsv with job files in jobsDir.'''
+    timings = []
+    numWindows = {}
+    for line in open(timeFile, "r"):
+        line = line.rstrip("\n").split("\t")
+        if line[0] == "jobname" or len(line) < 6:
+            continue
+        species, hla, n, fnum = line[0].split("_")
+        n = int(n)
+        ## the jobs of every allele share the job files of a species, length and number
+        key = (species, n, fnum)
+        if key not in numWindows:
+            numWindows[key] = jobWindows(jobsDir, species, n, fnum)
+        if numWindows[key] is None:
+            if VERB: print("No job files for {}, skipping.".format(line[0]))
+            continue
+        timings.append((line[0], hla.split("+"), n, line[3], numWindows[key], float(line[5])))
+    return timings
+
+
+def fitAlleleRates(model, timings):
+    '''Seconds per peptide of each allele and length, after the length's intercept.'''
+    ## allele -> length -> [seconds, peptides]
+    totals = {}
+    for jobname, alleles, n, date, numWindows, seconds in timings:
+        ## the alleles of a job share its time equally
+        share = max(seconds - model.intercept(n), 0.0) / len(alleles)
+        for allele in alleles:
+            total = totals.setdefault(allele, {}).setdefault(n, [0.0, 0])
+            total[0] += share
+            total[1] += numWindows
+    return dict((allele, dict((n, seconds / peptides) for n, (seconds, peptides) in rates.items() if peptides > 0)) for allele, rates in totals.items())
+
+
+def fitCostModel(timeFile, jobsDir):
+    '''Fit per length and per allele terms from a timeCharacteristics.tsv and the job files in jobsDir.'''
+    return fitTimings(jobTimings(timeFile, jobsDir))
+
+
+def fitTimings(timings):
+    '''Fit per length and per allele terms from jobTimings().'''
+    windows = {}
+    seconds = {}
+    for jobname, alleles, n, date, numWindows, secs in timings:
+        ## a job of several alleles (HLA-A01-01+HLA-B07-02) predicts its peptides once per allele
+        windows.setdefault(n, []).append(numWindows * len(alleles))
+        seconds.setdefault(n, []).append(secs)
+
+    lengths = {}
+    for n in sorted(windows):
+        intercept, slope = fitLine(windows[n], seconds[n])
+        lengths[n] = {"intercept": intercept, "secondsPerWindow": slope, "jobs": len(windows[n])}
+        if VERB: print("{}mers: {:.2f} s + {:.3g} s per peptide, from {} jobs.".format(n, intercept, slope, len(windows[n])))
+
+    ## lengths without timings use the average of the others
+    default = None
+    if lengths:
+        default = {"intercept": float(np.mean([t["intercept"] for t in lengths.values()])), "secondsPerWindow": float(np.mean([t["secondsPerWindow"] for t in lengths.values()]))}
+    model = CostModel(lengths, default)
+    model.alleles = fitAlleleRates(model, timings)
+    return model
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Fit a job cost model")
+    parser.add_argument("timeFile", help = "timeCharacteristics.tsv from tallyParsedData_multiProc.py", type = str)
+    parser.add_argument("jobsDir", help = "Directory with the job files from prepareJobs.py", type = str)
+    parser.add_argument("modelFile", help = "JSON file to write the model to", type = str)
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    model = fitCostModel(args.timeFile, args.jobsDir)
+    model.save(args.modelFile)
+    for n in sorted(model.lengths):
+        print("{}mers: {:.2f} s + {:.3g} s per peptide ({} jobs)".format(n, model.intercept(n), model.windowSeconds(n), model.lengths[n]["jobs"]))
+    print("Seconds per peptide of {} alleles.".format(len(model.alleles)))
+    print("done.")
@@ -0,0 +1,119 @@
+'''
+Job Manifest
+One JSON line per job made by prepareJobs.py (jobs.manifest.jsonl next to scripts.sh), so
+the tally and database scripts can find each job's inputs and outputs without listing
+directories or splitting file names:
+    {"job": "HUMAN_HLA-A01-01+HLA-B07-02_8_1", "species": "HUMAN", "length": 8, "fnum": 1,
+     "hlas": ["HLA-A01-01", "HLA-B07-02"], "fasta": "prot8_1_HUMAN.fa", "fastaMd5": "...",
+     "peptides": "prot8_1_HUMAN_peptides.npy", "expected": 1608, "scoreFormat": "npy",
+     "outputs": {"HLA-A01-01": "HUMAN_HLA-A01-01+HLA-B07-02_8_1/HUMAN_HLA-A01-01_8_1.pMHC.parsed", ...}}
+
+Input files are relative to the directory of the manifest, outputs to the results
+directory (one subdirectory per job, as made by clusterTAS or runJobsLocally.py).
+
+Check the fasta files of a manifest and list the missing outputs (for prepareJobs.py --resubmit):
+    python jobManifest.py jobs_dir/jobs.manifest.jsonl results_dir/ missingOutputs.txt
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import argparse
+import os
+import json
+import hashlib
+
+DEBUG = False
+VERB = False
+
+MANIFEST = "jobs.manifest.jsonl"
+
+
+def manifestFileName(directory):
+    return os.path.join(directory, MANIFEST)
+
+
+def isManifest(fileName):
+    ## a manifest starts with a JSON object, scripts.sh with a job name
+    with open(fileName, "r") as f:
+        return f.read(1) == "{"
+
+
+def fileChecksum(fileName):
+    md5 = hashlib.md5()
+    with open(fileName, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def jobOutputs(jobname):
+    '''Output of each allele of a job named like HUMAN_HLA-A01-01+HLA-B07-02_8_1, relative to the results directory.'''
+    species, hla, n, fnum = jobname.split("_")
+    return dict((h, "{}/{}_{}_{}_{}.pMHC.parsed".format(jobname, species, h, n, fnum)) for h in hla.split("+"))
+
+
+def jobRecord(jobname, fastaFile, fastaMd5, peptideFile, expected, scoreFormat):
+    '''Manifest line of a job named like HUMAN_HLA-A01-01+HLA-B07-02_8_1.'''
+    species, hla, n, fnum = jobname.split("_")
+    hlas = hla.split("+")
+    return {"job": jobname, "species": species, "length": int(n), "fnum": int(fnum), "hlas": hlas,
+            "fasta": os.path.basename(fastaFile), "fastaMd5": fastaMd5,
+            "peptides": os.path.basename(peptideFile), "expected": expected, "scoreFormat": scoreFormat,
+            "outputs": jobOutputs(jobname)}
+
+
+def writeManifest(fileName, records):
+    out = open(fileName, "w")
+    for record in records:
+        out.write(json.dumps(record, sort_keys = True))
+        out.write("\n")
+    out.close()
+
+
+def readManifest(fileName):
+    return [json.loads(line) for line in open(fileName, "r") if line.strip()]
+
+
+def inputPath(manifestFile, record, key):
+    ## path of an input file ("fasta" or "peptides") of a job
+    return os.path.join(os.path.dirname(os.path.abspath(manifestFile)), record[key])
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Check the jobs of a job manifest")
+    parser.add_argument("manifestFile", help = "jobs.manifest.jsonl from prepareJobs.py", type = str)
+    parser.add_argument("resultsDir", help = "Directory with the job results", type = str)
+    parser.add_argument("missingFile", help = "File to write the missing outputs to", type = str)
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    records = readManifest(args.manifestFile)
+    changed = 0
+    checked = set()
+    missing = []
+    for record in records:
+        fastaFile = inputPath(args.manifestFile, record, "fasta")
+        if fastaFile not in checked:
+            checked.add(fastaFile)
+            if not os.path.exists(fastaFile) or fileChecksum(fastaFile) != record["fastaMd5"]:
+                print("{} is missing or has changed since the jobs were made.".format(fastaFile))
+                changed += 1
+        for h in record["hlas"]:
+            if not os.path.exists(os.path.join(args.resultsDir, record["outputs"][h])):
+                missing.append(record["outputs"][h])
+
+    out = open(args.missingFile, "w")
+    for output in missing:
+        out.write("{}\n".format(output))
+    out.close()
+    print("{:,} jobs, {:,} changed fasta files, {:,} missing outputs.".format(len(records), changed, len(missing)))
+    print("done.")
@@ -0,0 +1,131 @@
+'''
+Job Runtime Analytics
+Summarises the timeCharacteristics.tsv written by tallyParsedData_multiProc.py: fits the
+seconds per predicted peptide of each allele and peptide length, and flags the days (and
+hosts, from runJobsLocally.py journals) on which jobs ran slower than the fit predicts.
+
+Writes the fitted model (a jobCostModel.py model with per allele terms, for
+prepareJobs.py --costModel) and a report with one row per length, allele and length,
+day and host:
+    kind      length, allele, day or host
+    name      e.g. 9, HLA-A01-01_9, 2026-10-17, node12
+    jobs      number of timed jobs
+    seconds   total run time of the jobs
+    secondsPerWindow  fitted seconds per peptide (length and allele rows)
+    relative  allele rows: seconds per peptide / the length's; day and host rows: median of
+              run time / predicted run time, over the median of all jobs
+    slow      yes if relative >= --slowFactor (day and host rows with at least --minJobs jobs)
+
+    python jobRuntimeAnalytics.py timeCharacteristics.tsv jobs_dir/ costModel.json runtimeReport.tsv --journal results_dir/runJobsLocally.journal.tsv
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import sys
+import argparse
+import numpy as np
+import jobCostModel
+
+DEBUG = False
+VERB = False
+
+
+def readHosts(journalFiles):
+    ## host of each job run by runJobsLocally.py (the last run in the journals)
+    hosts = {}
+    for journalFile in journalFiles:
+        for line in open(journalFile, "r"):
+            line = line.rstrip("\n").split("\t")
+            if line[0] != "jobname" and len(line) >= 6:
+                hosts[line[0]] = line[5]
+    return hosts
+
+
+def groupRatios(ratios, keys):
+    ## ratios of each key's jobs
+    groups = {}
+    for ratio, key in zip(ratios, keys):
+        if key is not None and np.isfinite(ratio):
+            groups.setdefault(key, []).append(ratio)
+    return groups
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Fit job run times per allele and length and flag slow days and hosts")
+    parser.add_argument("timeFile", help = "timeCharacteristics.tsv from tallyParsedData_multiProc.py", type = str)
+    parser.add_argument("jobsDir", help = "Directory with the job files from prepareJobs.py", type = str)
+    parser.add_argument("modelFile", help = "JSON file to write the model to (for prepareJobs.py --costModel)", type = str)
+    parser.add_argument("reportFile", help = "File to write the report to", type = str)
+    parser.add_argument("--journal", metavar = "file", nargs = "+", help = "runJobsLocally.py journals, for the host of each job", type = str, default = [])
+    parser.add_argument("--slowFactor", metavar = "x", help = "Flag days and hosts whose jobs take this many times the usual time (default: 1.5)", type = float, default = 1.5)
+    parser.add_argument("--minJobs", metavar = "N", help = "Only flag days and hosts with at least this many jobs (default: 10)", type = int, default = 10)
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+    jobCostModel.VERB = VERB
+
+    timings = jobCostModel.jobTimings(args.timeFile, args.jobsDir)
+    if not timings:
+        print("No timed jobs with job files in {}.".format(args.jobsDir))
+        sys.exit(1)
+    model = jobCostModel.fitTimings(timings)
+    model.save(args.modelFile)
+    print("Fitted {} lengths and {} alleles from {:,} jobs.".format(len(model.lengths), len(model.alleles), len(timings)))
+
+    ## run time over predicted run time of each job, relative to the median job
+    predicted = np.array([model.jobSeconds(n, numWindows, alleles = alleles) for jobname, alleles, n, date, numWindows, seconds in timings])
+    seconds = np.array([seconds for jobname, alleles, n, date, numWindows, seconds in timings])
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        ratios = np.where(predicted > 0, seconds / predicted, np.nan)
+    if np.any(np.isfinite(ratios)) and np.nanmedian(ratios) > 0:
+        ratios = ratios / np.nanmedian(ratios)
+
+    hosts = readHosts(args.journal)
+    if args.journal and VERB: print("Hosts of {:,} of {:,} jobs from the journals.".format(sum(1 for t in timings if t[0] in hosts), len(timings)))
+
+    out = open(args.reportFile, "w")
+    out.write("kind\tname\tjobs\tseconds\tsecondsPerWindow\trelative\tslow\n")
+
+    for n in sorted(model.lengths):
+        jobs = [t for t in timings if t[2] == n]
+        out.write("length\t{}\t{}\t{:.2f}\t{:.6g}\tNA\tNA\n".format(n, len(jobs), sum(t[5] for t in jobs), model.windowSeconds(n)))
+
+    ## jobs and seconds of each allele and length (the job's time shared between its alleles)
+    alleleJobs = {}
+    for jobname, alleles, n, date, numWindows, secs in timings:
+        for allele in alleles:
+            total = alleleJobs.setdefault((allele, n), [0, 0.0])
+            total[0] += 1
+            total[1] += secs / len(alleles)
+    for allele, n in sorted(alleleJobs):
+        rate = model.windowSeconds(n, allele)
+        relative = rate / model.windowSeconds(n) if model.windowSeconds(n) > 0 else np.nan
+        out.write("allele\t{}_{}\t{}\t{:.2f}\t{:.6g}\t{:.3f}\tNA\n".format(allele, n, alleleJobs[(allele, n)][0], alleleJobs[(allele, n)][1], rate, relative))
+
+    slow = []
+    for kind, keys in (("day", [t[3] for t in timings]), ("host", [hosts.get(t[0]) for t in timings])):
+        groups = groupRatios(ratios, keys)
+        totals = {}
+        for key, secs in zip(keys, seconds):
+            totals[key] = totals.get(key, 0.0) + secs
+        for key in sorted(groups):
+            relative = float(np.median(groups[key]))
+            isSlow = len(groups[key]) >= args.minJobs and relative >= args.slowFactor
+            if isSlow:
+                slow.append((kind, key, len(groups[key]), relative))
+            out.write("{}\t{}\t{}\t{:.2f}\tNA\t{:.3f}\t{}\n".format(kind, key, len(groups[key]), totals[key], relative, "yes" if isSlow else "no"))
+    out.close()
+
+    for kind, key, numJobs, relative in slow:
+        print("Slow {} {}: {:,} jobs took {:.2f} times the usual time.".format(kind, key, numJobs, relative))
+    if not slow:
+        print("No slow days or hosts.")
+    print("done.")
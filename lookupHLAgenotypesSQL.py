@@ -4,6 +4,13 @@ Using multiprocessing, query database to get sets of peptides presented by rando
 
 Date: February 3, 2017
 @author: sbrown
+
+Edited October 17, 2026:
+    - Genotypes are looked up with workerPool.py (one shared queue, results written in
+      the order of the genotype file).
+    - Checks the schema version of the database (1 or 2, see binderDatabase.py), and warns
+      when a version 1 database has no binder_hla_ind index. The query is the same for both;
+      in version 2 it is answered from the (hla_id, pep_id) primary key.
 '''
 
 ## Import Libraries
@@ -12,23 +19,26 @@ import argparse
 import os
 import sqlite3
 import time
-import multiprocessing as mp
+import traceback
+import workerPool
+import binderDatabase
 
 DEBUG = False
 VERB = False
 
 maxBufferSize = 100
 
-SENTINEL = None
+## per process: database connection and HLA ids
+db = None
+hlaID = {}
 
 
-def lookupGenotype(dbp, q, out_q, i):
-    resHolder = []
-    numInHolder = 0
+def openDatabase(dbp, debug, verb):
+    global db, DEBUG, VERB
+    DEBUG = debug
+    VERB = verb
 
     ## get HLA ids
-    if VERB: print("Getting HLA ids in slave {}...".format(i+1))
-    hlaID = {}
     db = sqlite3.connect(dbp)
     res = db.execute("SELECT * FROM hla")
     for hid, allele in res:
@@ -37,47 +47,31 @@ def lookupGenotype(dbp, q, out_q, i):
     ## Allows return of non-tuples:
     db.row_factory = lambda cursor, row: row[0]
 
-    ## Process genotype queue
-    if VERB: print("Processing queue in slave {}...".format(i+1))
-    while True:
-        hla_geno_list = q.get()
-        if hla_geno_list is SENTINEL:
-            break
-        sid, a1, a2, b1, b2, c1, c2 = hla_geno_list
 
-        genotype = "{}_{}_{}_{}_{}_{}".format(a1, a2, b1, b2, c1, c2)
+def lookupGenotype(hla_geno_list):
+    sid, a1, a2, b1, b2, c1, c2 = hla_geno_list
 
-        if DEBUG: print("Looking up genotype {}...".format(genotype))
+    genotype = "{}_{}_{}_{}_{}_{}".format(a1, a2, b1, b2, c1, c2)
 
-        ## only add to set if HLA does not end in "N"
-        hlas = set()
-        for h in [a1, a2, b1, b2, c1, c2]:
-            if not h.endswith("N"):
-                hlas.add(hlaID[h])
+    if DEBUG: print("Looking up genotype {}...".format(genotype))
 
-        #hlas = set([hlaID[a1], hlaID[a2], hlaID[b1], hlaID[b2], hlaID[c1], hlaID[c2]])
+    ## only add to set if HLA does not end in "N"
+    hlas = set()
+    for h in [a1, a2, b1, b2, c1, c2]:
+        if not h.endswith("N"):
+            hlas.add(hlaID[h])
 
-        hlaqry = "({})".format(",".join([str(x) for x in hlas]))
+    #hlas = set([hlaID[a1], hlaID[a2], hlaID[b1], hlaID[b2], hlaID[c1], hlaID[c2]])
 
-        ## Test using sqlite DISTINCT vs. pulling all and doing set()
-        numPepBind = len(set(db.execute("SELECT pep_id FROM binders WHERE hla_id IN {}".format(hlaqry)).fetchall()))
-        ## this is slower:
-        #setOfBindingPeps = db.execute("SELECT DISTINCT(pep_id) FROM binders WHERE hla_id IN {}".format(hlaqry)).fetchall()
+    hlaqry = "({})".format(",".join([str(x) for x in hlas]))
 
-        #resHolder.append([sid, genotype, numPepBind])
-        resHolder.append([sid, numPepBind])
-        numInHolder += 1
-        if numInHolder == maxBufferSize:
-            out_q.put(resHolder)
-            resHolder = []
-            numInHolder = 0
-    out_q.put(resHolder)
-    resHolder = []
-    numInHolder = 0
+    ## Test using sqlite DISTINCT vs. pulling all and doing set()
+    numPepBind = len(set(db.execute("SELECT pep_id FROM binders WHERE hla_id IN {}".format(hlaqry)).fetchall()))
+    ## this is slower:
+    #setOfBindingPeps = db.execute("SELECT DISTINCT(pep_id) FROM binders WHERE hla_id IN {}".format(hlaqry)).fetchall()
 
-    db.close()
-
-    print("\nGenotype lookup complete in slave {}...".format(i+1))
+    #return [sid, genotype, numPepBind]
+    return [sid, numPepBind]
 
 
 if __name__ == "__main__":
@@ -102,6 +96,13 @@ if __name__ == "__main__":
 
     hlaID = {}
     db = sqlite3.connect(args.database_file)
+    version = binderDatabase.schemaVersion(db)
+    if version not in binderDatabase.SCHEMA_VERSIONS:
+        print("{} has schema version {}, which this script does not know.".format(args.database_file, version))
+        sys.exit(1)
+    if version == 1 and db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = 'binder_hla_ind'").fetchone()[0] == 0:
+        print("Warning: {} has no binder_hla_ind index, so every lookup reads all binders.".format(args.database_file))
+    if VERB: print("Database schema version {}.".format(version))
     res = db.execute("SELECT * FROM hla")
     for hid, allele in res:
         hlaID[allele] = hid
@@ -136,63 +137,17 @@ if __name__ == "__main__":
 
     print("Took {:.2f} seconds...".format(time.time() - timecheck))
 
-    ## Spin up processes.
-    print("Making genotype processing slaves...")
+    ## Look up genotypes with a pool of processes.
+    print("Looking up genotypes...")
 
     try:
-        ## Make output queue
-        out_qs = []
-
-        ## Start processes.
-        procs = []
-        pqs = []
-        for i in range(args.maxNumberProcesses):
-            ## make queue to hold output
-            oq = mp.Queue()
-            ## make queue to hold genotypes to process
-            q = mp.Queue()
-            ## make process to process genotype
-            p = mp.Process(target=lookupGenotype, args=(args.database_file, q, oq, i+1))
-            ## add process to list of processes.
-            procs.append(p)
-            ## start the process
-            p.start()
-            ## add queue to list of queues.
-            pqs.append(q)
-            out_qs.append(oq)
-
-        ## Build genotypes and send to queues
-        print("Submitting genotypes...")
-        timecheck = time.time()
-
-        proc_ind = 0
-        geno_num = 0
-        
-        while geno_num < len(geno):
-            if geno_num % 100 == 0:
-                print("{:,} genotypes submitted to slaves...".format(geno_num), end="\r")
-
-            sid = geno[geno_num][0]
-            a1, a2, b1, b2, c1, c2 = geno[geno_num][1].split("_")
-
-            ## add this genotype to a queue.
-            pqs[proc_ind].put([sid,a1,a2,b1,b2,c1,c2])
-            ## rotate through to next proc
-            proc_ind += 1
-            if proc_ind >= args.maxNumberProcesses:
-                proc_ind = 0
-
-            geno_num += 1
-
-        ## done all genotypes, now send the end value
-        for pq in pqs:
-            pq.put(SENTINEL)
-
-        print("\nTook {:.2f} seconds...".format(time.time() - timecheck))
-
-
-        print("All genotypes submitted, beginning to write in {:,} line blocks...".format(maxBufferSize))
+        ## Build genotypes
+        tasks = []
+        for sid, gt in geno:
+            a1, a2, b1, b2, c1, c2 = gt.split("_")
+            tasks.append([sid,a1,a2,b1,b2,c1,c2])
 
+        print("Writing in {:,} line blocks...".format(maxBufferSize))
 
         timecheck = time.time()
         out = open(args.outFile, "w")
@@ -200,62 +155,29 @@ if __name__ == "__main__":
         out.write("sample\tnumBinders\n")
 
         resultBuffer = []
-        #numInBuffer = 0
-        numBlocks = 0
-        blockTime = time.time()
-
-
-        numGeno = 0
-        proc_ind = 0
-        while numGeno < len(geno):
-            ## cycle through output queues and slurp results
-            if not out_qs[proc_ind].empty():
-                res = out_qs[proc_ind].get()
-                for trip in res:
-                    resultBuffer.append("\t".join(map(str,trip)))
-                    #numInBuffer += 1
-                    numGeno += 1
-
-            proc_ind += 1
-            if proc_ind >= args.maxNumberProcesses:
-                proc_ind = 0
-
-
-            if len(resultBuffer) > 0:
-                numBlocks += 1
-                print("\nBlock {} took {:.2f} seconds...writing...".format(numBlocks, time.time() - blockTime))
-                print("{} genotypes written.".format(numGeno))
+
+        for trip in workerPool.runTasks(lookupGenotype, tasks, args.maxNumberProcesses, initializer = openDatabase, initargs = (args.database_file, DEBUG, VERB), ordered = True, label = "genotypes"):
+            resultBuffer.append("\t".join(map(str,trip)))
+
+            if len(resultBuffer) >= maxBufferSize:
                 out.write("\n".join(resultBuffer))
                 out.write("\n")
                 resultBuffer = []
-                #numInBuffer = 0
-                blockTime = time.time()
 
         if len(resultBuffer) > 0:
-            print("\nWriting final block...")
+            print("Writing final block...")
             out.write("\n".join(resultBuffer))
             out.write("\n")
-            out.close()
+        out.close()
 
         print("Took {:.2f} seconds...".format(time.time() - timecheck))
 
-        ## make sure all procs have finished.
-        print("Making sure all genotype slaves have shutdown...")
-        for p in procs:
-            p.join()
-
 
     except KeyboardInterrupt:
         print("Keyboard Interruption: ".format(sys.exc_info()[0]))
         print(traceback.format_exc())
-        print("Please wait while processes close...")
-        for q in pqs:
-            while not q.empty():
-                foo = q.get()
-            q.put(SENTINEL)
-        for p in procs:
-            p.join()
-
-        sys.exit()
+        print("Processes stopped.")
+
+        sys.exit(1)
 
     print("done.")
\ No newline at end of file
@@ -4,11 +4,26 @@ Join together all unique n-mers with n-1 overlaps. Increases protein length to b
 
 Date: August 23, 2016
 @author: sbrown
+
+Edited October 17, 2026:
+    - Iterative assembler on packed integer (n-1)-mers. Contigs are chains of n-mer
+      indices and are only turned into strings when written. The recursion limit no
+      longer applies, and output is identical to the recursive string version.
+    - --strategy eulerian: fewest possible contigs from a minimum path cover of the
+      (n-1)-mer de Bruijn graph, with an estimate of the NetMHCpan time saved over greedy.
+    - --processes: the overlap graph is split into connected components, which are packed
+      into one batch per process and assembled in parallel. The contigs written are checked
+      against the input and a verification report is saved next to the output.
 '''
 
 ## Import Libraries
 import sys
 import argparse
+import array
+import heapq
+import multiprocessing as mp
+import numpy as np
+import packedNmers
 
 DEBUG = False
 VERB = False
@@ -16,67 +31,368 @@ VERB = False
 
 
 
+## n-mers are packed integers (packedNmers) and are referred to by their index in the input.
+## A contig is a chain of n-mer indices: nextNmer[i] is the n-mer after i (or -1), and
+## contigTail[head] is the last n-mer of the contig starting at head. The (n-1)-mer keys
+## are key >> 5 (N-terminal) and key & suffixMask (C-terminal).
+##
+## ntermDict maps an N-terminal (n-1)-mer to the head of the contig(s) starting with it and
+## ctermDict maps a C-terminal (n-1)-mer to the head of the contig(s) ending with it. A value
+## is a single head, or a list of heads in the order they were added.
+
 ## For pseudocode, assuming 8mers
 
 ## for each 8mer:
     ## findMateOrAdd(8mer)
 
 ## def findMateOrAdd(8mer):
-    ## if nterm7mer in ctermDict:
-        ## seq = ctermDict[7mer] + 8mer[7:]
-        ## remove ctermDict[7mer] and ntermDict[shifted7mer]
-        ## recurse on seq
-    ## else if cterm7mer in ntermDict:
-        ## seq = 8mer[:1] + ntermDict[7mer]
-        ## remove ntermDict[7mer] and ctermDict[shifted7mer]
-        ## recurse on seq
-    ## else
-        ## ntermDict[nterm7mer] = 8mer[7:]
-        ## ctermDict[cterm7mer] = 8mer[:1]
-
-def findMateOrAdd(seq):
-    ntermMer = seq[:n-1]
-    ntermRemain = seq[n-1:]
-    ctermMer = seq[len(seq)-n+1:]
-    ctermRemain = seq[:len(seq)-n+1]
-    
-    if ntermMer in ctermDict:
-        ## join the sequence
-        joinSeq = ctermDict[ntermMer][0] + ntermMer + ntermRemain
-        ## get the seq of the joining partner
-        joinPair = ctermDict[ntermMer][0] + ntermMer
-        ## remove the partner from dictionaries
-        del ctermDict[ntermMer][0]
-        if len(ctermDict[ntermMer]) == 0:
-            del ctermDict[ntermMer]
-        ntermDict[joinPair[:n-1]].remove(joinPair[n-1:])
-        if len(ntermDict[joinPair[:n-1]]) == 0:
-            del ntermDict[joinPair[:n-1]]
-        ## recurse on joined sequence
-        findMateOrAdd(joinSeq)
-    elif ctermMer in ntermDict:
-        ## join the sequence
-        joinSeq = ctermRemain + ctermMer + ntermDict[ctermMer][0]
-        ## get the seq of the joining partner
-        joinPair = ctermMer + ntermDict[ctermMer][0]
-        ## remove the partner from dictionaries
-        del ntermDict[ctermMer][0]
-        if len(ntermDict[ctermMer]) == 0:
-            del ntermDict[ctermMer]
-        ctermDict[joinPair[len(joinPair)-n+1:]].remove(joinPair[:len(joinPair)-n+1])
-        if len(ctermDict[joinPair[len(joinPair)-n+1:]]) == 0:
-            del ctermDict[joinPair[len(joinPair)-n+1:]]
-        ## recurse on joined sequence
-        findMateOrAdd(joinSeq)
+    ## repeat:
+        ## if nterm7mer in ctermDict:
+            ## seq = ctermDict[7mer] + 8mer[7:]
+            ## remove ctermDict[7mer] and ntermDict[shifted7mer]
+        ## else if cterm7mer in ntermDict:
+            ## seq = 8mer[:1] + ntermDict[7mer]
+            ## remove ntermDict[7mer] and ctermDict[shifted7mer]
+        ## else
+            ## ntermDict[nterm7mer] = 8mer[7:]
+            ## ctermDict[cterm7mer] = 8mer[:1]
+            ## stop
+
+def addHead(d, key, head):
+    cur = d.get(key)
+    if cur is None:
+        d[key] = head
+    elif type(cur) is list:
+        cur.append(head)
     else:
-        ## add seq to dictionaries
-        ## there might already be the ntermMer in the ntermDict...
-        if ntermMer not in ntermDict:
-            ntermDict[ntermMer] = []
-        ntermDict[ntermMer].append(ntermRemain)
-        if ctermMer not in ctermDict:
-            ctermDict[ctermMer] = []
-        ctermDict[ctermMer].append(ctermRemain)
+        d[key] = [cur, head]
+
+def firstHead(d, key):
+    cur = d[key]
+    return cur[0] if type(cur) is list else cur
+
+def removeFirstHead(d, key):
+    cur = d[key]
+    if type(cur) is list:
+        del cur[0]
+        if len(cur) == 1:
+            d[key] = cur[0]
+    else:
+        del d[key]
+
+def removeHead(d, key, head):
+    cur = d[key]
+    if type(cur) is list:
+        cur.remove(head)
+        if len(cur) == 1:
+            d[key] = cur[0]
+    else:
+        del d[key]
+
+def iterHeads(d):
+    ## contig heads in the order the dictionary holds them
+    for cur in d.values():
+        if type(cur) is list:
+            for head in cur:
+                yield head
+        else:
+            yield cur
+
+
+def findMateOrAdd(i, key):
+    ## join n-mer i onto existing contigs for as long as one matches, then store the result
+    head = i
+    tail = i
+    ntermMer = key >> BITS
+    ctermMer = key & suffixMask
+
+    while True:
+        if ntermMer in ctermDict:
+            ## join the partner on the N-terminal side
+            partner = firstHead(ctermDict, ntermMer)
+            removeFirstHead(ctermDict, ntermMer)
+            partnerNterm = nmerKeys[partner] >> BITS
+            removeHead(ntermDict, partnerNterm, partner)
+            nextNmer[contigTail[partner]] = head
+            head = partner
+            ntermMer = partnerNterm
+        elif ctermMer in ntermDict:
+            ## join the partner on the C-terminal side
+            partner = firstHead(ntermDict, ctermMer)
+            removeFirstHead(ntermDict, ctermMer)
+            partnerTail = contigTail[partner]
+            partnerCterm = nmerKeys[partnerTail] & suffixMask
+            removeHead(ctermDict, partnerCterm, partner)
+            nextNmer[tail] = partner
+            tail = partnerTail
+            ctermMer = partnerCterm
+        else:
+            ## add seq to dictionaries
+            contigTail[head] = tail
+            addHead(ntermDict, ntermMer, head)
+            addHead(ctermDict, ctermMer, head)
+            break
+
+
+def assembleGreedy(keys, n):
+    ## greedy joining in input order; returns the contig heads and the n-mer chains
+    global BITS, suffixMask, nmerKeys, nextNmer, contigTail, ntermDict, ctermDict
+    BITS = packedNmers.BITS_PER_RESIDUE
+    suffixMask = (1 << (BITS * (n - 1))) - 1
+
+    ntermDict = {}
+    ctermDict = {}
+
+    ## array elements come back as python ints, which are much faster dictionary keys than numpy scalars
+    nmerKeys = array.array("Q", np.asarray(keys, dtype = np.uint64).tobytes())
+    indexType = "i" if len(nmerKeys) < 2 ** 31 else "q"
+    nextNmer = array.array(indexType, [-1]) * len(nmerKeys)
+    contigTail = array.array(indexType, [-1]) * len(nmerKeys)
+
+    for i, key in enumerate(nmerKeys):
+        findMateOrAdd(i, key)
+
+    heads = list(iterHeads(ntermDict))
+    chains = nextNmer
+    ntermDict = ctermDict = nmerKeys = nextNmer = contigTail = None
+    return heads, chains
+
+
+## The de Bruijn graph has a node per (n-1)-mer and an edge per n-mer (N-terminal to
+## C-terminal (n-1)-mer). A contig is a trail through it, so the fewest contigs that use every
+## n-mer exactly once is a minimum trail cover. A virtual node gets an edge to every node with
+## more outgoing than incoming edges and from every node with more incoming edges (once per
+## unit of imbalance). Every node is then balanced, so an Eulerian circuit from the virtual
+## node, cut at its virtual edges, gives one trail per unit of imbalance. Components that were
+## already balanced are not reached from the virtual node and each become one circuit.
+
+def assembleEulerian(keys, n):
+    ## minimum trail cover of the de Bruijn graph; returns the contig heads and the n-mer chains
+    keys = np.asarray(keys, dtype = np.uint64)
+    numNmers = len(keys)
+    suffixMask = np.uint64((1 << (packedNmers.BITS_PER_RESIDUE * (n - 1))) - 1)
+    nodeKeys, nodes = np.unique(np.concatenate((keys >> packedNmers.SHIFT, keys & suffixMask)), return_inverse = True)
+    numNodes = len(nodeKeys)
+    src = nodes[:numNmers]
+    dst = nodes[numNmers:]
+    nodeKeys = nodes = None
+
+    imbalance = np.bincount(src, minlength = numNodes) - np.bincount(dst, minlength = numNodes)
+    virtual = numNodes
+    starts = np.repeat(np.arange(numNodes), np.maximum(imbalance, 0))
+    ends = np.repeat(np.arange(numNodes), np.maximum(-imbalance, 0))
+    allSrc = np.concatenate((src, np.full(len(starts), virtual, dtype = src.dtype), ends))
+    allDst = np.concatenate((dst, starts, np.full(len(ends), virtual, dtype = dst.dtype)))
+
+    ## out-edges of node v are outEdges[firstOut[v]:firstOut[v + 1]]
+    outEdges = np.argsort(allSrc, kind = "mergesort")
+    firstOut = np.searchsorted(allSrc[outEdges], np.arange(numNodes + 2)).tolist()
+    outEdges = outEdges.tolist()
+    allDst = allDst.tolist()
+    nextOut = firstOut[:]
+
+    indexType = "i" if numNmers < 2 ** 31 else "q"
+    chains = array.array(indexType, [-1]) * numNmers
+    heads = []
+
+    def walkCircuit(start):
+        ## Hierholzer's algorithm, iterative; returns the edges of the circuit in order
+        nodeStack = [start]
+        edgeStack = [-1]
+        circuit = []
+        while nodeStack:
+            v = nodeStack[-1]
+            if nextOut[v] < firstOut[v + 1]:
+                e = outEdges[nextOut[v]]
+                nextOut[v] += 1
+                nodeStack.append(allDst[e])
+                edgeStack.append(e)
+            else:
+                nodeStack.pop()
+                e = edgeStack.pop()
+                if e != -1:
+                    circuit.append(e)
+        circuit.reverse()
+        return circuit
+
+    def addTrails(circuit):
+        ## cut the circuit at virtual edges and chain the n-mers of each piece
+        prev = -1
+        for e in circuit:
+            if e >= numNmers:
+                prev = -1
+            else:
+                if prev == -1:
+                    heads.append(e)
+                else:
+                    chains[prev] = e
+                prev = e
+
+    if len(starts) > 0:
+        addTrails(walkCircuit(virtual))
+    for v in range(numNodes):
+        if nextOut[v] < firstOut[v + 1]:
+            addTrails(walkCircuit(v))
+
+    return heads, chains
+
+
+def reportSavings(numNmers, numGreedyContigs, numContigs, n):
+    ## every n-mer is predicted once either way; the savings are the per-sequence costs
+    ## (overhead and n-1 residues that start no window) of the contigs no longer needed
+    numAlleles = sum(1 for line in open(args.hlaAlleleList, "r") if line.strip()) if args.hlaAlleleList else 1
+    greedyResidues = numNmers + (n - 1) * numGreedyContigs
+    residues = numNmers + (n - 1) * numContigs
+    greedySeconds = (numNmers * args.secondsPerWindow + numGreedyContigs * args.secondsPerSequence) * numAlleles
+    seconds = (numNmers * args.secondsPerWindow + numContigs * args.secondsPerSequence) * numAlleles
+
+    print("Greedy joining gives {} sequences ({} residues); eulerian gives {} ({} residues).".format(numGreedyContigs, greedyResidues, numContigs, residues))
+    if greedyResidues > 0:
+        print("{} fewer sequences and {} fewer residues ({:.2f}%) per allele.".format(numGreedyContigs - numContigs, greedyResidues - residues, 100.0 * (greedyResidues - residues) / greedyResidues))
+    if greedySeconds > 0:
+        print("Estimated NetMHCpan time over {} allele(s): {:.1f} CPU hours greedy, {:.1f} eulerian, saving {:.1f} hours ({:.2f}%).".format(numAlleles, greedySeconds / 3600, seconds / 3600, (greedySeconds - seconds) / 3600, 100.0 * (greedySeconds - seconds) / greedySeconds))
+
+
+## No n-mer overlaps an n-mer of another connected component of the (n-1)-mer overlap graph,
+## so each component can be assembled on its own and the contigs simply concatenated.
+
+def nmerComponents(keys, n):
+    ## component label of each n-mer, by hooking roots together and pointer jumping
+    suffixMask = np.uint64((1 << (packedNmers.BITS_PER_RESIDUE * (n - 1))) - 1)
+    numNmers = len(keys)
+    _, nodes = np.unique(np.concatenate((keys >> packedNmers.SHIFT, keys & suffixMask)), return_inverse = True)
+    src = nodes[:numNmers]
+    dst = nodes[numNmers:]
+    parent = np.arange(nodes.max() + 1 if len(nodes) > 0 else 0)
+    nodes = None
+
+    while True:
+        rootSrc = parent[src]
+        rootDst = parent[dst]
+        differ = rootSrc != rootDst
+        if not differ.any():
+            break
+        ## hook the larger root of each edge onto the smaller one
+        np.minimum.at(parent, np.maximum(rootSrc[differ], rootDst[differ]), np.minimum(rootSrc[differ], rootDst[differ]))
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+    return parent[src]
+
+
+def packComponents(components, numBins):
+    ## longest processing time first: largest component onto the least loaded bin
+    ## returns the n-mer indices of each bin, in input order, and the bin sizes
+    labels, inverse, sizes = np.unique(components, return_inverse = True, return_counts = True)
+    binOfLabel = np.zeros(len(labels), dtype = np.int64)
+    loads = [(0, b) for b in range(numBins)]
+    for c in np.argsort(-sizes, kind = "mergesort").tolist():
+        load, b = heapq.heappop(loads)
+        binOfLabel[c] = b
+        heapq.heappush(loads, (load + int(sizes[c]), b))
+
+    binOfNmer = binOfLabel[inverse]
+    order = np.argsort(binOfNmer, kind = "mergesort")
+    binSizes = np.bincount(binOfNmer, minlength = numBins)
+    return np.split(order, np.cumsum(binSizes)[:-1]), binSizes, len(labels), int(sizes.max()) if len(sizes) > 0 else 0
+
+
+def assemblePart(task):
+    ## worker: assemble one bin of components
+    keys, n, strategy = task
+    if strategy == "eulerian":
+        heads, chains = assembleEulerian(keys, n)
+    else:
+        heads, chains = assembleGreedy(keys, n)
+    return np.asarray(heads, dtype = np.int64), np.asarray(chains, dtype = np.int64)
+
+
+def assembleParallel(keys, n, strategy, numProcesses):
+    ## returns the contig heads (in input order) and the n-mer chains, indexed as in keys
+    components = nmerComponents(keys, n)
+    bins, binSizes, numComponents, largest = packComponents(components, numProcesses)
+    components = None
+    print("{} connected components (largest has {} n-mers), packed into {} batches of {} to {} n-mers.".format(numComponents, largest, numProcesses, binSizes.min(), binSizes.max()))
+
+    chains = np.full(len(keys), -1, dtype = np.int64)
+    heads = []
+    pool = mp.Pool(numProcesses)
+    for idx, (partHeads, partChains) in zip(bins, pool.imap(assemblePart, [(keys[idx], n, strategy) for idx in bins])):
+        ## map the batch's local indices back to input indices
+        linked = partChains != -1
+        chains[idx[linked]] = idx[partChains[linked]]
+        heads.append(idx[partHeads])
+    pool.close()
+    pool.join()
+
+    heads = np.sort(np.concatenate(heads)) if len(heads) > 0 else np.zeros(0, dtype = np.int64)
+    return heads.tolist(), array.array("q", chains.tobytes())
+
+
+def assemble(keys, n, strategy, numProcesses = 1):
+    if numProcesses > 1:
+        return assembleParallel(keys, n, strategy, numProcesses)
+    if strategy == "eulerian":
+        return assembleEulerian(keys, n)
+    return assembleGreedy(keys, n)
+
+
+def readUniqueNmers(fileName, n):
+    ## packed n-mers in file order (a .npy from processUniqueNmersProteome.py --saveBinary is read as is)
+    if fileName.endswith(".npy"):
+        return np.load(fileName)
+    try:
+        return packedNmers.readNmerText(fileName, n)
+    except ValueError:
+        ## not fixed width, e.g. blank lines
+        return packedNmers.encodePeptides([line.rstrip() for line in open(fileName, "r") if line.rstrip()], n)
+
+
+def writeContigs(outFile, heads, keys, nextNmer, n):
+    ## materialise contig strings from the n-mer chains; returns the contig lengths
+    lastResidues = packedNmers.DECODE[(keys & packedNmers.RESIDUE_MASK).astype(np.intp)].tobytes()
+    firstResidues = packedNmers.decodeKeys(keys[np.asarray(heads, dtype = np.intp)] >> packedNmers.SHIFT, n - 1) if len(heads) > 0 else []
+    lengths = []
+    out = open(outFile, "wb")
+    for headNum, head in enumerate(heads):
+        contig = bytearray(firstResidues[headNum].tobytes())
+        i = head
+        while i != -1:
+            contig.append(lastResidues[i])
+            i = nextNmer[i]
+        contig.append(ord("\n"))
+        out.write(contig)
+        lengths.append(len(contig) - 1)
+    out.close()
+    return lengths
+
+
+def verifyContigs(outFile, keys, n, reportFile):
+    ## check from the written file that every input n-mer is in exactly one contig window
+    windows = packedNmers.packWindows(packedNmers.encodeSequence(open(outFile, "rb").read()), n)
+    windows.sort()
+    windowKeys, windowCounts = np.unique(windows, return_counts = True)
+    inputKeys = np.unique(keys)
+    numDuplicated = int(np.count_nonzero(windowCounts > 1))
+    numMissing = int(np.count_nonzero(~np.isin(inputKeys, windowKeys, assume_unique = True)))
+    numExtra = int(np.count_nonzero(~np.isin(windowKeys, inputKeys, assume_unique = True)))
+    passed = len(inputKeys) == len(keys) and numDuplicated == 0 and numMissing == 0 and numExtra == 0
+
+    report = open(reportFile, "w")
+    report.write("contig file\t{}\n".format(outFile))
+    report.write("n\t{}\n".format(n))
+    report.write("input n-mers\t{}\n".format(len(keys)))
+    report.write("distinct input n-mers\t{}\n".format(len(inputKeys)))
+    report.write("n-mer windows in contigs\t{}\n".format(len(windows)))
+    report.write("n-mers in more than one window\t{}\n".format(numDuplicated))
+    report.write("input n-mers missing from contigs\t{}\n".format(numMissing))
+    report.write("contig n-mers not in input\t{}\n".format(numExtra))
+    report.write("every n-mer exactly once\t{}\n".format("PASS" if passed else "FAIL"))
+    report.close()
+    return passed
+
 
 if __name__ == "__main__":
 
@@ -86,6 +402,12 @@ if __name__ == "__main__":
     parser.add_argument("uniqueNmerFile", help = "File containing unique nmers", type = str)
     parser.add_argument("N", help = "Value of N", type = int)
     parser.add_argument("outputFile", help = "File to write output to", type = str)
+    parser.add_argument("--strategy", choices = ["greedy", "eulerian"], help = "greedy: join n-mers in input order (default). eulerian: fewest contigs, from a minimum path cover of the de Bruijn graph", type = str, default = "greedy")
+    parser.add_argument("--hlaAlleleList", metavar = "file", help = "HLA alleles that will be predicted (for the runtime estimate of --strategy eulerian)", type = str, default = None)
+    parser.add_argument("--secondsPerWindow", metavar = "S", help = "NetMHCpan seconds per predicted peptide, for the runtime estimate (default: %(default)s)", type = float, default = 2e-4)
+    parser.add_argument("--secondsPerSequence", metavar = "S", help = "NetMHCpan seconds of overhead per input sequence, for the runtime estimate (default: %(default)s)", type = float, default = 1e-3)
+    parser.add_argument("--processes", metavar = "N", help = "Assemble connected components of the overlap graph in N processes (default: 1)", type = int, default = 1)
+    parser.add_argument("--verify", action = "store_true", help = "Check the contigs and write outputFile.verification.txt (always done with --processes)")
     parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
     parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
     args = parser.parse_args()
@@ -95,32 +417,38 @@ if __name__ == "__main__":
     VERB = args.VERB
     n = args.N
 
-    ntermDict = {}
-    ctermDict = {}
-    
-    print("Joining nmers...")
-    
-    numNmers = 0
+    keys = readUniqueNmers(args.uniqueNmerFile, n)
+    numNmers = len(keys)
 
-    for line in open(args.uniqueNmerFile, "r"):
-        numNmers += 1
-        findMateOrAdd(line.rstrip())
+    if args.strategy == "eulerian":
+        ## greedy contig counts, for the comparison
+        print("Joining nmers greedily for comparison...")
+        greedyHeads, greedyChains = assemble(keys, n, "greedy", args.processes)
+        numGreedyContigs = len(greedyHeads)
+        greedyHeads = greedyChains = None
 
-    print("Writing output...")
+        print("Finding minimum path cover of the de Bruijn graph...")
+        heads, chains = assemble(keys, n, "eulerian", args.processes)
+    else:
+        print("Joining nmers...")
+        heads, chains = assemble(keys, n, "greedy", args.processes)
 
-    numContigs = 0
-    listOfLengths = []
+    print("Writing output...")
 
-    out = open(args.outputFile, "w")
-    for ntermMer in ntermDict:
-        for resid in ntermDict[ntermMer]:
-            out.write("{}{}\n".format(ntermMer, resid))
-            numContigs += 1
-            listOfLengths.append(len("{}{}".format(ntermMer, resid)))
-    out.close()
+    listOfLengths = writeContigs(args.outputFile, heads, keys, chains, n)
+    numContigs = len(listOfLengths)
 
     print("There were {} unique {}mers.".format(numNmers, n))    
     print("After joining, there are {} unique sequences.".format(numContigs))
     print("The average length after joining is {}, with a min of {} and a max of {}.".format(sum(listOfLengths)/len(listOfLengths), min(listOfLengths), max(listOfLengths)))
-    print("done.")
 
+    if args.strategy == "eulerian":
+        reportSavings(numNmers, numGreedyContigs, numContigs, n)
+
+    if args.verify or args.processes > 1:
+        reportFile = args.outputFile + ".verification.txt"
+        if not verifyContigs(args.outputFile, keys, n, reportFile):
+            print("Verification FAILED: not every n-mer is in exactly one contig, see {}.".format(reportFile), file = sys.stderr)
+            sys.exit(1)
+        print("Verified every n-mer is in exactly one contig ({}).".format(reportFile))
+    print("done.")
@@ -4,6 +4,11 @@ Using the flat files of the lists of peptides presented by each HLA, create sqli
 
 Date: July 6, 2018
 @author: sbrown
+
+Edited October 17, 2026:
+    - The database is written with binderDatabase.py (one connection, bulk load settings,
+      large transactions) in chunks as the files are read, and the indexes are built at the end.
+    - --schemaVersion 2 writes the clustered version 2 schema (see binderDatabase.py).
 '''
 
 ## Import Libraries
@@ -11,18 +16,12 @@ import sys
 import argparse
 import os
 import time
-import sqlite3
+import binderDatabase
 
 DEBUG = False
 VERB = False
 
-
-
-def connectAndWriteDB(database, data, query):
-    db = sqlite3.connect(database)
-    db.executemany(query, data)
-    db.commit()
-    db.close()
+maxBufferSize = 1000000
 
 class bcolors:
     HEADER = '\033[95m'
@@ -45,6 +44,7 @@ if __name__ == "__main__":
     ## add_argument("name", "(names)", metavar="exampleOfValue - best for optional", type=int, nargs="+", choices=[allowed,values], dest="nameOfVariableInArgsToSaveAs")
     parser.add_argument("flatfile_dir", help = "Directory containing flat files", type = str)
     parser.add_argument("new_database", help = "Database to create", type = str)
+    parser.add_argument("--schemaVersion", choices = binderDatabase.SCHEMA_VERSIONS, help = "Database schema version (see binderDatabase.py; default: 1)", type = int, default = 1)
     parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
     parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
     args = parser.parse_args()
@@ -64,7 +64,7 @@ if __name__ == "__main__":
 
     ## Check that database file does not already exist.
     if os.path.exists(args.new_database):
-        print("Database file {} already exists. Please provide a non-existant database.".format(args.database_file))
+        print("Database file {} already exists. Please provide a non-existant database.".format(args.new_database))
         sys.exit()
 
 
@@ -83,19 +83,15 @@ if __name__ == "__main__":
 
     ## write HLA to database
     log_print("STATUS", "Writing HLA data to database...")
-    db = sqlite3.connect(args.new_database)
-    db.execute("CREATE TABLE hla(id INT, allele TEXT)")
-    db.executemany("INSERT INTO hla(id, allele) VALUES (?, ?)", hla_toWrite)
-    db.commit()
-    
-    ## create peptide table and binders table
-    db.execute("CREATE TABLE peptide(id INT, sequence TEXT)")
-    db.execute("CREATE TABLE binders(hla_id INT, pep_id INT)")
-    db.commit()
-    db.close()
+    writer = binderDatabase.BulkWriter(args.new_database)
+    ## the flat files have no IC50s
+    writer.createTables(binderDatabase.tableStatements(args.schemaVersion, None), args.schemaVersion)
+    ## in version 2, a peptide listed twice for an allele is one binder
+    replace = args.schemaVersion > 1
+    writer.insert("hla", ("id", "allele"), hla_toWrite)
 
     ## Parse through files
-    log_print("STATUS", "Parsing through files...")
+    log_print("STATUS", "Parsing through files and writing peptides and binders to database...")
     pep_ids = {}
     i = 1
     pep_toWrite = []
@@ -112,20 +108,18 @@ if __name__ == "__main__":
                 i += 1
             bind_toWrite.append((hla_ids[hla], pep_ids[pep]))
 
-    ## write to database
-    log_print("STATUS", "Writing peptides and binders to database...")
-    db = sqlite3.connect(args.new_database)
-    db.executemany("INSERT INTO peptide(id, sequence) VALUES (?, ?)", pep_toWrite)
-    db.executemany("INSERT INTO binders(hla_id, pep_id) VALUES (?, ?)", bind_toWrite)
-    db.commit()
-    db.close()
-
-    print("\n=================================================")
-    print("To improve performance of database, connect to database using '$ sqlite3 {}'".format(args.new_database))
-    print("Then run indexing by typing:")
-    print("> CREATE INDEX peptide_ind ON peptide(id);")
-    print("> CREATE INDEX peptide_seq ON peptide(sequence);")
-    print("> CREATE INDEX binder_hla_ind ON binders(hla_id);")
-    print("> CREATE INDEX binder_pep_ind ON binders(pep_id);")
-    print("=================================================\n")
+            ## write to database in chunks
+            if len(bind_toWrite) >= maxBufferSize:
+                writer.insert("peptide", ("id", "sequence"), pep_toWrite)
+                writer.insert("binders", ("hla_id", "pep_id"), bind_toWrite, replace)
+                pep_toWrite = []
+                bind_toWrite = []
+
+    writer.insert("peptide", ("id", "sequence"), pep_toWrite)
+    writer.insert("binders", ("hla_id", "pep_id"), bind_toWrite, replace)
+    pep_toWrite = []
+    bind_toWrite = []
+
+    log_print("STATUS", "Indexing...")
+    writer.close(binderDatabase.indexStatements(args.schemaVersion))
     log_print("STATUS", "Done.")
\ No newline at end of file
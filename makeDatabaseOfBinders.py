@@ -4,17 +4,39 @@ Parse through NetMHCpan results and build an SQlite3 database of the binding pep
 
 Date: February 1, 2017
 @author: sbrown
+
+Edited October 17, 2026:
+    - If prepareJobs.py wrote a peptide dictionary (peptides_{species}.npy), peptide IDs
+      come from it and each job's peptide order file (_peptides.npy) is mapped to IDs by
+      array lookup instead of a dictionary of strings. _peptides.txt files still work.
+    - Score files are read with scoreFiles.py (text, float32 .npy or sparse) and filtered with numpy.
+    - With --manifest (jobs.manifest.jsonl from prepareJobs.py), the score and peptide order
+      files of each job come from the manifest instead of walking root_dir.
+    - Score files are read with workerPool.py (one shared queue, no polling of per-process queues).
+    - _peptides.txt files are read as packed peptides into a sorted key array and an ID array
+      (peptide IDs as before), saved next to the database and memory mapped by every worker,
+      instead of a dictionary of strings copied to each worker.
+    - The database is written with binderDatabase.py: one connection, bulk load settings,
+      large transactions, and the indexes built at the end.
+    - --schemaVersion 2 writes the clustered version 2 schema (see binderDatabase.py), and
+      --quantisedIC50 stores the IC50s as integer tenths of a nM.
 '''
 
 ## Import Libraries
 import sys
 import argparse
 import os
-import sqlite3
-import multiprocessing as mp
+import shutil
+import tempfile
 import time
 import scandir
 import traceback
+import numpy as np
+import packedNmers
+import scoreFiles
+import jobManifest
+import workerPool
+import binderDatabase
 
 DEBUG = False
 VERB = False
@@ -22,46 +44,88 @@ VERB = False
 IC50_THRESH = 500
 maxBufferSize = 100000
 
-SENTINEL = None
-
 hlaID = {}
-pepID = {}
-
-
-def connectAndWriteDB(database, data, query):
-    db = sqlite3.connect(database)
-    db.executemany(query, data)
-    db.commit()
-    db.close()
-
-def processPeptideFile(q, oq, hids, pids, i):
-    numProcessed = 0
-    resHolder = []
-    numInHolder = 0
-    while True:
-        dat = q.get()
-        #print("DEBUG q.get: {}".format(dat))
-        if dat is SENTINEL:
-            break
-        hla, pepLen, scoreFile, refFile = dat
-        numProcessed += 1
-
-        for lineScore, lineRef in zip(open(scoreFile, "r"), open(refFile, "r")):
-            if float(lineScore.rstrip()) <= IC50_THRESH:
-                resHolder.append((hids[hla], pids[lineRef.rstrip()], lineScore.rstrip()))
-                numInHolder += 1
-
-        if numInHolder > maxBufferSize:
-            oq.put(resHolder)
-            resHolder = []
-            numInHolder = 0
-
-    oq.put(resHolder)
-    resHolder = []
-    numInHolder = 0
-
-    oq.put(SENTINEL)
-    print("\nProcessing complete in slave {}...".format(i+1))
+quantisedIC50 = False
+
+## per process: sorted packed peptide dictionary (peptide ID = index + 1, or the value at
+## the index of the ID map) and peptide IDs of the last job read
+peptideDictionary = None
+peptideIDMap = None
+jobPeptideIDs = {}
+peptideDictionaryFile = None
+peptideIDMapFile = None
+
+
+def dictionaryFileName(rootDir, species):
+    return os.path.join(rootDir, "peptides_{}.npy".format(species))
+
+
+def dictionaryByLength(dictionary):
+    ## (n, first index, last index + 1) of each peptide length in the sorted dictionary
+    ## a packed n-mer lies in [2^(5(n-1)), 2^(5n)), so each length is one block
+    bounds = [np.uint64(1 << (packedNmers.BITS_PER_RESIDUE * n)) for n in range(packedNmers.MAX_NMER_LENGTH)]
+    starts = np.searchsorted(dictionary, bounds).tolist() + [len(dictionary)]
+    return [(n, starts[n - 1], starts[n]) for n in range(1, packedNmers.MAX_NMER_LENGTH + 1) if starts[n] > starts[n - 1]]
+
+
+def writePeptideIDMap(keys, dictionaryFile, idMapFile):
+    ## sorted keys and IDs of packed peptides numbered in order from 1;
+    ## a peptide given more than once keeps its last ID
+    order = np.argsort(keys, kind = "stable")
+    keys = keys[order]
+    last = np.ones(len(keys), dtype = bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    np.save(dictionaryFile, keys[last])
+    np.save(idMapFile, order[last].astype(np.int64) + 1)
+
+
+def peptideIDs(refFile, n):
+    ## peptide IDs of a job in score file order (cached, as every HLA of the job uses the same file)
+    global peptideDictionary, peptideIDMap
+    if refFile not in jobPeptideIDs:
+        if peptideDictionary is None:
+            peptideDictionary = np.load(peptideDictionaryFile, mmap_mode = "r")
+            if peptideIDMapFile is not None:
+                peptideIDMap = np.load(peptideIDMapFile, mmap_mode = "r")
+        keys = np.load(refFile) if refFile.endswith(".npy") else packedNmers.readNmerText(refFile, n)
+        idx = np.minimum(np.searchsorted(peptideDictionary, keys), max(len(peptideDictionary) - 1, 0))
+        ## every peptide of a job must be in the dictionary, or it would get another peptide's ID
+        missing = np.flatnonzero(peptideDictionary[idx] != keys) if len(peptideDictionary) else np.arange(len(keys))
+        if len(missing):
+            raise ValueError("Peptide {} of {} is not in the peptide dictionary ({:,} missing).".format(packedNmers.keysToStrings(keys[missing[:1]], n)[0], refFile, len(missing)))
+        jobPeptideIDs.clear()
+        jobPeptideIDs[refFile] = idx + 1 if peptideIDMap is None else np.asarray(peptideIDMap[idx])
+    return jobPeptideIDs[refFile]
+
+
+def setGlobals(hids, dictionaryFile, idMapFile, quantised, debug, verb):
+    global hlaID, peptideDictionaryFile, peptideIDMapFile, quantisedIC50, DEBUG, VERB
+    hlaID = hids
+    peptideDictionaryFile = dictionaryFile
+    peptideIDMapFile = idMapFile
+    quantisedIC50 = quantised
+    DEBUG = debug
+    VERB = verb
+
+def processPeptideFile(dat):
+    ## (hla_id, pep_id, ic50 or ic50_q) of the binders in one score file
+    #print("DEBUG dat: {}".format(dat))
+    hla, pepLen, scoreFile, refFile = dat
+
+    ids = peptideIDs(refFile, pepLen)
+    try:
+        binds, scores, numScored = scoreFiles.readBinders(scoreFile, IC50_THRESH)
+    except ValueError as e:
+        print("\nWarning: skipping {}".format(e))
+        return []
+    if numScored != len(ids):
+        print("\nWarning: {} has {} scores for {} peptides.".format(scoreFile, numScored, len(ids)))
+        scores = scores[binds < len(ids)]
+        binds = binds[binds < len(ids)]
+    ic50 = scoreFiles.ic50Values(scores)
+    if quantisedIC50:
+        ic50 = binderDatabase.quantiseIC50(ic50)
+    return list(zip([hlaID[hla]] * len(binds), ids[binds].tolist(), ic50.tolist()))
 
 
 if __name__ == "__main__":
@@ -73,6 +137,10 @@ if __name__ == "__main__":
     parser.add_argument("hla_list", help = "File with HLA alleles to use (each only once)", type = str)
     parser.add_argument("database_file", help = "Database file to create", type = str)
     parser.add_argument("maxNumberProcesses", help = "Maximum number of processes to start", type = int)
+    parser.add_argument("--manifest", metavar = "file", help = "Job manifest from prepareJobs.py (jobs.manifest.jsonl), to read instead of searching root_dir for results", type = str, default = None)
+    parser.add_argument("--resultsDir", metavar = "directory", help = "Directory the manifest outputs are in (default: root_dir)", type = str, default = None)
+    parser.add_argument("--schemaVersion", choices = binderDatabase.SCHEMA_VERSIONS, help = "Database schema version (see binderDatabase.py; default: 1)", type = int, default = 1)
+    parser.add_argument("--quantisedIC50", action = "store_true", help = "Store IC50s as integer tenths of a nM (ic50_q, schema version 2 only)")
     parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
     parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
     args = parser.parse_args()
@@ -81,6 +149,12 @@ if __name__ == "__main__":
     DEBUG = args.DEBUG
     VERB = args.VERB
 
+    if args.quantisedIC50 and args.schemaVersion < 2:
+        parser.error("--quantisedIC50 needs --schemaVersion 2")
+    ## in version 2, a peptide read twice keeps its last ID and a binder read twice its last IC50
+    replace = args.schemaVersion > 1
+    ic50Column = binderDatabase.ic50Column(args.quantisedIC50)
+
 
     ## Check that database file does not already exist.
     if os.path.exists(args.database_file):
@@ -90,43 +164,68 @@ if __name__ == "__main__":
 
     ## Make peptide mapping
 
-    db = sqlite3.connect(args.database_file)
-    db.execute("CREATE TABLE peptide(id INT, sequence TEXT)")
-    db.commit()
-    db.close()
+    writer = binderDatabase.BulkWriter(args.database_file)
+    writer.createTables(binderDatabase.tableStatements(args.schemaVersion, ic50Column), args.schemaVersion)
 
     print("Processing all peptide sequences...")
     timecheck = time.time()
     
     pep_i = 1
     pep_toWrite = []
-
-    for f in os.listdir(args.root_dir):
-        if f.endswith("_peptides.txt"):
-            for line in open(os.path.join(args.root_dir,f), "r"):
-                pep = line.rstrip()
-
-                pepID[pep] = pep_i
-                pep_toWrite.append((pep_i, pep))
-                pep_i += 1
-
-                if len(pepID) % maxBufferSize == 0:
-                    print("                                                 ", end="\r")
-                    print("{:,} peptides processed...".format(len(pepID)), end="", flush=True)
-                    print("Writing...", end="", flush=True)
-                    qry = "INSERT INTO peptide(id, sequence) VALUES (?, ?)"
-                    connectAndWriteDB(args.database_file, pep_toWrite, qry)
-                    pep_toWrite = []
-                    print("done.", end="\r", flush=True)
-
-    ## clear the writing buffer
-    print("                                                 ", end="\r")
-    print("{:,} peptides processed...".format(len(pepID)), end="", flush=True)
-    print("Writing...", end="", flush=True)
-    qry = "INSERT INTO peptide(id, sequence) VALUES (?, ?)"
-    connectAndWriteDB(args.database_file, pep_toWrite, qry)
-    pep_toWrite = []
-    print("done.", end="\r", flush=True)
+    idMapFile = None
+    idMapDir = None
+
+    dictionaryFile = dictionaryFileName(args.root_dir, args.species_code)
+    if os.path.exists(dictionaryFile):
+        ## IDs are dictionary index + 1
+        dictionary = np.load(dictionaryFile, mmap_mode = "r")
+        for n, first, last in dictionaryByLength(dictionary):
+            for start in range(first, last, maxBufferSize):
+                end = min(start + maxBufferSize, last)
+                pep_toWrite = list(zip(range(start + 1, end + 1), packedNmers.keysToStrings(dictionary[start : end], n)))
+                print("                                                 ", end="\r")
+                print("{:,} peptides processed...".format(end), end="", flush=True)
+                print("Writing...", end="", flush=True)
+                writer.insert("peptide", ("id", "sequence"), pep_toWrite, replace)
+                pep_toWrite = []
+                print("done.", end="\r", flush=True)
+        dictionary = None
+    elif args.manifest:
+        print("--manifest needs the peptide dictionary {} written by prepareJobs.py.".format(dictionaryFile))
+        sys.exit(1)
+    else:
+        ## prot{n}_{fnum}_{species}_peptides.txt files, numbered in file order
+        peptideKeys = []
+        for f in os.listdir(args.root_dir):
+            if f.endswith("_peptides.txt"):
+                n = int(f.split("_")[0][len("prot"):])
+                peptideKeys.append(packedNmers.readNmerText(os.path.join(args.root_dir,f), n))
+                for pep in packedNmers.keysToStrings(peptideKeys[-1], n):
+                    pep_toWrite.append((pep_i, pep))
+                    pep_i += 1
+
+                    if len(pep_toWrite) == maxBufferSize:
+                        print("                                                 ", end="\r")
+                        print("{:,} peptides processed...".format(pep_i - 1), end="", flush=True)
+                        print("Writing...", end="", flush=True)
+                        writer.insert("peptide", ("id", "sequence"), pep_toWrite, replace)
+                        pep_toWrite = []
+                        print("done.", end="\r", flush=True)
+
+        ## clear the writing buffer
+        print("                                                 ", end="\r")
+        print("{:,} peptides processed...".format(pep_i - 1), end="", flush=True)
+        print("Writing...", end="", flush=True)
+        writer.insert("peptide", ("id", "sequence"), pep_toWrite, replace)
+        pep_toWrite = []
+        print("done.", end="\r", flush=True)
+
+        ## the workers share one memory mapped copy of the peptide to ID map
+        idMapDir = tempfile.mkdtemp(prefix = "peptideIDs.", dir = os.path.dirname(os.path.abspath(args.database_file)))
+        dictionaryFile = os.path.join(idMapDir, "peptides.npy")
+        idMapFile = os.path.join(idMapDir, "peptideIDs.npy")
+        writePeptideIDMap(np.concatenate(peptideKeys) if peptideKeys else np.zeros(0, dtype = np.uint64), dictionaryFile, idMapFile)
+        peptideKeys = None
 
 
     print("\nTook {:.2f} seconds...".format(time.time() - timecheck))
@@ -152,114 +251,75 @@ if __name__ == "__main__":
     print("Writing HLA to database...")
     timecheck = time.time()
 
-    db = sqlite3.connect(args.database_file)
-    db.execute("CREATE TABLE hla(id INT, allele TEXT)")
-    db.executemany("INSERT INTO hla(id, allele) VALUES (?, ?)", hla_toWrite)
-    db.commit()
-    db.close()
+    writer.insert("hla", ("id", "allele"), hla_toWrite)
 
     print("Took {:.2f} seconds...".format(time.time() - timecheck))
 
     ## Distribute result file parsing
     print("Finding and parsing all results files...")
-    print("Will print files being submitted to slave 1...")
     timecheck = time.time()
 
-    db = sqlite3.connect(args.database_file)
-    db.execute("CREATE TABLE binders(hla_id INT, pep_id INT, ic50 REAL)")
-    db.commit()
-    db.close()
-
     ## read in all peptides, keep those meeting threshold.
     ## most species will have multiple contig files/runs for each index.
     try:
-        procs = []
-        pqs = []
-        out_qs = []
-        for i in range(args.maxNumberProcesses):
-            q = mp.Queue()
-            oq = mp.Queue()
-            p = mp.Process(target=processPeptideFile, args=(q, oq, hlaID, pepID, i))
-            procs.append(p)
-            p.start()
-            pqs.append(q)
-            out_qs.append(oq)
-
-
-        ## assign HLA alleles to each process.
-
-
-        proc_ind = 0
-        for root, dirs, files in scandir.walk(args.root_dir):
+        tasks = []
+        if args.manifest:
+            numMissing = 0
+            for record in jobManifest.readManifest(args.manifest):
+                pepRefFile = jobManifest.inputPath(args.manifest, record, "peptides")
+                for hla in record["hlas"]:
+                    pepScoreFile = os.path.join(args.resultsDir or args.root_dir, record["outputs"][hla])
+                    if not os.path.exists(pepScoreFile):
+                        numMissing += 1
+                        continue
+                    tasks.append([hla, record["length"], pepScoreFile, pepRefFile])
+            if numMissing > 0:
+                print("Warning: {:,} results in {} are missing.".format(numMissing, args.manifest))
+
+        for root, dirs, files in ([] if args.manifest else scandir.walk(args.root_dir)):
             for f in files:
                 if f.endswith(".pMHC.parsed"):
                     ind = "_".join(f.split(".")[0].split("_")[0:3])
                     hla = f.split(".")[0].split("_")[1]
 
-                    if proc_ind == 0: print("Submitting {} to slave {}...     ".format(f, proc_ind+1), end="\r")
-                    
                     pepLen = int(f.split(".")[0].split("_")[2])
                     contigFileNum = int(f.split(".")[0].split("_")[3])
 
                     pepScoreFile = os.path.join(root,f)
-                    pepRefFile = os.path.join(args.root_dir, "prot{}_{}_{}_peptides.txt".format(pepLen,contigFileNum,args.species_code))
+                    pepRefFile = os.path.join(args.root_dir, "prot{}_{}_{}_peptides.{}".format(pepLen,contigFileNum,args.species_code, "txt" if idMapFile else "npy"))
 
-                    ## add to queue
-                    pqs[proc_ind].put([hla, pepLen, pepScoreFile, pepRefFile])
+                    tasks.append([hla, pepLen, pepScoreFile, pepRefFile])
 
-                    proc_ind += 1
-                    if proc_ind >= args.maxNumberProcesses:
-                        proc_ind = 0
-                    
-
-        ## Send END signal to each queue
-        for pq in pqs:
-            pq.put(SENTINEL)
-
-        print("\nTook {:.2f} seconds...".format(time.time() - timecheck))
+        print("Found {:,} results files. Took {:.2f} seconds...".format(len(tasks), time.time() - timecheck))
 
         print("Writing to database as files are processed...")
         timecheck = time.time()
         
-        ## Collect chunks from Processes in out_qs, write to database
-        proc_ind = 0
-        completed = [False for x in range(args.maxNumberProcesses)]
-        
-        while not all(completed):
-            ## cycle through output queues and slurp results
-            if not out_qs[proc_ind].empty():
-                res = out_qs[proc_ind].get()
-                if res is SENTINEL:
-                    ## that proc is done.
-                    completed[proc_ind] = True
-                else:
-                    ## write to database
-                    print("                                          ", end="\r", flush=True)
-                    print("Writing chunk from slave {}...".format(proc_ind+1), end="\r", flush=True)
-                    ## If res is a list of lists, .get() only grabs the first.
-                    qry = "INSERT INTO binders(hla_id, pep_id, ic50) VALUES (?, ?, ?)"
-                    connectAndWriteDB(args.database_file, res, qry)
-                    print("Writing chunk from slave {}...done. ".format(proc_ind+1), end="\r", flush=True)
-            proc_ind += 1
-            if proc_ind >= args.maxNumberProcesses:
-                proc_ind = 0
-
-        ## make sure all procs have finished.
-        print("\nShutting down all slaves...")
-        for p in procs:
-            p.join()
+        ## Collect binders from the workers, write to database in chunks
+        resultBuffer = []
+        for res in workerPool.runTasks(processPeptideFile, tasks, args.maxNumberProcesses, initializer = setGlobals, initargs = (hlaID, dictionaryFile, idMapFile, args.quantisedIC50, DEBUG, VERB), label = "results files"):
+            resultBuffer.extend(res)
+            if len(resultBuffer) > maxBufferSize:
+                ## in (hla_id, pep_id) order, the order of the version 2 primary key
+                resultBuffer.sort()
+                writer.insert("binders", ("hla_id", "pep_id", ic50Column), resultBuffer, replace)
+                resultBuffer = []
+        resultBuffer.sort()
+        writer.insert("binders", ("hla_id", "pep_id", ic50Column), resultBuffer, replace)
+        resultBuffer = []
+
+        print("Indexing...")
+        writer.close(binderDatabase.indexStatements(args.schemaVersion))
 
     except KeyboardInterrupt:
         print("Keyboard Interruption: ".format(sys.exc_info()[0]))
         print(traceback.format_exc())
-        print("Please wait while processes close...")
-        for q in pqs:
-            while not q.empty():
-                foo = q.get()
-            q.put(SENTINEL)
-        for p in procs:
-            p.join()
+        print("Processes stopped.")
 
-        sys.exit()
+        sys.exit(1)
+
+    finally:
+        if idMapDir:
+            shutil.rmtree(idMapDir)
 
     print("Done.")
\ No newline at end of file
@@ -0,0 +1,107 @@
+'''
+Migrate Binder Database
+Copies a version 1 database of binders (from makeDatabaseOfBinders.py or
+makeDatabaseFromFlatFiles.py) into a new database with the version 2 schema (see
+binderDatabase.py): clustered binders without rowids, and peptide and HLA ids as primary
+keys instead of indexed columns. The rows are copied in primary key order.
+
+    python migrateBinderDatabase.py HUMAN_binders.db HUMAN_binders.v2.db --quantisedIC50
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import sys
+import argparse
+import os
+import sqlite3
+import time
+import urllib.request
+import binderDatabase
+
+DEBUG = False
+VERB = False
+
+maxBufferSize = 1000000
+
+
+def copyRows(old, writer, query, table, columns, replace = False, convert = None):
+    ## stream the rows of a query on the old database into a table of the new one
+    cursor = old.execute(query)
+    numRows = 0
+    while True:
+        rows = cursor.fetchmany(maxBufferSize)
+        if not rows:
+            break
+        if convert is not None:
+            rows = convert(rows)
+        writer.insert(table, columns, rows, replace)
+        numRows += len(rows)
+        print("{:,} {} rows copied...".format(numRows, table), end = "\r", flush = True)
+    print("")
+    return numRows
+
+
+def quantiseRows(rows):
+    ## (hla_id, pep_id, ic50) rows to (hla_id, pep_id, ic50_q)
+    hlaIDs, pepIDs, ic50 = zip(*rows)
+    return list(zip(hlaIDs, pepIDs, binderDatabase.quantiseIC50(ic50).tolist()))
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Migrate a binder database to schema version 2")
+    parser.add_argument("old_database", help = "Version 1 database to read", type = str)
+    parser.add_argument("new_database", help = "Version 2 database to create", type = str)
+    parser.add_argument("--quantisedIC50", action = "store_true", help = "Store IC50s as integer tenths of a nM (ic50_q)")
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    if not os.path.isfile(args.old_database):
+        print("Database file {} does not exist.".format(args.old_database))
+        sys.exit(1)
+    if os.path.exists(args.new_database):
+        print("Database file {} already exists. Please provide a non-existant database.".format(args.new_database))
+        sys.exit(1)
+
+    ## read only; the path is quoted so that ?, # and % in it are not read as part of the URI
+    old = sqlite3.connect("file:{}?mode=ro".format(urllib.request.pathname2url(os.path.abspath(args.old_database))), uri = True)
+    try:
+        version = binderDatabase.schemaVersion(old)
+    except sqlite3.DatabaseError as e:
+        print("Cannot read {}: {}".format(args.old_database, e))
+        sys.exit(1)
+    if version != 1:
+        print("{} has schema version {}; only version 1 databases can be migrated.".format(args.old_database, version))
+        sys.exit(1)
+    binderColumns = [row[1] for row in old.execute("PRAGMA table_info(binders)")]
+    hasIC50 = "ic50" in binderColumns
+    if args.quantisedIC50 and not hasIC50:
+        print("{} has no IC50s to quantise.".format(args.old_database))
+        sys.exit(1)
+    ic50Column = binderDatabase.ic50Column(args.quantisedIC50) if hasIC50 else None
+
+    timecheck = time.time()
+    writer = binderDatabase.BulkWriter(args.new_database)
+    writer.createTables(binderDatabase.tableStatements(2, ic50Column), 2)
+
+    copyRows(old, writer, "SELECT id, allele FROM hla ORDER BY id", "hla", ("id", "allele"))
+    ## a sequence listed twice keeps its last id, the one its binders use
+    copyRows(old, writer, "SELECT id, sequence FROM peptide ORDER BY id", "peptide", ("id", "sequence"), replace = True)
+    if hasIC50:
+        copyRows(old, writer, "SELECT hla_id, pep_id, ic50 FROM binders ORDER BY hla_id, pep_id", "binders", ("hla_id", "pep_id", ic50Column), replace = True, convert = quantiseRows if args.quantisedIC50 else None)
+    else:
+        copyRows(old, writer, "SELECT hla_id, pep_id FROM binders ORDER BY hla_id, pep_id", "binders", ("hla_id", "pep_id"), replace = True)
+    old.close()
+    writer.close(binderDatabase.indexStatements(2))
+
+    print("{} is {:,} bytes, {} was {:,} bytes.".format(args.new_database, os.path.getsize(args.new_database), args.old_database, os.path.getsize(args.old_database)))
+    print("Took {:.2f} seconds...".format(time.time() - timecheck))
+    print("done.")
@@ -0,0 +1,125 @@
+'''
+N-mer Provenance
+Index of which proteins and positions each unique n-mer came from, built by
+processUniqueNmersProteome.py --provenance, plus a batch lookup.
+
+An index with prefix P is stored as memory-mappable arrays:
+    P.keys.npy      sorted unique packed n-mers (uint64)
+    P.offsets.npy   CSR offsets (uint64, len(keys) + 1); the sites of keys[i] are sites[offsets[i]:offsets[i+1]]
+    P.sites.npy     (protein_id, position) pairs (uint32, shape (numSites, 2)), position is 0-based
+    P.proteins.txt  fasta header of each protein_id, one per line
+
+Usage: python nmerProvenance.py index_prefix peptides.txt output.tsv
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import argparse
+import time
+import numpy as np
+import packedNmers
+
+DEBUG = False
+VERB = False
+
+
+def writeIndex(prefix, keys, proteinIds, positions, proteinNames):
+    ## keys, proteinIds and positions hold one entry per n-mer occurrence, in proteome order
+    order = np.argsort(keys, kind = "mergesort")
+    sortedKeys = keys[order]
+    uniqueKeys, firstIndex = np.unique(sortedKeys, return_index = True)
+
+    offsets = np.empty(len(uniqueKeys) + 1, dtype = np.uint64)
+    offsets[:-1] = firstIndex
+    offsets[-1] = len(sortedKeys)
+
+    sites = np.empty((len(order), 2), dtype = np.uint32)
+    sites[:, 0] = proteinIds[order]
+    sites[:, 1] = positions[order]
+
+    np.save(prefix + ".keys.npy", uniqueKeys)
+    np.save(prefix + ".offsets.npy", offsets)
+    np.save(prefix + ".sites.npy", sites)
+    out = open(prefix + ".proteins.txt", "w")
+    for name in proteinNames:
+        out.write("{}\n".format(name))
+    out.close()
+    return len(uniqueKeys), len(sites)
+
+
+class ProvenanceIndex:
+    def __init__(self, prefix):
+        self.keys = np.load(prefix + ".keys.npy", mmap_mode = "r")
+        self.offsets = np.load(prefix + ".offsets.npy", mmap_mode = "r")
+        self.sites = np.load(prefix + ".sites.npy", mmap_mode = "r")
+        self.proteins = [line.rstrip("\n") for line in open(prefix + ".proteins.txt", "r")]
+        ## every key of the index has the same length; its first residue code is non-zero
+        self.n = (int(self.keys[0]).bit_length() + packedNmers.BITS_PER_RESIDUE - 1) // packedNmers.BITS_PER_RESIDUE if len(self.keys) > 0 else 0
+
+    def siteRanges(self, peptides):
+        '''For each peptide, the [start, end) range of its sites (empty if not in the index, or
+        not encodable: not of the index's length, or with residues outside packedNmers.ALPHABET).'''
+        starts = np.zeros(len(peptides), dtype = np.int64)
+        ends = np.zeros(len(peptides), dtype = np.int64)
+        encodable = np.flatnonzero(packedNmers.encodable(peptides, self.n))
+        if len(self.keys) == 0 or len(encodable) == 0:
+            return starts, ends
+        queries = packedNmers.encodePeptides([peptides[i] for i in encodable], self.n)
+        idx = np.searchsorted(self.keys, queries)
+        found = idx < len(self.keys)
+        found[found] = self.keys[idx[found]] == queries[found]
+
+        starts[encodable[found]] = self.offsets[idx[found]]
+        ends[encodable[found]] = self.offsets[idx[found] + 1]
+        return starts, ends
+
+    def lookup(self, peptides):
+        '''Flat arrays (peptide index, protein id, position) of every site of every peptide.'''
+        starts, ends = self.siteRanges(peptides)
+        counts = ends - starts
+        queryIndex = np.repeat(np.arange(len(counts)), counts)
+        ## expand each [start, end) range into its site indices
+        siteIndex = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        sites = self.sites[siteIndex]
+        return queryIndex, sites[:, 0], sites[:, 1]
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Lookup source proteins of peptides")
+    parser.add_argument("index_prefix", help = "Prefix of the provenance index (from processUniqueNmersProteome.py --provenance)", type = str)
+    parser.add_argument("peptide_file", help = "File with one peptide per line (all the same length as the index)", type = str)
+    parser.add_argument("output_file", help = "File to write peptide, protein and 1-based position to", type = str)
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    timecheck = time.time()
+    index = ProvenanceIndex(args.index_prefix)
+    peptides = [line.rstrip() for line in open(args.peptide_file, "r") if line.strip()]
+    queryIndex, proteinIds, positions = index.lookup(peptides)
+    print("Found {:,} sites for {:,} peptides in {:.2f} seconds...".format(len(queryIndex), len(peptides), time.time() - timecheck))
+
+    out = open(args.output_file, "w")
+    out.write("peptide\tprotein\tposition\n")
+    for q, p, pos in zip(queryIndex.tolist(), proteinIds.tolist(), positions.tolist()):
+        out.write("{}\t{}\t{}\n".format(peptides[q], index.proteins[p], pos + 1))
+    out.close()
+
+    ## peptides that cannot be in the index are reported, not looked up
+    encodable = packedNmers.encodable(peptides, index.n)
+    for peptide in [peptide for peptide, ok in zip(peptides, encodable) if not ok]:
+        print("Warning: {} is not encodable as a {}mer.".format(peptide, index.n))
+    numMissing = np.count_nonzero((np.bincount(queryIndex, minlength = len(peptides)) == 0) & encodable)
+    if numMissing > 0:
+        print("{:,} peptides were not in the index.".format(numMissing))
+    if not encodable.all():
+        print("{:,} peptides were not encodable.".format(np.count_nonzero(~encodable)))
+    print("done.")
@@ -0,0 +1,132 @@
+'''
+Packed N-mers
+Helpers for storing peptides as packed integers (5 bits per residue) in NumPy arrays.
+An 11-mer needs 55 bits, so every n-mer length used here fits in a uint64.
+
+Residue codes start at 1, so a packed key never has leading zero residues and
+n-mers of different lengths never collide. Code 0 marks a sequence break (or a
+residue that cannot be encoded), and windows spanning a 0 are dropped.
+For equal length n-mers, sorting the keys sorts the peptides alphabetically.
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import numpy as np
+
+BITS_PER_RESIDUE = 5
+MAX_NMER_LENGTH = 64 // BITS_PER_RESIDUE
+
+## all upper case letters (covers B, J, O, U, X, Z) plus stop
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ*"
+RESIDUES = frozenset(ALPHABET)
+
+SHIFT = np.uint64(BITS_PER_RESIDUE)
+RESIDUE_MASK = np.uint64((1 << BITS_PER_RESIDUE) - 1)
+
+ENCODE = np.zeros(256, dtype = np.uint8)
+DECODE = np.full(1 << BITS_PER_RESIDUE, ord("?"), dtype = np.uint8)
+for code, aa in enumerate(ALPHABET, start = 1):
+    ENCODE[ord(aa)] = code
+    DECODE[code] = ord(aa)
+
+
+def encodeSequence(seq):
+    '''Residue codes (uint8) for a str/bytes sequence. Unknown characters become 0.'''
+    if isinstance(seq, str):
+        seq = seq.encode("ascii")
+    return ENCODE[np.frombuffer(seq, dtype = np.uint8)]
+
+
+def packWindows(codes, n, returnPositions = False):
+    '''Packed keys of every length n window of codes that does not span a 0 code.'''
+    if n > MAX_NMER_LENGTH:
+        raise ValueError("Cannot pack {}mers into 64 bits (max length is {}).".format(n, MAX_NMER_LENGTH))
+
+    numWindows = len(codes) - n + 1
+    if numWindows <= 0:
+        keys = np.zeros(0, dtype = np.uint64)
+        if returnPositions:
+            return keys, np.zeros(0, dtype = np.int64)
+        return keys
+
+    keys = np.zeros(numWindows, dtype = np.uint64)
+    for j in range(n):
+        keys <<= SHIFT
+        keys |= codes[j : j + numWindows]
+
+    ## number of break codes in each window, from a running count
+    breaks = np.zeros(len(codes) + 1, dtype = np.int64)
+    np.cumsum(codes == 0, out = breaks[1:])
+    valid = (breaks[n:] - breaks[:numWindows]) == 0
+
+    if returnPositions:
+        return keys[valid], np.flatnonzero(valid)
+    return keys[valid]
+
+
+def decodeKeys(keys, n):
+    '''(len(keys), n) uint8 array of residue characters.'''
+    keys = np.asarray(keys, dtype = np.uint64)
+    chars = np.empty((len(keys), n), dtype = np.uint8)
+    for j in range(n):
+        shift = np.uint64(BITS_PER_RESIDUE * (n - 1 - j))
+        chars[:, j] = DECODE[((keys >> shift) & RESIDUE_MASK).astype(np.intp)]
+    return chars
+
+
+def keysToStrings(keys, n):
+    '''List of peptide strings for keys.'''
+    return [row.tobytes().decode("ascii") for row in decodeKeys(keys, n)]
+
+
+def packRows(codes):
+    '''Packed keys for a (numPeptides, n) array of residue codes.'''
+    keys = np.zeros(codes.shape[0], dtype = np.uint64)
+    for j in range(codes.shape[1]):
+        keys <<= SHIFT
+        keys |= codes[:, j]
+    return keys
+
+
+def encodable(peptides, n):
+    '''Boolean array of which peptides are n residues long with every residue in ALPHABET.'''
+    return np.array([len(peptide) == n and RESIDUES.issuperset(peptide) for peptide in peptides], dtype = bool)
+
+
+def encodePeptides(peptides, n):
+    '''Packed keys for a list of length n peptides, in the same order.'''
+    if len(peptides) == 0:
+        return np.zeros(0, dtype = np.uint64)
+    buf = "".join(peptides).encode("ascii")
+    if len(buf) != len(peptides) * n:
+        raise ValueError("All peptides must be {} residues long.".format(n))
+    codes = ENCODE[np.frombuffer(buf, dtype = np.uint8)].reshape(len(peptides), n)
+    if not codes.all():
+        raise ValueError("Peptides contain residues that cannot be encoded.")
+    return packRows(codes)
+
+
+def writeNmerText(out, keys, n, chunkSize = 1 << 20):
+    '''Write keys to an open binary file, one peptide per line.'''
+    for start in range(0, len(keys), chunkSize):
+        chars = decodeKeys(keys[start : start + chunkSize], n)
+        lines = np.empty((len(chars), n + 1), dtype = np.uint8)
+        lines[:, :n] = chars
+        lines[:, n] = ord("\n")
+        out.write(lines.tobytes())
+
+
+def readNmerText(fileName, n):
+    '''Packed keys for a file of length n peptides (one per line), in file order.'''
+    buf = open(fileName, "rb").read().replace(b"\r", b"")
+    if len(buf) > 0 and not buf.endswith(b"\n"):
+        buf += b"\n"
+    if len(buf) % (n + 1) != 0:
+        raise ValueError("{} does not hold one {}mer per line.".format(fileName, n))
+    lines = np.frombuffer(buf, dtype = np.uint8).reshape(-1, n + 1)
+    codes = ENCODE[lines[:, :n]]
+    if not codes.all():
+        raise ValueError("{} contains residues that cannot be encoded.".format(fileName))
+    return packRows(codes)
@@ -9,23 +9,195 @@ Edited September 20, 2016:
  - Can distill the data even more. Do not need to store HLA and peptide...
  - HLA is in the filename. Peptide can be inferred from protein file.
    - ordering of peptides is the same as they occur in the contigs.
+
+Edited October 17, 2026:
+ - --format npy writes the scores as a float32 .npy (see scoreFiles.py).
+ - --format sparse only keeps (peptide index, IC50) of peptides at or below --keepThreshold.
+ - Reads from stdin when netMHCpan_file is "-", so the report can be piped in without
+   being written to disk. Each block is checked against its "Number of peptides" line,
+   and a truncated or failed report exits with an error instead of writing output.
+ - --batch parses many reports (a file of files or a glob) in one run with a process pool,
+   reporting the throughput of each file.
+ - Reports of several alleles (netMHCpan -a A,B) are split into one output per allele when
+   the output file name contains {hla}.
 '''
 
 ## Import Libraries
 import sys
 import argparse
+import os
+import re
+import glob
+import time
+import multiprocessing as mp
+import scoreFiles
 
 DEBUG = False
 VERB = False
 
+maxBufferSize = 100000
+
+NUMPEPTIDES = re.compile(r"Number of peptides (\d+)")
+
+
+def hlaName(allele):
+    ## HLA-A*01:01 (as NetMHCpan prints it) and HLA-A01:01 (as given to -a) both become HLA-A01-01, as in job names
+    return allele.replace("*", "").replace(":", "-")
+
+
+class ReportOutputs:
+    '''Score writers for a report: one output, or one per allele when the output name has {hla}.'''
+    def __init__(self, outputFile, fmt, keepThreshold, alleles = None):
+        self.outputFile = outputFile
+        self.fmt = fmt
+        self.keepThreshold = keepThreshold
+        self.demultiplex = "{hla}" in outputFile
+        ## with a list of alleles, only those may (and must) be in the report
+        self.fixed = not self.demultiplex or alleles is not None
+        self.writers = {}
+        try:
+            if not self.demultiplex:
+                self.writers[None] = scoreFiles.ScoreWriter(outputFile, fmt, keepThreshold)
+            else:
+                for allele in alleles or []:
+                    self.add(hlaName(allele))
+        except (IOError, OSError):
+            ## no temporary files of the writers already made are left behind
+            self.discard()
+            raise
+
+    def add(self, hla):
+        self.writers[hla] = scoreFiles.ScoreWriter(self.outputFile.replace("{hla}", hla), self.fmt, self.keepThreshold)
+
+    def writerFor(self, allele):
+        if not self.demultiplex:
+            return self.writers[None]
+        hla = hlaName(allele)
+        if hla not in self.writers:
+            if self.fixed:
+                raise ValueError("Report has predictions for {}, which was not requested.".format(allele))
+            self.add(hla)
+        return self.writers[hla]
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def discard(self):
+        for writer in self.writers.values():
+            writer.discard()
+
+
+def parseScores(lines, outputs, expected = None):
+    ## stream the IC50 column of each prediction block to its output; returns the number of scores
+    ## a block is the header, its rows, a blank line, then a summary line with the row count
+    ## expected is the number of predictions per output (per allele when demultiplexing)
+    scores = []
+    out = None
+    numScores = 0
+    numBlocks = 0
+    blockRows = 0
+    unconfirmedRows = None
+
+    INPREDICTIONS = False
+    for line in lines:
+        if INPREDICTIONS:
+            if line.strip() == "":
+                ## finished this chunk
+                INPREDICTIONS = False
+                unconfirmedRows = blockRows
+                if out is not None:
+                    out.write(scores)
+                    scores = []
+            elif not line.startswith("---"):
+                line = line.strip().rstrip().split()
+                #out.write("{}\t{}\t{}\n".format(line[1], line[2], line[12]))
+                if len(line) < 13:
+                    raise ValueError("Prediction line {} is incomplete.".format(numScores + 1))
+                if blockRows == 0:
+                    ## every row of a block is for the same allele
+                    out = outputs.writerFor(line[1])
+                scores.append(line[12])
+                blockRows += 1
+                numScores += 1
+                if len(scores) >= maxBufferSize:
+                    out.write(scores)
+                    scores = []
+
+        elif line.strip().startswith("Pos"):
+            if unconfirmedRows is not None:
+                raise ValueError("Block {} has no summary line.".format(numBlocks + 1))
+            INPREDICTIONS = True
+            blockRows = 0
+
+        elif unconfirmedRows is not None and NUMPEPTIDES.search(line):
+            numPeptides = int(NUMPEPTIDES.search(line).group(1))
+            if numPeptides != unconfirmedRows:
+                raise ValueError("Block {} has {} predictions but reports {} peptides.".format(numBlocks + 1, unconfirmedRows, numPeptides))
+            unconfirmedRows = None
+            numBlocks += 1
+
+    if INPREDICTIONS or unconfirmedRows is not None:
+        raise ValueError("Report ends in block {}, after {} predictions (truncated).".format(numBlocks + 1, numScores))
+    if numBlocks == 0 and expected != 0:
+        raise ValueError("Report has no predictions.")
+    if expected is not None:
+        for hla, writer in outputs.writers.items():
+            if writer.count != expected:
+                raise ValueError("Report has {} predictions{}, expected {}.".format(writer.count, "" if hla is None else " for " + hla, expected))
+
+    return numScores
+
+
+def parseFile(task):
+    ## parse one report; returns (report, number of scores, seconds, error message or None)
+    netMHCpanFile, outputFile, fmt, keepThreshold, expected, alleles = task
+    timecheck = time.time()
+    outputs = None
+    netMHCpan = None
+    try:
+        outputs = ReportOutputs(outputFile, fmt, keepThreshold, alleles)
+        netMHCpan = sys.stdin if netMHCpanFile == "-" else open(netMHCpanFile, "r")
+        numScores = parseScores(netMHCpan, outputs, expected)
+        outputs.close()
+    except (ValueError, IOError, OSError) as e:
+        ## do not leave a partial output behind
+        if outputs is not None:
+            outputs.discard()
+        return netMHCpanFile, 0, time.time() - timecheck, str(e)
+    finally:
+        if netMHCpan is not None and netMHCpan is not sys.stdin:
+            netMHCpan.close()
+    return netMHCpanFile, numScores, time.time() - timecheck, None
+
+
+def batchFiles(batch, outputDir):
+    ## (report, output) pairs from a file of files (report [tab output] per line) or a glob
+    ## outputs default to the report name plus ".parsed", in outputDir if given
+    if os.path.isfile(batch):
+        pairs = [line.rstrip("\n").split("\t")[:2] for line in open(batch, "r") if line.strip()]
+    else:
+        pairs = [[f] for f in sorted(glob.glob(batch))]
+    for pair in pairs:
+        if len(pair) == 1:
+            pair.append(os.path.join(outputDir, os.path.basename(pair[0])) + ".parsed" if outputDir else pair[0] + ".parsed")
+    return [tuple(pair) for pair in pairs]
+
 
 if __name__ == "__main__":
 
     ## Deal with command line arguments
     parser = argparse.ArgumentParser(description = "Parse NetMHCpan 3.0")
     ## add_argument("name", "(names)", metavar="exampleOfValue - best for optional", type=int, nargs="+", choices=[allowed,values], dest="nameOfVariableInArgsToSaveAs")
-    parser.add_argument("netMHCpan_file", help = "File to parse", type = str)
-    parser.add_argument("output_file", help = "File to write output to", type = str)
+    parser.add_argument("netMHCpan_file", help = "File to parse (- to read from stdin)", type = str, nargs = "?", default = None)
+    parser.add_argument("output_file", help = "File to write output to. {hla} in the name writes one file per allele of a multi-allele report (e.g. HUMAN_{hla}_9_1.pMHC.parsed)", type = str, nargs = "?", default = None)
+    parser.add_argument("--alleles", metavar = "A,B", help = "Alleles the report must hold, as given to netMHCpan -a (with {hla} in output_file)", type = str, default = None)
+    parser.add_argument("--batch", metavar = "fof_or_glob", help = "Parse many reports: a file with one report (and optionally a tab and its output file) per line, or a quoted glob", type = str, default = None)
+    parser.add_argument("--outputDir", metavar = "directory", help = "With --batch, write report.parsed files here (default: next to each report)", type = str, default = None)
+    parser.add_argument("--processes", metavar = "N", help = "With --batch, number of reports to parse at once (default: 1)", type = int, default = 1)
+    parser.add_argument("--expected", metavar = "N", help = "Number of predictions the report should hold (per allele with {hla} in output_file)", type = int, default = None)
+    parser.add_argument("--format", choices = scoreFiles.FORMATS, help = "Output format: one IC50 per line (text, default), float32 .npy (npy) or peptides at or below --keepThreshold only (sparse)", type = str, default = "text")
+    parser.add_argument("--keepThreshold", "--keep-threshold", metavar = "nM", help = "Highest IC50 kept by --format sparse (default: %(default)s)", type = float, default = 500)
     parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
     parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
     args = parser.parse_args()
@@ -39,20 +211,36 @@ if __name__ == "__main__":
 
     #print("Parsing {}".format(args.netMHCpan_file))
 
-    out = open(args.output_file, "w")
+    if args.batch is None:
+        if args.netMHCpan_file is None or args.output_file is None:
+            parser.error("netMHCpan_file and output_file are required without --batch")
+        netMHCpanFile, numScores, seconds, error = parseFile((args.netMHCpan_file, args.output_file, args.format, args.keepThreshold, args.expected, args.alleles.split(",") if args.alleles else None))
+        if error:
+            print("parseNetMHCpanOutput.py: {}: {}".format("stdin" if netMHCpanFile == "-" else netMHCpanFile, error), file = sys.stderr)
+            sys.exit(1)
 
-    INPREDICTIONS = False
-    for line in open(args.netMHCpan_file, "r"):
-        if INPREDICTIONS:
-            if line.strip() == "":
-                ## finished this chunk
-                INPREDICTIONS = False
-            elif not line.startswith("---"):
-                line = line.strip().rstrip().split()
-                #out.write("{}\t{}\t{}\n".format(line[1], line[2], line[12]))
-                out.write("{}\n".format(line[12]))
+    else:
+        ## batch mode
+        pairs = batchFiles(args.batch, args.outputDir)
+        print("Parsing {:,} reports with {} processes...".format(len(pairs), args.processes))
+        timecheck = time.time()
+        totalScores = 0
+        failed = []
+        pool = mp.Pool(args.processes)
+        for netMHCpanFile, numScores, seconds, error in pool.imap_unordered(parseFile, [(inFile, outFile, args.format, args.keepThreshold, None, None) for inFile, outFile in pairs]):
+            if error:
+                failed.append(netMHCpanFile)
+                print("FAILED {}: {}".format(netMHCpanFile, error), file = sys.stderr)
+            else:
+                totalScores += numScores
+                print("{}\t{:,} predictions\t{:.2f} seconds\t{:,.0f} predictions/second".format(netMHCpanFile, numScores, seconds, numScores / seconds if seconds > 0 else 0))
+        pool.close()
+        pool.join()
 
-        elif line.strip().startswith("Pos"):
-            INPREDICTIONS = True
+        seconds = time.time() - timecheck
+        print("Parsed {:,} reports ({:,} predictions) in {:.2f} seconds, {:,.0f} predictions/second.".format(len(pairs) - len(failed), totalScores, seconds, totalScores / seconds if seconds > 0 else 0))
+        if failed:
+            print("{:,} reports failed.".format(len(failed)), file = sys.stderr)
+            sys.exit(1)
 
     #print("done.")
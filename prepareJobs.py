@@ -7,6 +7,28 @@ Date: September 13, 2016
 
 Edited November 4, 2016:
     - Include result parsing (parseNetMHCpanOutput.py)
+
+Edited October 17, 2026:
+    - Write the peptide order of each job (prot{n}_{fnum}_{species}_peptides.npy, packed
+      n-mers in the order NetMHCpan scores them) and a sorted dictionary of all peptides
+      (peptides_{species}.npy, peptide ID = index + 1) for makeDatabaseOfBinders.py.
+    - --scoreFormat sets the format of the parsed scores (see scoreFiles.py), and
+      --keepThreshold the highest IC50 kept by the sparse format.
+    - NetMHCpan output is piped into the parser instead of written to a .pMHC file. With
+      pipefail and the expected number of predictions, a failed or truncated run fails the job.
+    - Contigs are packed into jobs longest predicted run time first (jobCostModel.py), onto
+      the job with the least predicted time. --wallTimePerJob sets the number of jobs from
+      the predicted time instead of --contigsPerJob.
+    - --allelesPerJob runs several alleles in one NetMHCpan call (job names join the alleles
+      with "+"); the parser writes one score file per allele.
+    - --pythonEnv, --netMHCpan and --resultParser override the paths below, e.g. to run
+      the jobs with runJobsLocally.py and stubNetMHCpan.py.
+    - --resubmit writes scripts.resubmit.sh and files.resubmit.fof with only the jobs of a
+      failedJobs.txt (or list of missing .parsed files), reusing the job files in --destDir.
+    - Write a manifest of the jobs (jobs.manifest.jsonl, see jobManifest.py) with their
+      inputs, outputs, expected number of peptides and fasta checksum.
+    - Contig costs use the per allele times of the cost model, for the slowest group of
+      alleles, when it has them (jobRuntimeAnalytics.py).
 '''
 
 ## Import Libraries
@@ -14,6 +36,12 @@ import sys
 import argparse
 import os
 import math
+import heapq
+import numpy as np
+import packedNmers
+import scoreFiles
+import jobCostModel
+import jobManifest
 
 DEBUG = False
 VERB = False
@@ -23,37 +51,69 @@ PYTHON3ENV = "/home/sbrown/bin/pythonvenv/python3/bin/activate"
 NETMHCPAN = "/home/sbrown/bin/netMHCpan-3.0/netMHCpan"
 RESPARSER = "/home/sbrown/scripts/parseNetMHCpanOutput.py"
 
+## packed peptides of every job, for the peptide dictionary
+allPeptides = []
+
+
+
+def scoreFormatOptions():
+    ## parser options for the chosen score format
+    if args.scoreFormat == "text":
+        return ""
+    if args.scoreFormat == "sparse":
+        return " --format sparse --keepThreshold {:g}".format(args.keepThreshold)
+    return " --format {}".format(args.scoreFormat)
+
+
+def packContigs(costs, order, numJobs):
+    ## longest processing time first: each contig goes to the job with the least predicted time so far
+    ## order is the contigs by decreasing cost; returns the job of each contig and the predicted time of each job
+    jobOf = [0 for x in range(0, len(costs))]
+    heap = [(0.0, i) for i in range(0, numJobs)]
+    for c in order:
+        load, i = heapq.heappop(heap)
+        jobOf[c] = i
+        heapq.heappush(heap, (load + costs[c], i))
+    loads = [0.0 for x in range(0, numJobs)]
+    for load, i in heap:
+        loads[i] = load
+    return jobOf, loads
 
 
 def processContigsWriteFiles(contigFile, n):
     #scripts = ""
     #fof = ""
 
-    contigs = open(contigFile, "r").readlines()
-    ## need to sort and then distribute.
-    contigs.sort(key = len, reverse = True)
-    numJobs = math.ceil(len(contigs) / args.contigsPerJob)
+    contigs = [line.rstrip() for line in open(contigFile, "r") if line.strip()]
+    if not contigs:
+        print("No contigs in {}, so no {}mer jobs.".format(contigFile, n))
+        return
+    ## predicted seconds of each contig in a job, for the slowest group of alleles
+    groupSeconds = max(sum(costModel.windowSeconds(n, allele) for allele in h.split("+")) for h in hlas)
+    costs = [groupSeconds * max(len(seq) - n + 1, 0) for seq in contigs]
+    order = sorted(range(len(costs)), key = lambda c: costs[c], reverse = True)
+    if args.wallTimePerJob:
+        capacity = args.wallTimePerJob - costModel.intercept(n)
+        if capacity <= 0:
+            raise ValueError("--wallTimePerJob is less than the predicted start up time of a job ({:.1f} s).".format(costModel.intercept(n)))
+        if max(costs) > capacity:
+            print("Warning: the longest contig of {} alone is predicted to take {:.1f} s.".format(contigFile, costModel.intercept(n) + max(costs)))
+        numJobs = max(1, int(math.ceil(sum(costs) / capacity)))
+        jobOf, loads = packContigs(costs, order, numJobs)
+        ## packing is not perfect; add jobs until the longest fits (if any contig can)
+        while max(loads) > capacity and max(costs) <= capacity:
+            numJobs += 1
+            jobOf, loads = packContigs(costs, order, numJobs)
+    else:
+        numJobs = int(math.ceil(len(contigs) / args.contigsPerJob))
+        jobOf, loads = packContigs(costs, order, numJobs)
     if VERB: print("{} jobs will be created for {}.".format(numJobs, contigFile))
-    files = ["" for x in range(0, numJobs)]
-
-    ## add sequences to files back and forth (so that total length in each is similar)
-    i = 0
-    ASCENDING = True
-    for seq in contigs:
-        seq = seq.rstrip()
-        files[i] += ">sim\n{}\n".format(seq)
+    print("{} jobs for {}: predicted {:.1f} s for the longest, {:.1f} s on average.".format(numJobs, contigFile, costModel.intercept(n) + max(loads), costModel.intercept(n) + sum(loads) / numJobs))
 
-        if ASCENDING:
-            i += 1
-        else:
-            i -= 1
-        ## catch edges
-        if i == numJobs:
-            ASCENDING = False
-            i -= 1
-        elif i == -1:
-            ASCENDING = True
-            i += 1
+    jobContigs = [[] for x in range(0, numJobs)]
+    for c in order:
+        jobContigs[jobOf[c]].append(contigs[c])
+    files = ["".join(">sim\n{}\n".format(seq) for seq in seqs) for seqs in jobContigs]
 
     ## write files and add line to script holder.
     ## need to write protein file for this job, and then add it to the fof and scripts files.
@@ -61,9 +121,19 @@ def processContigsWriteFiles(contigFile, n):
 
     for seqs in files:
         fnum += 1
-        out = open(os.path.join(args.destDir, "prot{}_{}_{}.fa".format(n, fnum, args.species)), "w")
+        fastaFile = os.path.join(args.destDir, "prot{}_{}_{}.fa".format(n, fnum, args.species))
+        out = open(fastaFile, "w")
         out.write(seqs)
         out.close()
+        fastaMd5 = jobManifest.fileChecksum(fastaFile)
+
+        ## NetMHCpan scores every n-mer window of each sequence in turn; the line breaks keep windows within a contig
+        peptides = packedNmers.packWindows(packedNmers.encodeSequence("\n".join(jobContigs[fnum - 1])), n)
+        if len(peptides) != sum(max(len(seq) - n + 1, 0) for seq in jobContigs[fnum - 1]):
+            raise ValueError("{} has residues that cannot be packed.".format(contigFile))
+        peptideFile = os.path.join(args.destDir, "prot{}_{}_{}_peptides.npy".format(n, fnum, args.species))
+        np.save(peptideFile, peptides)
+        allPeptides.append(np.unique(peptides))
 
         if VERB: print("Going through each HLA for file {}...".format(fnum))
         hscript = ""
@@ -72,15 +142,20 @@ def processContigsWriteFiles(contigFile, n):
             if DEBUG: print("Setting up jobs for {}...".format(hlas[h][0]))
 
             ## add to script and fof files.
-            ## script line like "TCGA-A6-6781-01A-22D-A270-10    source /home/sbrown/bin/pythonvenv/python3/bin/activate;/home/sbrown/bin/netMHCpan-3.0/netMHCpan -tdir tmpdirXXXXXX -a HLA-C07:01 -f peptides.fa > bindingRes.pMHC;"
-            hscript += "{}_{}_{}_{}\tsource {}; {} -tdir tmpdirXXXXXX -a {} -l {} -f {} > {}_{}_{}_{}.pMHC;".format(args.species, h, n, fnum, PYTHON3ENV, NETMHCPAN, hlas[h][0], n, "prot{}_{}_{}.fa".format(n, fnum, args.species), args.species, h, n, fnum)
-            hscript += "python {} {}_{}_{}_{}.pMHC {}_{}_{}_{}.pMHC.parsed; rm {}_{}_{}_{}.pMHC;".format(RESPARSER, args.species, h, n, fnum, args.species, h, n, fnum, args.species, h, n, fnum)
+            ## script line like "HUMAN_HLA-C07-01_8_1    source /home/sbrown/bin/pythonvenv/python3/bin/activate; set -o pipefail; /home/sbrown/bin/netMHCpan-3.0/netMHCpan -tdir tmpdirXXXXXX -a HLA-C07:01 -l 8 -f prot8_1_HUMAN.fa | python parseNetMHCpanOutput.py - HUMAN_HLA-C07-01_8_1.pMHC.parsed --expected 12345;"
+            hscript += "{}_{}_{}_{}\t{}set -o pipefail; {} -tdir tmpdirXXXXXX -a {} -l {} -f {} | ".format(args.species, h, n, fnum, "source {}; ".format(args.pythonEnv) if args.pythonEnv else "", args.netMHCpan, hlas[h][0], n, "prot{}_{}_{}.fa".format(n, fnum, args.species))
+            if "," in hlas[h][0]:
+                ## one score file per allele
+                hscript += "python {} - {}_{{hla}}_{}_{}.pMHC.parsed --alleles {} --expected {}{};".format(args.resultParser, args.species, n, fnum, hlas[h][0], len(peptides), scoreFormatOptions())
+            else:
+                hscript += "python {} - {}_{}_{}_{}.pMHC.parsed --expected {}{};".format(args.resultParser, args.species, h, n, fnum, len(peptides), scoreFormatOptions())
             hscript += "\n"
 
             hfof += "{}\n".format(os.path.join(args.destDir, "prot{}_{}_{}.fa".format(n, fnum, args.species)))
 
             hlas[h][1] += hscript
             hlas[h][2] += hfof
+            hlas[h][3].append(jobManifest.jobRecord("{}_{}_{}_{}".format(args.species, h, n, fnum), fastaFile, fastaMd5, peptideFile, len(peptides), args.scoreFormat))
 
             hscript = ""
             hfof = ""
@@ -96,6 +171,52 @@ def processContigsWriteFiles(contigFile, n):
     '''
 
 
+def resubmitJobs(listFile):
+    '''Write the scripts.sh and files.fof lines of the jobs in listFile to scripts.resubmit.sh and files.resubmit.fof.'''
+    scripts = [line for line in open(os.path.join(args.destDir, "scripts.sh"), "r") if line.strip()]
+    fof = [line for line in open(os.path.join(args.destDir, "files.fof"), "r") if line.strip()]
+    if len(scripts) != len(fof):
+        raise ValueError("scripts.sh and files.fof in {} do not have the same number of jobs.".format(args.destDir))
+
+    ## job name like HUMAN_HLA-A01-01+HLA-B07-02_8_1; an output like HUMAN_HLA-B07-02_8_1.pMHC.parsed belongs to that job
+    jobByOutput = {}
+    jobNames = []
+    for line in scripts:
+        jobname = line.split("\t", 1)[0]
+        jobNames.append(jobname)
+        species, hla, n, fnum = jobname.split("_")
+        for allele in hla.split("+"):
+            jobByOutput["{}_{}_{}_{}".format(species, allele, n, fnum)] = jobname
+
+    jobSet = set(jobNames)
+    wanted = set()
+    unknown = []
+    for line in open(listFile, "r"):
+        name = os.path.basename(line.strip())
+        if not name:
+            continue
+        if name.endswith(".parsed"):
+            name = jobByOutput.get(name.split(".")[0])
+        if name in jobSet:
+            wanted.add(name)
+        else:
+            unknown.append(line.strip())
+    if unknown:
+        print("{} entries of {} are not jobs or outputs of {}/scripts.sh, e.g. {}".format(len(unknown), listFile, args.destDir, unknown[0]))
+
+    scriptFile = open(os.path.join(args.destDir, "scripts.resubmit.sh"), "w")
+    fofFile = open(os.path.join(args.destDir, "files.resubmit.fof"), "w")
+    for jobname, script, fastaFile in zip(jobNames, scripts, fof):
+        if jobname in wanted:
+            if not os.path.exists(fastaFile.rstrip("\n")):
+                raise ValueError("{} of job {} is missing.".format(fastaFile.rstrip("\n"), jobname))
+            scriptFile.write(script)
+            fofFile.write(fastaFile)
+    scriptFile.close()
+    fofFile.close()
+    print("{} of {} jobs to resubmit.".format(len(wanted), len(jobNames)))
+
+
 if __name__ == "__main__":
 
     ## Deal with command line arguments
@@ -107,8 +228,17 @@ if __name__ == "__main__":
     parser.add_argument("--contig10mer", metavar = "file", help = "10mer contig file", type = str, default = None)
     parser.add_argument("--contig11mer", metavar = "file", help = "11mer contig file", type = str, default = None)
     parser.add_argument("--contigsPerJob", metavar = "N", help = "Number of contigs per job", type = int, default = None)
+    parser.add_argument("--wallTimePerJob", metavar = "seconds", help = "Make as many jobs as needed for each to be predicted to take this long (instead of --contigsPerJob)", type = float, default = None)
+    parser.add_argument("--costModel", metavar = "file", help = "Job cost model (JSON from jobCostModel.py) for --wallTimePerJob and packing (default: built in estimate)", type = str, default = None)
     parser.add_argument("--hlaAlleleList", metavar = "file", help = "File of HLA alleles to use", type = str, default = None)
+    parser.add_argument("--pythonEnv", metavar = "activate", help = "Python environment to source in each job, empty for none (default: %(default)s)", type = str, default = PYTHON3ENV)
+    parser.add_argument("--netMHCpan", metavar = "command", help = "NetMHCpan command (default: %(default)s)", type = str, default = NETMHCPAN)
+    parser.add_argument("--resultParser", metavar = "file", help = "parseNetMHCpanOutput.py to use (default: %(default)s)", type = str, default = RESPARSER)
+    parser.add_argument("--allelesPerJob", metavar = "N", help = "Number of alleles predicted by each NetMHCpan call (default: 1)", type = int, default = 1)
     parser.add_argument("--destDir", metavar = "directory", help = "Directory to write output files to", type = str, default = None)
+    parser.add_argument("--scoreFormat", choices = scoreFiles.FORMATS, help = "Format of the parsed IC50 scores (default: text)", type = str, default = "text")
+    parser.add_argument("--keepThreshold", metavar = "nM", help = "Highest IC50 kept with --scoreFormat sparse (default: %(default)s)", type = float, default = 500)
+    parser.add_argument("--resubmit", metavar = "file", help = "failedJobs.txt from tallyParsedData_multiProc.py (or a list of missing .parsed files): only write scripts.resubmit.sh and files.resubmit.fof for these jobs of --destDir", type = str, default = None)
     parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
     parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
     args = parser.parse_args()
@@ -117,10 +247,23 @@ if __name__ == "__main__":
     DEBUG = args.DEBUG
     VERB = args.VERB
 
+    if args.resubmit:
+        ## the job files are already in destDir
+        resubmitJobs(args.resubmit)
+        print("done.")
+        sys.exit()
 
+    if not args.contigsPerJob and not args.wallTimePerJob:
+        parser.error("one of --contigsPerJob or --wallTimePerJob is required")
+    costModel = jobCostModel.CostModel.load(args.costModel) if args.costModel else jobCostModel.CostModel()
+
+
+    ## keyed by job HLA name; values are the -a argument, the script and fof lines and the manifest lines of the jobs
     hlas = {}
-    for line in open(args.hlaAlleleList, "r"):
-        hlas[line.rstrip().replace(":","-")] = [line.rstrip(),"",""]
+    alleles = [line.rstrip() for line in open(args.hlaAlleleList, "r") if line.strip()]
+    for start in range(0, len(alleles), args.allelesPerJob):
+        group = alleles[start : start + args.allelesPerJob]
+        hlas["+".join(allele.replace(":","-") for allele in group)] = [",".join(group),"","",[]]
 
 
     ## flush output files
@@ -156,4 +299,12 @@ if __name__ == "__main__":
     scriptFile.close()
     fofFile.close()
 
+    ## in the same order as scripts.sh
+    jobManifest.writeManifest(jobManifest.manifestFileName(args.destDir), [record for h in hlas for record in hlas[h][3]])
+
+    ## keys of different lengths never collide, so all lengths share one dictionary
+    dictionary = np.unique(np.concatenate(allPeptides)) if allPeptides else np.zeros(0, dtype = np.uint64)
+    np.save(os.path.join(args.destDir, "peptides_{}.npy".format(args.species)), dictionary)
+    if VERB: print("{} unique peptides in the peptide dictionary.".format(len(dictionary)))
+
     print("done.")
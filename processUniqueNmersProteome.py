@@ -1,74 +1,449 @@
-'''
-Process unique n-mers from the proteome
-Goes through proteome fasta files and saves all unique n-mers
-
-Date: August 18, 2016
-@author: sbrown
-'''
-
-## Import Libraries
-import sys
-import argparse
-
-DEBUG = False
-VERB = False
-
-nmers = set()
-
-if __name__ == "__main__":
-
-    ## Deal with command line arguments
-    parser = argparse.ArgumentParser(description = "Process unique n-mers from the proteome")
-    ## add_argument("name", "(names)", metavar="exampleOfValue - best for optional", type=int, nargs="+", choices=[allowed,values], dest="nameOfVariableInArgsToSaveAs")
-    parser.add_argument("--fasta", nargs="+", help = "List of fasta files", type = str)
-    parser.add_argument("-n", "--nMerLength", help = "Length of n-mer to process", dest = "nmer", type = int)
-    parser.add_argument("outputFile", help = "File to write results to", type = str)
-    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
-    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
-    args = parser.parse_args()
-
-    ## Set Global Vars
-    DEBUG = args.DEBUG
-    VERB = args.VERB
-
-    #print(args)
-    ## arguments accessible as args.cmdline_arg or args.cmdflg or args.destName
-    ## can test using parser.parse_args("-cmdflg value other_value".split())
-
-    ## read fasta and cut into nmers.
-
-    protSeq = ""
-    totalCount = 0
-    uniqueCount = 0
-
-    print("Reading through fasta files...")
-    for f in args.fasta:
-        for line in open(f, "r"):
-            if line.startswith(">"):
-                ## process previous sequence
-                for i in range(0,len(protSeq) - args.nmer + 1):
-                    nmers.add(protSeq[i : i + args.nmer])
-                    totalCount += 1
-                protSeq = ""
-            else:
-                protSeq += line.rstrip()
-    
-    ## process the final protein in the file.
-    for i in range(0,len(protSeq) - args.nmer + 1):
-        nmers.add(protSeq[i : i + args.nmer])
-        totalCount += 1
-    protSeq = ""
-    
-
-
-    ## write file.
-    print("Writing unique {}mers...".format(args.nmer))
-    out = open(args.outputFile, "w")
-    while len(nmers) > 0:
-        out.write("{}\n".format(nmers.pop()))
-        uniqueCount += 1
-    out.close()
-
-    print("There are {} total {}mers found.".format(totalCount, args.nmer))
-    print("{} are unique.".format(uniqueCount))
-    print("done.")
+'''
+Process unique n-mers from the proteome
+Goes through proteome fasta files and saves all unique n-mers
+
+Date: August 18, 2016
+@author: sbrown
+
+Edited October 17, 2026:
+    - Packed mode (--packed): n-mers are stored as 5 bit per residue integers and
+      deduplicated with sorted NumPy arrays instead of a set of strings.
+    - Several lengths (-n 8 9 10 11) can be extracted in one pass over the fasta files.
+    - Sharded mode (--sharded): worker processes scan chunks of the fasta files and spill
+      packed n-mers to hash partitions on disk, which are then deduplicated in parallel.
+      Peak memory is bounded by --memoryBudget rather than by the proteome size.
+    - Read fasta files with fastaReader (memory-mapped, cached index) instead of
+      joining sequence lines with +=, which was quadratic for long proteins.
+    - --saveBinary keeps a sorted .npy of the packed n-mers, and --update adds new fasta
+      files to an existing unique n-mer set, writing the merged set and the delta of
+      newly seen n-mers (--deltaOutput) so only those need contigs and predictions.
+    - --provenance writes an index from each n-mer to its source proteins and positions.
+'''
+
+## Import Libraries
+import sys
+import argparse
+import os
+import math
+import glob
+import shutil
+import tempfile
+import multiprocessing as mp
+import numpy as np
+import packedNmers
+import fastaReader
+import nmerProvenance
+
+DEBUG = False
+VERB = False
+
+nmers = set()
+
+## number of unique packed n-mer arrays to hold before merging them
+maxPendingArrays = 16
+
+## bytes of working memory per fasta byte while a chunk is packed, partitioned and spilled
+SHARD_BYTES_PER_RESIDUE = 40
+## bytes of working memory per packed n-mer while a partition or merge range is sorted
+SORT_BYTES_PER_NMER = 24
+
+## Fibonacci hashing constant, spreads packed keys evenly over partitions
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+## fasta files opened by this process, so each worker loads an index only once
+openFastas = {}
+
+
+def getFasta(fastaFile):
+    if fastaFile not in openFastas:
+        openFastas[fastaFile] = fastaReader.FastaFile(fastaFile)
+    return openFastas[fastaFile]
+
+
+def recordsAsBuffer(fasta, first, last):
+    ## sequences of records first..last-1 joined by newlines, which pack as sequence breaks.
+    return b"\n".join(fasta.sequence(i) for i in range(first, last))
+
+
+def readFastaAsBuffer(fastaFile):
+    fasta = getFasta(fastaFile)
+    return recordsAsBuffer(fasta, 0, len(fasta))
+
+
+def numSkippedWindows(buf, n, numPacked):
+    ## windows lost to residues that cannot be packed
+    return sum(max(0, len(seq) - n + 1) for seq in buf.split(b"\n")) - numPacked
+
+
+def mergeUnique(arrays):
+    if len(arrays) == 1:
+        return np.unique(arrays[0])
+    return np.unique(np.concatenate(arrays))
+
+
+def processPacked(fastaFiles, lengths, provenance = False):
+    uniques = {n: [] for n in lengths}
+    totalCounts = {n: 0 for n in lengths}
+    skippedCounts = {n: 0 for n in lengths}
+    ## with provenance, every occurrence is kept: [keys, protein ids, positions] per length
+    sites = {n: [[], [], []] for n in lengths}
+    proteinNames = []
+
+    for f in fastaFiles:
+        if VERB: print("Processing {}...".format(f))
+        buf = readFastaAsBuffer(f)
+        codes = packedNmers.encodeSequence(buf)
+        ## residues that are neither a break nor encodable
+        numUnknown = len(buf) - buf.count(b"\n") - np.count_nonzero(codes)
+
+        if provenance:
+            fasta = getFasta(f)
+            firstProteinId = len(proteinNames)
+            proteinNames.extend(fasta.header(i) for i in range(len(fasta)))
+            ## buffer offset of each record (records are joined by one break)
+            recordStarts = np.cumsum([0] + [length + 1 for length in fasta.lengths[:-1]])
+
+        for n in lengths:
+            if provenance:
+                keys, bufPositions = packedNmers.packWindows(codes, n, returnPositions = True)
+                record = np.searchsorted(recordStarts, bufPositions, side = "right") - 1
+                sites[n][0].append(keys)
+                sites[n][1].append((record + firstProteinId).astype(np.uint32))
+                sites[n][2].append((bufPositions - recordStarts[record]).astype(np.uint32))
+            else:
+                keys = packedNmers.packWindows(codes, n)
+            totalCounts[n] += len(keys)
+            if numUnknown > 0:
+                skippedCounts[n] += numSkippedWindows(buf, n, len(keys))
+            uniques[n].append(np.unique(keys))
+            if len(uniques[n]) >= maxPendingArrays:
+                uniques[n] = [mergeUnique(uniques[n])]
+
+    for n in lengths:
+        if len(uniques[n]) == 0:
+            uniques[n] = np.zeros(0, dtype = np.uint64)
+        else:
+            uniques[n] = mergeUnique(uniques[n])
+        if skippedCounts[n] > 0:
+            print("Warning: skipped {} {}mers containing residues that cannot be packed ({}).".format(skippedCounts[n], n, packedNmers.ALPHABET))
+
+    if provenance:
+        for n in lengths:
+            sites[n] = [np.concatenate(arrays) if arrays else np.zeros(0, dtype = np.uint64) for arrays in sites[n]]
+        return uniques, totalCounts, sites, proteinNames
+    return uniques, totalCounts
+
+
+def parseMemory(value):
+    ## bytes from strings like 8G, 500M or 1048576
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def splitFasta(fastaFile, chunkBytes):
+    ## runs of whole records holding about chunkBytes residues each
+    fasta = getFasta(fastaFile)
+    chunks = []
+    first = 0
+    chunkLength = 0
+    for i in range(len(fasta)):
+        chunkLength += fasta.lengths[i]
+        if chunkLength >= chunkBytes:
+            chunks.append((fastaFile, first, i + 1))
+            first = i + 1
+            chunkLength = 0
+    if first < len(fasta):
+        chunks.append((fastaFile, first, len(fasta)))
+    return chunks
+
+
+def partitionOf(keys, numPartitions):
+    return ((keys * HASH_MULTIPLIER) >> np.uint64(32)) % np.uint64(numPartitions)
+
+
+def spillChunk(task):
+    ## worker: pack one fasta chunk and append its n-mers to the partition spill files
+    (fastaFile, first, last), lengths, numPartitions, spillDir = task
+    buf = recordsAsBuffer(getFasta(fastaFile), first, last)
+
+    codes = packedNmers.encodeSequence(buf)
+    numUnknown = len(buf) - buf.count(b"\n") - np.count_nonzero(codes)
+    totalCounts = {}
+    skippedCounts = {}
+    for n in lengths:
+        keys = packedNmers.packWindows(codes, n)
+        totalCounts[n] = len(keys)
+        skippedCounts[n] = numSkippedWindows(buf, n, len(keys)) if numUnknown > 0 else 0
+
+        keys = np.unique(keys)
+        parts = partitionOf(keys, numPartitions)
+        order = np.argsort(parts, kind = "mergesort")
+        keys = keys[order]
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(parts.astype(np.intp), minlength = numPartitions))))
+        for p in range(numPartitions):
+            if bounds[p + 1] > bounds[p]:
+                ## each worker process appends to its own spill files
+                spillFile = os.path.join(spillDir, "{}mer_part{}_{}.bin".format(n, p, os.getpid()))
+                with open(spillFile, "ab") as out:
+                    keys[bounds[p] : bounds[p + 1]].tofile(out)
+    return totalCounts, skippedCounts
+
+
+def dedupePartition(task):
+    ## worker: unique sorted n-mers of one partition, saved as .npy
+    n, p, spillDir = task
+    spillFiles = glob.glob(os.path.join(spillDir, "{}mer_part{}_*.bin".format(n, p)))
+    keys = np.unique(np.concatenate([np.fromfile(f, dtype = np.uint64) for f in spillFiles])) if spillFiles else np.zeros(0, dtype = np.uint64)
+    np.save(os.path.join(spillDir, "{}mer_unique{}.npy".format(n, p)), keys)
+    for f in spillFiles:
+        os.remove(f)
+    return len(keys)
+
+
+def mergedPartitionChunks(partitionFiles, memoryBudget):
+    ## partitions are disjoint and sorted, so merging by key ranges gives sorted output
+    parts = [np.load(f, mmap_mode = "r") for f in partitionFiles]
+    parts = [part for part in parts if len(part) > 0]
+    total = sum(len(part) for part in parts)
+    numRanges = max(1, int(math.ceil(total * SORT_BYTES_PER_NMER / float(memoryBudget))))
+
+    splitters = []
+    if numRanges > 1:
+        step = max(1, total // (numRanges * 100))
+        sample = np.sort(np.concatenate([part[::step] for part in parts]))
+        splitters = np.unique(sample[np.linspace(0, len(sample), numRanges, endpoint = False).astype(np.intp)[1:]])
+
+    bounds = [0 for part in parts]
+    for hi in list(splitters) + [None]:
+        pieces = []
+        for i, part in enumerate(parts):
+            end = len(part) if hi is None else int(np.searchsorted(part, hi))
+            pieces.append(part[bounds[i] : end])
+            bounds[i] = end
+        if pieces:
+            yield np.sort(np.concatenate(pieces))
+
+
+def processSharded(fastaFiles, lengths, numProcesses, memoryBudget, spillDir):
+    totalBytes = sum(os.path.getsize(f) for f in fastaFiles)
+    ## each process packs one chunk at a time
+    chunkBytes = max(1 << 20, memoryBudget // (numProcesses * SHARD_BYTES_PER_RESIDUE))
+    ## a partition must fit in one process's share of the budget when it is deduplicated
+    numPartitions = max(numProcesses, int(math.ceil(totalBytes * SORT_BYTES_PER_NMER * numProcesses / float(memoryBudget))))
+
+    chunks = []
+    for f in fastaFiles:
+        chunks.extend(splitFasta(f, chunkBytes))
+    print("Scanning {} fasta chunks into {} partitions with {} processes...".format(len(chunks), numPartitions, numProcesses))
+
+    totalCounts = {n: 0 for n in lengths}
+    skippedCounts = {n: 0 for n in lengths}
+    uniqueCounts = {n: 0 for n in lengths}
+
+    pool = mp.Pool(numProcesses)
+    try:
+        tasks = [(chunk, lengths, numPartitions, spillDir) for chunk in chunks]
+        for chunkNum, (chunkTotals, chunkSkipped) in enumerate(pool.imap_unordered(spillChunk, tasks), start = 1):
+            for n in lengths:
+                totalCounts[n] += chunkTotals[n]
+                skippedCounts[n] += chunkSkipped[n]
+            if VERB: print("{:,} of {:,} chunks spilled...".format(chunkNum, len(chunks)), end = "\r")
+
+        print("Deduplicating partitions...")
+        tasks = [(n, p, spillDir) for n in lengths for p in range(numPartitions)]
+        for (n, p, spillDir), numUnique in zip(tasks, pool.map(dedupePartition, tasks, chunksize = 1)):
+            uniqueCounts[n] += numUnique
+    finally:
+        pool.terminate()
+        pool.join()
+
+    partitionFiles = {}
+    for n in lengths:
+        if skippedCounts[n] > 0:
+            print("Warning: skipped {} {}mers containing residues that cannot be packed ({}).".format(skippedCounts[n], n, packedNmers.ALPHABET))
+        partitionFiles[n] = [os.path.join(spillDir, "{}mer_unique{}.npy".format(n, p)) for p in range(numPartitions)]
+
+    return partitionFiles, uniqueCounts, totalCounts
+
+
+def binaryFileName(textFile):
+    return os.path.splitext(textFile)[0] + ".npy"
+
+
+def writeSortedNmers(textFile, n, chunks, total, saveBinary):
+    ## chunks are sorted arrays of packed keys, in order; the .npy copy is written alongside
+    out = open(textFile, "wb")
+    if saveBinary and total == 0:
+        ## an empty file cannot be memory-mapped
+        np.save(binaryFileName(textFile), np.zeros(0, dtype = np.uint64))
+        saveBinary = False
+    binOut = np.lib.format.open_memmap(binaryFileName(textFile), mode = "w+", dtype = np.uint64, shape = (total,)) if saveBinary else None
+    written = 0
+    for chunk in chunks:
+        packedNmers.writeNmerText(out, chunk, n)
+        if saveBinary:
+            binOut[written : written + len(chunk)] = chunk
+        written += len(chunk)
+    out.close()
+    if saveBinary:
+        binOut.flush()
+        del binOut
+    return written
+
+
+def loadUniqueNmers(fileName, n):
+    ## sorted packed keys from a .npy written with --saveBinary (memory-mapped), or from a text file
+    if not fileName.endswith(".npy") and os.path.exists(binaryFileName(fileName)):
+        fileName = binaryFileName(fileName)
+    if fileName.endswith(".npy"):
+        return np.load(fileName, mmap_mode = "r")
+    return np.unique(packedNmers.readNmerText(fileName, n))
+
+
+def newNmers(existing, keys):
+    ## keys (sorted, unique) that are not in existing (sorted)
+    if len(existing) == 0:
+        return keys
+    idx = np.searchsorted(existing, keys)
+    found = idx < len(existing)
+    found[found] = existing[idx[found]] == keys[found]
+    return keys[~found]
+
+
+def mergeSortedChunks(existing, delta, chunkSize = 1 << 24):
+    ## sorted union of existing and delta (disjoint), chunk by chunk so existing may stay memory-mapped
+    idx = np.searchsorted(existing, delta)
+    deltaStart = 0
+    for start in range(0, max(len(existing), 1), chunkSize):
+        end = min(start + chunkSize, len(existing))
+        ## delta keys sorting after the last existing key go with the last chunk
+        deltaEnd = len(delta) if end == len(existing) else int(np.searchsorted(idx, end))
+        yield np.insert(np.asarray(existing[start : end]), idx[deltaStart : deltaEnd] - start, delta[deltaStart : deltaEnd])
+        deltaStart = deltaEnd
+
+
+def writeResults(n, uniqueChunks, numUnique):
+    ## write the unique n-mers, or with --update the delta and the merged set
+    outputFile = args.outputFile.replace("{n}", str(n))
+    if not args.update:
+        print("Writing unique {}mers...".format(n))
+        writeSortedNmers(outputFile, n, uniqueChunks, numUnique, args.saveBinary)
+        return
+
+    existing = loadUniqueNmers(args.update.replace("{n}", str(n)), n)
+    delta = [newNmers(existing, chunk) for chunk in uniqueChunks]
+    delta = np.concatenate(delta) if delta else np.zeros(0, dtype = np.uint64)
+
+    print("Writing {} new {}mers...".format(len(delta), n))
+    writeSortedNmers(args.deltaOutput.replace("{n}", str(n)), n, [delta], len(delta), args.saveBinary)
+    print("Writing merged unique {}mers...".format(n))
+    writeSortedNmers(outputFile, n, mergeSortedChunks(existing, delta), len(existing) + len(delta), args.saveBinary)
+    print("{} {}mers were already in {}; the merged set has {}.".format(numUnique - len(delta), n, args.update.replace("{n}", str(n)), len(existing) + len(delta)))
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Process unique n-mers from the proteome")
+    ## add_argument("name", "(names)", metavar="exampleOfValue - best for optional", type=int, nargs="+", choices=[allowed,values], dest="nameOfVariableInArgsToSaveAs")
+    parser.add_argument("--fasta", nargs="+", help = "List of fasta files", type = str)
+    parser.add_argument("-n", "--nMerLength", nargs = "+", help = "Length(s) of n-mer to process", dest = "nmer", type = int)
+    parser.add_argument("outputFile", help = "File to write results to. With several lengths, must contain {n} (e.g. output_directory/{n}mers.txt)", type = str)
+    parser.add_argument("--packed", action = "store_true", help = "Store n-mers as packed integers in NumPy arrays (implied by several lengths)")
+    parser.add_argument("--saveBinary", action = "store_true", help = "Also save the sorted packed n-mers as .npy next to each text output")
+    parser.add_argument("--update", metavar = "file", help = "Existing unique n-mer file (.npy from --saveBinary, or text) to add the fasta files to. Implies --packed", type = str, default = None)
+    parser.add_argument("--deltaOutput", metavar = "file", help = "With --update, file to write only the newly seen n-mers to", type = str, default = None)
+    parser.add_argument("--provenance", metavar = "prefix", help = "Also write an index of the source protein and position of each n-mer (see nmerProvenance.py). Packed mode only", type = str, default = None)
+    parser.add_argument("--sharded", action = "store_true", help = "Out-of-core packed mode: spill n-mers to hash partitions on disk and deduplicate them in parallel")
+    parser.add_argument("--processes", metavar = "N", help = "Number of processes for --sharded (default: 1)", type = int, default = 1)
+    parser.add_argument("--memoryBudget", "--memory-budget", metavar = "SIZE", help = "Approximate peak memory for --sharded, e.g. 16G (default: 4G)", type = str, default = "4G")
+    parser.add_argument("--spillDir", metavar = "directory", help = "Directory for --sharded partition files (default: next to the output file)", type = str, default = None)
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    #print(args)
+    ## arguments accessible as args.cmdline_arg or args.cmdflg or args.destName
+    ## can test using parser.parse_args("-cmdflg value other_value".split())
+
+    if len(args.nmer) > 1:
+        for fileArg in [args.outputFile, args.update, args.deltaOutput, args.provenance]:
+            if fileArg and "{n}" not in fileArg:
+                sys.exit("File names must contain {n} when extracting several n-mer lengths.")
+
+    if args.update and not args.deltaOutput:
+        sys.exit("--update requires --deltaOutput.")
+
+    if args.provenance and (args.sharded or args.update):
+        sys.exit("--provenance cannot be combined with --sharded or --update.")
+
+    if args.sharded:
+        spillRoot = args.spillDir if args.spillDir else (os.path.dirname(os.path.abspath(args.outputFile)))
+        spillDir = tempfile.mkdtemp(prefix = "nmer_spill_", dir = spillRoot)
+        try:
+            memoryBudget = parseMemory(args.memoryBudget)
+            partitionFiles, uniqueCounts, totalCounts = processSharded(args.fasta, args.nmer, args.processes, memoryBudget, spillDir)
+            for n in args.nmer:
+                writeResults(n, mergedPartitionChunks(partitionFiles[n], memoryBudget), uniqueCounts[n])
+        finally:
+            shutil.rmtree(spillDir)
+
+        for n in args.nmer:
+            print("There are {} total {}mers found.".format(totalCounts[n], n))
+            print("{} are unique.".format(uniqueCounts[n]))
+        print("done.")
+        sys.exit()
+
+    if args.packed or args.update or args.provenance or len(args.nmer) > 1:
+        ## read fasta once, cutting into all n-mer lengths.
+        print("Reading through fasta files...")
+        if args.provenance:
+            uniques, totalCounts, sites, proteinNames = processPacked(args.fasta, args.nmer, provenance = True)
+        else:
+            uniques, totalCounts = processPacked(args.fasta, args.nmer)
+
+        for n in args.nmer:
+            writeResults(n, [uniques[n]], len(uniques[n]))
+
+            if args.provenance:
+                print("Writing {}mer provenance index...".format(n))
+                nmerProvenance.writeIndex(args.provenance.replace("{n}", str(n)), sites[n][0], sites[n][1], sites[n][2], proteinNames)
+                sites[n] = None
+
+            print("There are {} total {}mers found.".format(totalCounts[n], n))
+            print("{} are unique.".format(len(uniques[n])))
+        print("done.")
+        sys.exit()
+    args.nmer = args.nmer[0]
+
+    ## read fasta and cut into nmers.
+
+    totalCount = 0
+    uniqueCount = 0
+
+    print("Reading through fasta files...")
+    for f in args.fasta:
+        for header, protSeq in fastaReader.readFasta(f):
+            for i in range(0,len(protSeq) - args.nmer + 1):
+                nmers.add(protSeq[i : i + args.nmer])
+                totalCount += 1
+
+    ## write file.
+    print("Writing unique {}mers...".format(args.nmer))
+    out = open(args.outputFile, "w")
+    while len(nmers) > 0:
+        out.write("{}\n".format(nmers.pop()))
+        uniqueCount += 1
+    out.close()
+
+    print("There are {} total {}mers found.".format(totalCount, args.nmer))
+    print("{} are unique.".format(uniqueCount))
+    print("done.")
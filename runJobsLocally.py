@@ -0,0 +1,194 @@
+'''
+Run Jobs Locally
+Runs the scripts.sh made by prepareJobs.py on this machine, instead of submitting it
+with clusterTAS.
+
+Each job runs in its own directory (resultsDir/jobname) next to a link to its fasta
+file from files.fof, with bash. Like clusterTAS, jobname.sh.o holds the start and end
+dates (read by tallyParsedData_multiProc.py) and jobname.sh.e the job's stderr; the
+job's stdout goes to jobname.sh.log. A job that exits non-zero or runs past --timeout
+has a message added to jobname.sh.e, so the tally reports it as failed.
+
+Every finished job is added to a journal (resultsDir/runJobsLocally.journal.tsv) with
+its status, times and host. Running again skips the jobs the journal lists as done,
+unless one of their .parsed outputs is missing (e.g. a job resubmitted with
+prepareJobs.py --resubmit after its outputs were lost).
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import sys
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+import jobManifest
+
+DEBUG = False
+VERB = False
+
+DATEFORMAT = "%a %b %d %H:%M:%S %Z %Y"
+JOURNAL = "runJobsLocally.journal.tsv"
+
+## jobs running now, so they can be stopped on Ctrl-C
+running = {}
+runningLock = threading.Lock()
+
+
+def readJobs(scriptFile, fofFile):
+    ## (jobname, command, fasta file) of each line of scripts.sh, with the matching line of files.fof
+    jobs = []
+    fofLines = [line.rstrip("\n") for line in open(fofFile, "r") if line.strip()] if fofFile else []
+    for i, line in enumerate(line for line in open(scriptFile, "r") if line.strip()):
+        jobname, command = line.rstrip("\n").split("\t", 1)
+        jobs.append((jobname, command, fofLines[i] if i < len(fofLines) else None))
+    return jobs
+
+
+def readJournal(journalFile):
+    ## latest status of each job in the journal
+    status = {}
+    if os.path.exists(journalFile):
+        for line in open(journalFile, "r"):
+            line = line.rstrip("\n").split("\t")
+            if line[0] != "jobname" and len(line) >= 2:
+                status[line[0]] = line[1]
+    return status
+
+
+def hasOutputs(resultsDir, jobname):
+    ## every .parsed output of a job is in its directory
+    return all(os.path.exists(os.path.join(resultsDir, output)) for output in jobManifest.jobOutputs(jobname).values())
+
+
+def runJob(task):
+    ## run one job in its directory; returns (jobname, status, start, end, seconds)
+    jobname, command, fastaFile, resultsDir, timeout = task
+    jobDir = os.path.join(resultsDir, jobname)
+    ## no outputs of an earlier run of the job are left behind
+    if os.path.isdir(jobDir):
+        shutil.rmtree(jobDir)
+    os.makedirs(jobDir)
+    if fastaFile:
+        link = os.path.join(jobDir, os.path.basename(fastaFile))
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.abspath(fastaFile), link)
+
+    stdOut = open(os.path.join(jobDir, jobname + ".sh.o"), "w")
+    stdErr = open(os.path.join(jobDir, jobname + ".sh.e"), "w")
+    log = open(os.path.join(jobDir, jobname + ".sh.log"), "w")
+
+    start = time.time()
+    stdOut.write("{}\n".format(time.strftime(DATEFORMAT, time.localtime(start))))
+    stdOut.flush()
+
+    ## own process group, so a timeout stops the whole pipeline
+    proc = subprocess.Popen(["bash", "-c", command], cwd = jobDir, stdout = log, stderr = stdErr, preexec_fn = os.setsid)
+    with runningLock:
+        running[jobname] = proc
+    try:
+        returnCode = proc.wait(timeout = timeout)
+        status = "done" if returnCode == 0 else "failed"
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+        status = "timeout"
+    with runningLock:
+        running.pop(jobname, None)
+    end = time.time()
+
+    if status == "failed":
+        stdErr.write("runJobsLocally.py: exit status {}\n".format(returnCode))
+    elif status == "timeout":
+        stdErr.write("runJobsLocally.py: stopped after {} seconds\n".format(timeout))
+    if status != "timeout":
+        ## a job without an end date is incomplete
+        stdOut.write("{}\n".format(time.strftime(DATEFORMAT, time.localtime(end))))
+    stdOut.close()
+    stdErr.close()
+    log.close()
+    return jobname, status, start, end, end - start
+
+
+def stopRunning():
+    with runningLock:
+        for proc in running.values():
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Run prepareJobs.py jobs on this machine")
+    parser.add_argument("scriptFile", help = "scripts.sh from prepareJobs.py", type = str)
+    parser.add_argument("fofFile", help = "files.fof from prepareJobs.py (the fasta file of each job)", type = str)
+    parser.add_argument("resultsDir", help = "Directory to run the jobs in (one subdirectory per job)", type = str)
+    parser.add_argument("--processes", metavar = "N", help = "Number of jobs to run at once (default: number of CPUs)", type = int, default = mp.cpu_count())
+    parser.add_argument("--timeout", metavar = "seconds", help = "Stop jobs that run longer than this (default: no limit)", type = float, default = None)
+    parser.add_argument("--force", action = "store_true", help = "Run every job, even those the journal lists as done")
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    if not os.path.isdir(args.resultsDir):
+        os.makedirs(args.resultsDir)
+    journalFile = os.path.join(args.resultsDir, JOURNAL)
+    host = os.uname()[1]
+
+    jobs = readJobs(args.scriptFile, args.fofFile)
+    done = set() if args.force else set(job for job, status in readJournal(journalFile).items() if status == "done")
+    ## a job done before whose outputs have gone runs again
+    lost = set(job for job, command, fastaFile in jobs if job in done and not hasOutputs(args.resultsDir, job))
+    todo = [job for job in jobs if job[0] not in done or job[0] in lost]
+    print("{:,} jobs in {}, {:,} already done, running {:,} with {} processes...".format(len(jobs), args.scriptFile, len(jobs) - len(todo), len(todo), args.processes))
+    if lost:
+        print("{:,} of the jobs the journal lists as done are missing outputs and will run again.".format(len(lost)))
+
+    newJournal = not os.path.exists(journalFile)
+    journal = open(journalFile, "a")
+    if newJournal:
+        journal.write("jobname\tstatus\tstart\tend\tseconds\thost\n")
+        journal.flush()
+
+    timecheck = time.time()
+    counts = {"done": 0, "failed": 0, "timeout": 0}
+    pool = ThreadPool(args.processes)
+    try:
+        for jobname, status, start, end, seconds in pool.imap_unordered(runJob, [(jobname, command, fastaFile, args.resultsDir, args.timeout) for jobname, command, fastaFile in todo]):
+            journal.write("{}\t{}\t{}\t{}\t{:.2f}\t{}\n".format(jobname, status, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start)), time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(end)), seconds, host))
+            journal.flush()
+            counts[status] += 1
+            if status != "done":
+                print("\nJob {} {} after {:.1f} seconds.".format(jobname, status, seconds))
+            print("{:,} of {:,} jobs finished...".format(sum(counts.values()), len(todo)), end = "\r", flush = True)
+        pool.close()
+        pool.join()
+
+    except KeyboardInterrupt:
+        ## unfinished jobs are not in the journal, so they run again next time
+        print("\nKeyboard Interruption: stopping running jobs...")
+        stopRunning()
+        pool.terminate()
+        journal.close()
+        sys.exit(1)
+
+    journal.close()
+    print("\n{:,} done, {:,} failed, {:,} timed out in {:.2f} seconds.".format(counts["done"], counts["failed"], counts["timeout"], time.time() - timecheck))
+    if counts["failed"] or counts["timeout"]:
+        sys.exit(1)
+    print("done.")
@@ -0,0 +1,194 @@
+'''
+Score Files
+Reading and writing the parsed NetMHCpan IC50 scores (.pMHC.parsed), one score per
+peptide in the order of the job's peptides.
+
+Formats:
+    text    one IC50 per line, as printed by NetMHCpan
+    npy     NumPy .npy array of little-endian float32 (about a third of the size of text)
+    sparse  only the peptides with IC50 at or below a threshold, as little-endian
+            (uint32 peptide index, float32 IC50) records between a 16 byte header
+            (magic, float32 threshold) and a 16 byte trailer (magic, uint64 number of
+            peptides scored). A file without its trailer is incomplete.
+
+Readers detect the format from the file contents, so file names do not change.
+NetMHCpan reports IC50 to 2 decimals, which float32 keeps exactly once rounded back
+(for IC50 below 65,536 nM).
+
+Files are written to a temporary file next to the output and renamed into place on
+close, so a score file is either complete or absent.
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import os
+import tempfile
+import numpy as np
+
+FORMATS = ["text", "npy", "sparse"]
+
+NPY_MAGIC = b"\x93NUMPY"
+## the .npy header is written with a fixed size so the count can be filled in on close
+NPY_HEADER_SIZE = 128
+
+SPARSE_MAGIC = b"PMHCSPR1"
+SPARSE_TRAILER_MAGIC = b"PMHCEND1"
+SPARSE_HEADER_SIZE = 16
+SPARSE_TRAILER_SIZE = 16
+SPARSE_RECORD = np.dtype([("index", "<u4"), ("ic50", "<f4")])
+
+
+def npyHeader(count):
+    header = "{{'descr': '<f4', 'fortran_order': False, 'shape': ({},), }}".format(count)
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return NPY_MAGIC + b"\x01\x00" + np.array([len(header)], dtype = "<u2").tobytes() + header.encode("latin1")
+
+
+def sparseHeader(threshold):
+    return SPARSE_MAGIC + np.array([threshold], dtype = "<f4").tobytes() + bytes(4)
+
+
+def sparseTrailer(count):
+    return SPARSE_TRAILER_MAGIC + np.array([count], dtype = "<u8").tobytes()
+
+
+class ScoreWriter:
+    '''Append scores (lists of IC50 strings) to a score file of the given format.'''
+    def __init__(self, fileName, fmt = "text", keepThreshold = None):
+        if fmt not in FORMATS:
+            raise ValueError("Unknown score format {}.".format(fmt))
+        if fmt == "sparse" and keepThreshold is None:
+            raise ValueError("The sparse score format needs a threshold.")
+        self.fileName = fileName
+        self.fmt = fmt
+        self.keepThreshold = keepThreshold
+        self.count = 0
+        ## the temporary name must not match "*.parsed"
+        fd, self.tempName = tempfile.mkstemp(prefix = ".scores.", suffix = ".partial", dir = os.path.dirname(os.path.abspath(fileName)))
+        if fmt == "text":
+            self.out = os.fdopen(fd, "w")
+        else:
+            self.out = os.fdopen(fd, "wb")
+            self.out.write(npyHeader(0) if fmt == "npy" else sparseHeader(keepThreshold))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *exc):
+        if excType is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, scores):
+        if self.fmt == "text":
+            self.out.write("".join("{}\n".format(s) for s in scores))
+        elif self.fmt == "npy":
+            self.out.write(np.array(scores, dtype = "<f4").tobytes())
+        else:
+            scores = np.array(scores, dtype = "<f4")
+            keep = np.flatnonzero(scores <= self.keepThreshold)
+            if self.count + len(scores) > 1 << 32:
+                raise ValueError("The sparse score format holds at most 2^32 peptides.")
+            records = np.empty(len(keep), dtype = SPARSE_RECORD)
+            records["index"] = keep + self.count
+            records["ic50"] = scores[keep]
+            self.out.write(records.tobytes())
+        self.count += len(scores)
+
+    def close(self):
+        if self.fmt == "npy":
+            self.out.seek(0)
+            self.out.write(npyHeader(self.count))
+        elif self.fmt == "sparse":
+            self.out.write(sparseTrailer(self.count))
+        self.out.close()
+        os.chmod(self.tempName, 0o666 & ~umask())
+        os.replace(self.tempName, self.fileName)
+
+    def discard(self):
+        '''Close without writing the score file.'''
+        self.out.close()
+        ## already gone if close() got as far as renaming it
+        if os.path.exists(self.tempName):
+            os.remove(self.tempName)
+
+
+def umask():
+    ## mkstemp creates files readable only by the owner; give the score file the usual permissions
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def fileMagic(fileName):
+    with open(fileName, "rb") as f:
+        return f.read(8)
+
+
+def isNpy(fileName):
+    return fileMagic(fileName).startswith(NPY_MAGIC)
+
+
+def isSparse(fileName):
+    return fileMagic(fileName) == SPARSE_MAGIC
+
+
+def readSparse(fileName):
+    '''(peptide indices, IC50s, number of peptides scored, threshold) of a sparse score file.'''
+    size = os.path.getsize(fileName)
+    numRecords = (size - SPARSE_HEADER_SIZE - SPARSE_TRAILER_SIZE) // SPARSE_RECORD.itemsize
+    with open(fileName, "rb") as f:
+        header = f.read(SPARSE_HEADER_SIZE)
+        f.seek(max(size - SPARSE_TRAILER_SIZE, 0))
+        trailer = f.read(SPARSE_TRAILER_SIZE)
+    if numRecords < 0 or SPARSE_HEADER_SIZE + numRecords * SPARSE_RECORD.itemsize + SPARSE_TRAILER_SIZE != size or not trailer.startswith(SPARSE_TRAILER_MAGIC):
+        raise ValueError("{} is incomplete.".format(fileName))
+
+    threshold = float(np.frombuffer(header[8:12], dtype = "<f4")[0])
+    total = int(np.frombuffer(trailer[8:], dtype = "<u8")[0])
+    if numRecords == 0:
+        records = np.zeros(0, dtype = SPARSE_RECORD)
+    else:
+        records = np.memmap(fileName, dtype = SPARSE_RECORD, mode = "r", offset = SPARSE_HEADER_SIZE, shape = (numRecords,))
+    return records["index"], records["ic50"], total, threshold
+
+
+def readScores(fileName):
+    '''IC50 scores of a dense score file (float32 memmap for npy, float64 for text).'''
+    if isSparse(fileName):
+        raise ValueError("{} only holds scores at or below a threshold.".format(fileName))
+    if isNpy(fileName):
+        return np.load(fileName, mmap_mode = "r")
+    return np.array(open(fileName, "r").read().split(), dtype = np.float64)
+
+
+def readBinders(fileName, threshold):
+    '''(peptide indices, IC50s, number of peptides scored) of the peptides with IC50 <= threshold, in any format.'''
+    if isSparse(fileName):
+        indices, scores, total, keepThreshold = readSparse(fileName)
+        if threshold > keepThreshold:
+            raise ValueError("{} only holds scores at or below {}.".format(fileName, keepThreshold))
+        keep = np.flatnonzero(scores <= threshold)
+        return indices[keep].astype(np.int64), scores[keep], total
+    scores = readScores(fileName)
+    keep = np.flatnonzero(scores <= threshold)
+    return keep, scores[keep], len(scores)
+
+
+def readKeptScores(fileName):
+    '''(IC50s, number of peptides scored, highest IC50 kept) of a score file in any format (all IC50s, up to inf, for dense formats).'''
+    if isSparse(fileName):
+        indices, scores, total, keepThreshold = readSparse(fileName)
+        return scores, total, keepThreshold
+    scores = readScores(fileName)
+    return scores, len(scores), np.inf
+
+
+def ic50Values(scores):
+    '''float64 IC50s, with float32 scores rounded back to the 2 decimals NetMHCpan reports.'''
+    if scores.dtype == np.float32:
+        return np.round(scores.astype(np.float64), 2)
+    return np.asarray(scores, dtype = np.float64)
@@ -0,0 +1,95 @@
+'''
+Stub NetMHCpan
+Stands in for NetMHCpan 3.0 when testing the job pipeline (prepareJobs.py,
+runJobsLocally.py, parseNetMHCpanOutput.py, ...) without the real predictor.
+Takes the same -a, -l, -f and -tdir options and prints a report in the same layout,
+with made up IC50s that are the same for the same allele and peptide on every run.
+
+Usage: python stubNetMHCpan.py -tdir tmpdirXXXXXX -a HLA-A01:01,HLA-B07:02 -l 9 -f prot9_1_HUMAN.fa
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import sys
+import argparse
+import re
+import time
+import zlib
+import fastaReader
+
+DEBUG = False
+VERB = False
+
+MAX_IC50 = 50000.0
+DASHES = "-" * 99
+
+
+def reportAllele(allele):
+    ## HLA-A01:01 is printed as HLA-A*01:01
+    return re.sub(r"^(HLA-[A-Z]+)(\d)", r"\1*\2", allele)
+
+
+def stubIC50(allele, peptide):
+    ## log-uniform between 1 and MAX_IC50 nM, from a hash of the allele and peptide
+    u = zlib.crc32("{}{}".format(allele, peptide).encode("ascii")) / float(1 << 32)
+    return MAX_IC50 ** u
+
+
+def readSequences(fastaFile):
+    ## (name, sequence) of each record; no index is left in the job directory
+    with fastaReader.FastaFile(fastaFile, cacheIndex = False) as fasta:
+        return [(fasta.names[i], bytes(fasta.sequence(i)).decode("ascii")) for i in range(len(fasta))]
+
+
+if __name__ == "__main__":
+
+    ## Deal with command line arguments
+    parser = argparse.ArgumentParser(description = "Stub NetMHCpan 3.0")
+    parser.add_argument("-a", metavar = "alleles", help = "Comma separated alleles", type = str, required = True)
+    parser.add_argument("-l", metavar = "n", help = "Comma separated peptide lengths", type = str, default = "9")
+    parser.add_argument("-f", metavar = "fasta", help = "Fasta file of sequences", type = str, required = True)
+    parser.add_argument("-tdir", metavar = "dir", help = "Ignored", type = str, default = None)
+    parser.add_argument("--secondsPerPeptide", metavar = "S", help = "Sleep this long per prediction, to mimic run time (default: 0)", type = float, default = 0)
+    parser.add_argument("--failAfter", metavar = "N", help = "Stop with an error after N predictions, to test failure handling", type = int, default = None)
+    parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
+    parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
+    args = parser.parse_args()
+
+    ## Set Global Vars
+    DEBUG = args.DEBUG
+    VERB = args.VERB
+
+    seqs = readSequences(args.f)
+    numPredictions = 0
+
+    print("# NetMHCpan version 3.0 (stub)\n")
+    print("# Input is in FSA format\n")
+    for n in [int(x) for x in args.l.split(",")]:
+        for allele in args.a.split(","):
+            hla = reportAllele(allele)
+            for name, seq in seqs:
+                numPeptides = len(seq) - n + 1
+                if numPeptides <= 0:
+                    continue
+                print(DASHES)
+                print("  Pos          HLA         Peptide       Core Of Gp Gl Ip Il        Icore        Identity   Score Aff(nM) %Rank  BindLevel")
+                print(DASHES)
+                lines = []
+                for pos in range(numPeptides):
+                    if args.failAfter is not None and numPredictions >= args.failAfter:
+                        sys.stdout.write("".join(lines))
+                        sys.stdout.flush()
+                        print("ERROR: stub failure after {} predictions".format(numPredictions), file = sys.stderr)
+                        sys.exit(1)
+                    peptide = seq[pos : pos + n]
+                    ic50 = stubIC50(hla, peptide)
+                    lines.append("{:>5}  {:>11}  {:>14}  {:>9}  0  0  0  0  0  {:>14}  {:>15}  {:.5f}  {:>7.2f}  {:>5.2f}\n".format(pos, hla, peptide, peptide, peptide, name, 1 - min(ic50, MAX_IC50) / MAX_IC50, ic50, 100.0 * ic50 / MAX_IC50))
+                    numPredictions += 1
+                sys.stdout.write("".join(lines))
+                print(DASHES)
+                print("\nProtein {}. Allele {}. Number of high binders 0. Number of weak binders 0. Number of peptides {}\n".format(name, hla, numPeptides))
+                print(DASHES)
+                if args.secondsPerPeptide > 0:
+                    time.sleep(args.secondsPerPeptide * numPeptides)
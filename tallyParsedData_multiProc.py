@@ -10,6 +10,22 @@ Edited January 11, 2017:
     - Add time parsing data too
 Edited January 15, 2017:
     - Use multiprocessing to speed up.
+Edited October 17, 2026:
+    - Score files are read with scoreFiles.py (text, float32 .npy or sparse) and counted with numpy.
+    - Jobs of several alleles (prepareJobs.py --allelesPerJob, named HUMAN_A+B_9_1) have
+      one parsed file per allele, and every allele must be there.
+    - scriptReferenceFile can be the job manifest from prepareJobs.py (jobs.manifest.jsonl):
+      each job's files are then found by name instead of listing its directory, and the
+      number of scores is checked against the expected number of peptides.
+    - Jobs are checked with workerPool.py (one shared queue, no polling of per-process queues).
+    - Each score file is binned into a log-spaced IC50 histogram per allele and length
+      (ic50Histograms.py), saved next to the results. The results table has a column per
+      --cutoffs value and length, NA where a cutoff is above the threshold of a sparse
+      score file (which only holds the scores at or below it).
+    - --cache keeps the result of each job in an SQLite file, with the size, modification
+      time and inode of the job's directory and files, and a hash of its manifest entry
+      (expected number of peptides, alleles and outputs). Jobs that have not changed since
+      are taken from the cache instead of read again.
 '''
 
 ## Import Libraries
@@ -18,111 +34,183 @@ import argparse
 import os
 import re
 import datetime
-import multiprocessing as mp
 import time
+import traceback
+import json
+import hashlib
+import sqlite3
+import numpy as np
+import scoreFiles
+import jobManifest
+import workerPool
+import ic50Histograms
 
 DEBUG = False
 VERB = False
 
-SENTINEL = None
-
 maxBufferSize = 10000
-maxSlaveSize = 100
-
-def processJob(q, out_q, i):
-    resHolder = []
-    ## will hold [[jobname, isClean], [jobname,hla,pepLen,date,dt,duration], [hla, {}]]
-    numInHolder = 0
-
-    while True:
-        dat = q.get()
-        if DEBUG: print("\ndat in slave {} is: {}".format(i, dat))
-        if dat is SENTINEL:
-            break
-
-        jobname, direc = dat
-
-        timeRes = []
-        hlaRes = []
-        
-        errFile = None
-        stdFile = None
-        resFile = None
-
-        if os.path.exists(direc):
-
-            for file in os.listdir(direc):
-                if re.match(".*\.sh\.e.*", file):
-                    errFile = file
-                elif re.match(".*\.sh\.o.*", file):
-                    stdFile = file
-                elif re.match(".*\.parsed", file):
-                    resFile = file
-
-            jobIsClean = True
-
-        ## check that shell err file empty
-        if errFile:
-            for line in open(os.path.join(direc, errFile), "r"):
-                if line:
-                    ## file should be empty, there is an error.
-                    jobIsClean = False
+
+CACHE_VERSION = "2"
+
+## per process: histogram bin edges and whether jobs are cached
+edges = None
+useCache = False
+
+def setGlobals(debug, verb, histEdges, cache):
+    global DEBUG, VERB, edges, useCache
+    DEBUG = debug
+    VERB = verb
+    edges = histEdges
+    useCache = cache
+
+def jobFingerprint(jobname, direc, record):
+    ## size, modification time and inode of the job directory and the files the tally reads,
+    ## and the manifest entry, so a job prepared again with another split is read again
+    if not os.path.exists(direc):
+        return "missing"
+    if record and os.path.exists(os.path.join(direc, jobname + ".sh.e")) and os.path.exists(os.path.join(direc, jobname + ".sh.o")):
+        names = [jobname + ".sh.e", jobname + ".sh.o"] + [os.path.basename(record["outputs"][hla]) for hla in record["hlas"]]
+    else:
+        names = [file for file in os.listdir(direc) if re.match(r".*\.sh\.[eo].*|.*\.parsed", file)]
+    fingerprint = ["manifest:{}".format(hashlib.sha1(json.dumps(record, sort_keys = True).encode("utf-8")).hexdigest()) if record else "manifest:none"]
+    for name in [""] + sorted(names):
+        try:
+            st = os.stat(os.path.join(direc, name))
+            fingerprint.append("{}:{}:{}:{}".format(name, st.st_size, st.st_mtime_ns, st.st_ino))
+        except OSError:
+            fingerprint.append("{}:missing".format(name))
+    return "|".join(fingerprint)
+
+def tallyJob(dat):
+    ## returns [jobname, fingerprint, processJob result], with no result if the job matches its cached fingerprint
+    jobname, direc, record, cachedFingerprint = dat
+    if not useCache:
+        return [jobname, None, processJob([jobname, direc, record])]
+    fingerprint = jobFingerprint(jobname, direc, record)
+    if fingerprint == cachedFingerprint:
+        return [jobname, fingerprint, None]
+    return [jobname, fingerprint, processJob([jobname, direc, record])]
+
+def encodeResult(item):
+    cleanStat, bindStat, timeStat = item
+    return json.dumps([cleanStat, [[hla, pepLen, counts.tolist(), numScored, complete] for hla, pepLen, counts, numScored, complete in bindStat], timeStat])
+
+def decodeResult(text):
+    cleanStat, bindStat, timeStat = json.loads(text)
+    return [cleanStat, [[hla, pepLen, np.array(counts, dtype = np.int64), numScored, complete] for hla, pepLen, counts, numScored, complete in bindStat], timeStat]
+
+def openCache(cacheFile, histEdges):
+    ## cached results are only valid for the same histogram bins
+    cache = sqlite3.connect(cacheFile)
+    cache.execute("CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT)")
+    cache.execute("CREATE TABLE IF NOT EXISTS jobs(jobname TEXT PRIMARY KEY, fingerprint TEXT, result TEXT)")
+    settings = json.dumps({"version": CACHE_VERSION, "edges": histEdges.tolist()})
+    stored = cache.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+    if stored is None or stored[0] != settings:
+        if stored is not None:
+            print("Tally cache {} was made with other cutoffs, starting again.".format(cacheFile))
+        cache.execute("DELETE FROM jobs")
+        cache.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('settings', ?)", (settings,))
+    cache.commit()
+    return cache
+
+def processJob(dat):
+    ## returns [[jobname, isClean], [[hla, pepLen, histogram, numScored, complete], ...], [jobname,hla,pepLen,date,dt,duration]]
+    if DEBUG: print("\ndat is: {}".format(dat))
+
+    jobname, direc, record = dat
+
+    timeRes = []
+    hlaRes = []
+    
+    errFile = None
+    stdFile = None
+    resFiles = []
+
+    if record and os.path.exists(os.path.join(direc, jobname + ".sh.e")) and os.path.exists(os.path.join(direc, jobname + ".sh.o")):
+        ## from the manifest, without listing the directory
+        errFile = jobname + ".sh.e"
+        stdFile = jobname + ".sh.o"
+        jobIsClean = True
+
+    elif os.path.exists(direc):
+
+        for file in os.listdir(direc):
+            if re.match(r".*\.sh\.e.*", file):
+                errFile = file
+            elif re.match(r".*\.sh\.o.*", file):
+                stdFile = file
+            elif re.match(r".*\.parsed", file):
+                resFiles.append(file)
+
+        jobIsClean = True
+
+    ## check that shell err file empty
+    if errFile:
+        for line in open(os.path.join(direc, errFile), "r"):
+            if line:
+                ## file should be empty, there is an error.
+                jobIsClean = False
+    else:
+        ## job did not run
+        jobIsClean = False
+
+    ## check the time
+    if jobIsClean:
+        if stdFile:
+            times = [0,0]
+            lineNum = 0
+            for line in open(os.path.join(direc, stdFile), "r"):
+                times[lineNum] = datetime.datetime.strptime(line.rstrip(), "%a %b %d %H:%M:%S %Z %Y")
+                lineNum += 1
+            #print(times)
+
+            if times[0] == 0 or times[1] == 0:
+                if DEBUG: print("Job {} did not complete.".format(f.split(".")[0]))
+                jobIsClean = False
+
+            else:
+                duration = times[1] - times[0]
+                duration = duration.total_seconds()
+
+                date = str(times[0].date())
+                dt = str(times[0])
+                hla = jobname.split("_")[1]
+                pepLen = jobname.split("_")[2]
+
+                timeRes = [jobname, hla, pepLen, date, dt, duration]
         else:
-            ## job did not run
             jobIsClean = False
 
-        ## check the time
-        if jobIsClean:
-            if stdFile:
-                times = [0,0]
-                lineNum = 0
-                for line in open(os.path.join(direc, stdFile), "r"):
-                    times[lineNum] = datetime.datetime.strptime(line.rstrip(), "%a %b %d %H:%M:%S %Z %Y")
-                    lineNum += 1
-                #print(times)
-
-                if times[0] == 0 or times[1] == 0:
-                    if DEBUG: print("Job {} did not complete.".format(f.split(".")[0]))
-                    jobIsClean = False
-
-                else:
-                    duration = times[1] - times[0]
-                    duration = duration.total_seconds()
-
-                    date = str(times[0].date())
-                    dt = str(times[0])
-                    hla = jobname.split("_")[1]
-                    pepLen = jobname.split("_")[2]
-
-                    timeRes = [jobname, hla, pepLen, date, dt, duration]
-            else:
+    ## parse results
+    if jobIsClean:
+        ## resFile like CHLTR_HLA-A01-01_10_1.pMHC.parsed, one per allele of the job
+        jobHlas = set(jobname.split("_")[1].split("+"))
+        if record:
+            ## output paths are relative to the results directory
+            resPaths = [(hla, record["length"], os.path.join(os.path.dirname(direc), record["outputs"][hla])) for hla in record["hlas"]]
+            resPaths = [res for res in resPaths if os.path.exists(res[2])]
+        else:
+            resPaths = []
+            for resFile in sorted(resFiles):
+                (species, hla, pepLen, fnum) = resFile.split(".")[0].split("_")
+                resPaths.append((hla, int(pepLen), os.path.join(direc,resFile)))
+        for hla, pepLen, resPath in resPaths:
+            try:
+                ## a sparse file is complete up to its threshold; higher cutoffs are NA in the results
+                scores, numScored, complete = scoreFiles.readKeptScores(resPath)
+                if record and numScored != record["expected"]:
+                    raise ValueError("{} has {} scores for {} peptides.".format(resPath, numScored, record["expected"]))
+                hlaRes.append([hla, pepLen, ic50Histograms.histogram(edges, scoreFiles.ic50Values(scores)), numScored, complete])
+                jobHlas.discard(hla)
+            except ValueError as e:
+                print("\nJob {}: {}".format(jobname, e))
                 jobIsClean = False
+        if jobHlas:
+            if DEBUG: print("Job {} has no results for {}.".format(jobname, ", ".join(sorted(jobHlas))))
+            jobIsClean = False
 
-        ## parse results
-        if jobIsClean:
-            ## resFile like CHLTR_HLA-A01-01_10_1.pMHC.parsed
-            (species, hla, pepLen, fnum) = resFile.split(".")[0].split("_")
-            pepLen = int(pepLen)
-            hlaResDict = {50: [0 for x in range(0,4)], 100: [0 for x in range(0,4)], 500: [0 for x in range(0,4)]}
-            for line in open(os.path.join(direc,resFile), "r"):
-                line = float(line.rstrip())
-                for cutoff in hlaResDict:
-                    if line <= cutoff:
-                        hlaResDict[cutoff][pepLen - 8] += 1
-                hlaRes = [hla, hlaResDict]
-
-        resHolder.append([[jobname,jobIsClean], hlaRes, timeRes])
-        
-        numInHolder += 1
-        if numInHolder == maxSlaveSize:
-            out_q.put(resHolder)
-            resHolder = []
-            numInHolder = 0
-    out_q.put(resHolder)
-    resHolder = []
-    numInHolder = 0
-
-    print("\nProcessing in slave {} complete...".format(i))
+    return [[jobname,jobIsClean], hlaRes, timeRes]
 
 
 
@@ -131,12 +219,15 @@ if __name__ == "__main__":
     ## Deal with command line arguments
     parser = argparse.ArgumentParser(description = "Tally Parsed Data")
     ## add_argument("name", "(names)", metavar="exampleOfValue - best for optional", type=int, nargs="+", choices=[allowed,values], dest="nameOfVariableInArgsToSaveAs")
-    parser.add_argument("scriptReferenceFile", help = "Script file used by clusterTAS, containing job names", type = str)
+    parser.add_argument("scriptReferenceFile", help = "Script file used by clusterTAS, containing job names (or the jobs.manifest.jsonl from prepareJobs.py)", type = str)
     parser.add_argument("resultsDir", help = "Directory with parsed result files", type = str)
     parser.add_argument("resultsOutputFile", help = "File to write results output to", type = str)
     parser.add_argument("timeOutputFile", help = "File to write time output to", type = str)
     parser.add_argument("incompleteJobsFile", help = "File to write incomplete job names to", type = str)
     parser.add_argument("maxNumberProcessess", help = "Maximum number of processes to start", type = int)
+    parser.add_argument("--cutoffs", metavar = "nM", nargs = "+", help = "IC50 cutoffs to count binders at (default: 50 100 500)", type = float, default = ic50Histograms.DEFAULT_CUTOFFS)
+    parser.add_argument("--cache", metavar = "file", help = "SQLite file to keep job results in between runs; only new or changed jobs are read", type = str, default = None)
+    parser.add_argument("--histogramFile", metavar = "file", help = "File to save the IC50 histograms to (default: resultsOutputFile with .hist.npz)", type = str, default = None)
     parser.add_argument("-d", "--debug", action = "store_true", dest = "DEBUG", help = "Flag for setting debug/test state.")
     parser.add_argument("-v", "--verbose", action = "store_true", dest = "VERB", help = "Flag for setting verbose output.")
     args = parser.parse_args()
@@ -145,7 +236,8 @@ if __name__ == "__main__":
     DEBUG = args.DEBUG
     VERB = args.VERB
 
-    res = {}    ## keys are HLA alleles
+    histEdges = ic50Histograms.histogramEdges(args.cutoffs)
+    res = ic50Histograms.IC50Histograms(histEdges)
     jobs = set()
     failedJobs = set()
 
@@ -155,8 +247,14 @@ if __name__ == "__main__":
     ## get list of jobs that were submitted.
     timecheck = time.time()
     print("Reading in list of all jobs that were submitted for processing...")
-    for line in open(args.scriptReferenceFile, "r"):
-        jobs.add(line.split("\t")[0])
+    records = {}
+    if jobManifest.isManifest(args.scriptReferenceFile):
+        for record in jobManifest.readManifest(args.scriptReferenceFile):
+            jobs.add(record["job"])
+            records[record["job"]] = record
+    else:
+        for line in open(args.scriptReferenceFile, "r"):
+            jobs.add(line.split("\t")[0])
 
     print("Complete. Took {:.2f} seconds...".format(time.time()-timecheck))
 
@@ -165,46 +263,22 @@ if __name__ == "__main__":
     timecheck = time.time()
     print("Checking each job...")
     try:
-        print("Making job processing slaves...")
-        procs = []
-        pqs = []
-        out_qs = []
-        for i in range(args.maxNumberProcessess):
-            q = mp.Queue()
-            oq = mp.Queue()
-            p = mp.Process(target=processJob, args=(q, oq, i+1))
-            procs.append(p)
-            p.start()
-            pqs.append(q)
-            out_qs.append(oq)
-
-        proc_ind = 0
-        job_num = 0
-        print("Submitting jobs to slaves...")
+        cache = None
+        fingerprints = {}
+        if args.cache:
+            cache = openCache(args.cache, histEdges)
+            fingerprints = dict(cache.execute("SELECT jobname, fingerprint FROM jobs"))
+        cacheBuffer = []
+        numCached = 0
+
+        tasks = []
         for jobname in jobs:
-            if job_num % 100 == 0:
-                print("{:,} jobs submitted to slaves...".format(job_num), end="\r")
-
-
             #if DEBUG: print("Processing job {}".format(jobname))
             direc = os.path.join(os.path.abspath(args.resultsDir),jobname)
+            tasks.append([jobname,direc,records.get(jobname),fingerprints.get(jobname)])
+        fingerprints = None
 
-            ## add to queue
-            pqs[proc_ind].put([jobname,direc])
-            proc_ind += 1
-            if proc_ind >= args.maxNumberProcessess:
-                proc_ind = 0
-
-            job_num += 1
-
-
-
-        for pq in pqs:
-            pq.put(SENTINEL)
-
-        print("\nTook {:.2f} seconds...".format(time.time() - timecheck))
-
-        print("All jobs submitted, beginning to write timing information in {:,} line blocks...".format(maxBufferSize))
+        print("Writing timing information in {:,} line blocks...".format(maxBufferSize))
 
         timecheck = time.time()
 
@@ -218,39 +292,32 @@ if __name__ == "__main__":
         numBlocks = 0
         blockTime = time.time()
 
-        numJobs = 0
-        proc_ind = 0
-        while numJobs < len(jobs):
-            if not out_qs[proc_ind].empty():
-                resultChunk = out_qs[proc_ind].get()
-                for item in resultChunk:
-                    cleanStat, bindStat, timeStat = item
-
-                    ## if job failed:
-                    if not cleanStat[1]:
-                        failedOut.write("{}\n".format(cleanStat[0]))
-
-                    else:
-                        ## hla binding
-                        hla, hlaNums = bindStat
-                        if hla not in res:
-                            res[hla] = {50: [0 for x in range(0,4)], 100: [0 for x in range(0,4)], 500: [0 for x in range(0,4)]}
-                        for cutoff in hlaNums:
-                            for i in range(len(hlaNums[cutoff])):
-                                res[hla][cutoff][i] += hlaNums[cutoff][i]
+        for jobname, fingerprint, item in workerPool.runTasks(tallyJob, tasks, args.maxNumberProcessess, initializer = setGlobals, initargs = (DEBUG, VERB, histEdges, cache is not None), label = "jobs"):
+            if item is None:
+                ## unchanged since the last run
+                item = decodeResult(cache.execute("SELECT result FROM jobs WHERE jobname = ?", (jobname,)).fetchone()[0])
+                numCached += 1
+            elif cache is not None:
+                cacheBuffer.append((jobname, fingerprint, encodeResult(item)))
+                if len(cacheBuffer) >= 1000:
+                    cache.executemany("INSERT OR REPLACE INTO jobs(jobname, fingerprint, result) VALUES (?, ?, ?)", cacheBuffer)
+                    cache.commit()
+                    cacheBuffer = []
+            cleanStat, bindStat, timeStat = item
+
+            ## if job failed:
+            if not cleanStat[1]:
+                failedOut.write("{}\n".format(cleanStat[0]))
 
+            else:
+                ## hla binding
+                for hla, pepLen, counts, numScored, complete in bindStat:
+                    res.add(hla, pepLen, counts, numScored, complete)
 
-                        ## time
-                        resultBuffer.append("\t".join(str(x) for x in timeStat))
-                        numInBuffer += 1
-                        if numInBuffer % 100 == 0:
-                            print("Buffer contains {:,} lines...".format(numInBuffer), end="\r")
-
-                    numJobs += 1
 
-            proc_ind += 1
-            if proc_ind >= args.maxNumberProcessess:
-                proc_ind = 0
+                ## time
+                resultBuffer.append("\t".join(str(x) for x in timeStat))
+                numInBuffer += 1
 
             if numInBuffer >= maxBufferSize:
                 numBlocks += 1
@@ -269,31 +336,31 @@ if __name__ == "__main__":
 
         failedOut.close()
 
+        if cache is not None:
+            cache.executemany("INSERT OR REPLACE INTO jobs(jobname, fingerprint, result) VALUES (?, ?, ?)", cacheBuffer)
+            cache.commit()
+            cache.close()
+            print("{:,} jobs unchanged since the cached tally, {:,} read.".format(numCached, len(tasks) - numCached))
+
 
         print("Took {:.2f} seconds...".format(time.time() - timecheck))
 
     except KeyboardInterrupt:
         print("Keyboard Interruption: ".format(sys.exc_info()[0]))
         print(traceback.format_exc())
-        print("Please wait while processes close...")
-        for q in pqs:
-            q.empty()
-            q.put(SENTINEL)
-        for p in procs:
-            p.join()
+        print("Processes stopped.")
 
-        sys.exit()
+        sys.exit(1)
 
 
 
     timecheck = time.time()
     print("Writing HLA data...")
 
-    out = open(args.resultsOutputFile, "w")
-    out.write("hla\tco50_8mer\tco50_9mer\tco50_10mer\tco50_11mer\tco100_8mer\tco100_9mer\tco100_10mer\tco100_11mer\tco500_8mer\tco500_9mer\tco500_10mer\tco500_11mer\n")
-    for hla in res:
-        out.write("{}\t{}\t{}\t{}\n".format(hla, "\t".join(str(x) for x in res[hla][50]), "\t".join(str(x) for x in res[hla][100]), "\t".join(str(x) for x in res[hla][500])))
-    out.close()
+    ic50Histograms.writeCutoffTable(res, args.resultsOutputFile, args.cutoffs)
+    histogramFile = args.histogramFile or "{}.hist.npz".format(os.path.splitext(args.resultsOutputFile)[0])
+    res.save(histogramFile)
+    if VERB: print("IC50 histograms written to {}.".format(histogramFile))
 
     print("Took {:.2f} seconds...".format(time.time() - timecheck))
 
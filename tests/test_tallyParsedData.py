@@ -0,0 +1,68 @@
+'''
+Tests for tallyParsedData_multiProc.py
+
+    python -m pytest tests
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoDir)
+import scoreFiles
+
+JOB = "HUMAN_HLA-A01-01_9_1"
+
+
+class SparseCutoffTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.resultsDir = os.path.join(self.tmpDir, "results")
+        jobDir = os.path.join(self.resultsDir, JOB)
+        os.makedirs(jobDir)
+        open(os.path.join(jobDir, JOB + ".sh.e"), "w").close()
+        with open(os.path.join(jobDir, JOB + ".sh.o"), "w") as out:
+            out.write("Sat Oct 17 10:00:00 UTC 2026\nSat Oct 17 10:05:00 UTC 2026\n")
+        ## only the scores at or below 100 nM are kept
+        with scoreFiles.ScoreWriter(os.path.join(jobDir, JOB + ".pMHC.parsed"), "sparse", keepThreshold = 100) as writer:
+            writer.write(["12.50", "80.00", "300.00", "40000.00"])
+        self.scriptFile = os.path.join(self.tmpDir, "scripts.sh")
+        with open(self.scriptFile, "w") as out:
+            out.write("{}\tnetMHCpan\n".format(JOB))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def tally(self, *options):
+        resultsFile = os.path.join(self.tmpDir, "singleHLAdata.tsv")
+        failedFile = os.path.join(self.tmpDir, "failedJobs.txt")
+        subprocess.run([sys.executable, os.path.join(repoDir, "tallyParsedData_multiProc.py"), self.scriptFile, self.resultsDir,
+                        resultsFile, os.path.join(self.tmpDir, "timeCharacteristics.tsv"), failedFile, "1", "--cutoffs", "50", "500"] + list(options),
+                       check = True, stdout = subprocess.DEVNULL)
+        rows = [line.rstrip("\n").split("\t") for line in open(resultsFile, "r")]
+        return dict(zip(rows[0], rows[1])), open(failedFile, "r").read().split()
+
+    def test_cutoffAboveThresholdIsNA(self):
+        counts, failed = self.tally()
+        self.assertEqual(failed, [])
+        self.assertEqual(counts["co50_9mer"], "1")
+        self.assertEqual(counts["co500_9mer"], "NA")
+
+    def test_cachedJobIsNotFailed(self):
+        cacheFile = os.path.join(self.tmpDir, "tally.sqlite")
+        self.tally("--cache", cacheFile)
+        counts, failed = self.tally("--cache", cacheFile)
+        self.assertEqual(failed, [])
+        self.assertEqual(counts["co500_9mer"], "NA")
+
+
+if __name__ == "__main__":
+    unittest.main()
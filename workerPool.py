@@ -0,0 +1,98 @@
+'''
+Worker Pool
+Runs a function over many tasks in a pool of processes, for the scripts that look up or
+tally many independent items (tallyParsedData_multiProc.py, makeDatabaseOfBinders.py,
+lookupHLAgenotypesSQL.py, lookupMutationReadSupport.py).
+
+All workers take tasks from one shared queue, a chunk at a time, so a slow task does
+not hold up the tasks queued behind it. The results are yielded as they arrive (or in
+task order with ordered = True) while a progress line reports the throughput.
+
+Ctrl-C stops the workers and raises KeyboardInterrupt in the main process. An exception
+in a worker stops the workers and is raised in the main process as a WorkerError that
+holds the worker's traceback.
+
+    for result in workerPool.runTasks(lookup, tasks, 16, initializer = openDatabase, initargs = (dbFile,), label = "genotypes"):
+        ...
+
+Date: October 17, 2026
+@author: sbrown
+'''
+
+## Import Libraries
+import signal
+import time
+import traceback
+import multiprocessing as mp
+
+## most tasks per chunk; chunks are smaller when there are few tasks per process
+MAX_CHUNK_SIZE = 100
+PROGRESS_SECONDS = 1.0
+
+
+class WorkerError(Exception):
+    '''An exception raised by a task in a worker process.'''
+    pass
+
+
+class TracedTask:
+    ## calls the task function, keeping the worker's traceback of any exception
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, task):
+        try:
+            return self.function(task)
+        except Exception:
+            raise WorkerError("Task {!r} failed in a worker:\n{}".format(task, traceback.format_exc()))
+
+
+def initWorker(initializer, initargs):
+    ## Ctrl-C is handled by the main process, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def chunkSize(numTasks, numProcesses):
+    if numTasks is None:
+        return MAX_CHUNK_SIZE
+    return max(1, min(MAX_CHUNK_SIZE, numTasks // (4 * numProcesses)))
+
+
+def runTasks(function, tasks, numProcesses, initializer = None, initargs = (), chunksize = None, ordered = False, label = "tasks", quiet = False):
+    '''Yield function(task) for each task, computed by numProcesses worker processes.
+
+    function and initializer must be module level functions. initializer(*initargs) runs
+    once in each worker, e.g. to open a database or set globals for function.'''
+    if not isinstance(tasks, list):
+        tasks = list(tasks)
+    if chunksize is None:
+        chunksize = chunkSize(len(tasks), numProcesses)
+
+    timecheck = time.time()
+    lastReport = timecheck
+    numDone = 0
+    pool = mp.Pool(numProcesses, initializer = initWorker, initargs = (initializer, initargs))
+    try:
+        if ordered:
+            results = pool.imap(TracedTask(function), tasks, chunksize)
+        else:
+            results = pool.imap_unordered(TracedTask(function), tasks, chunksize)
+        for result in results:
+            numDone += 1
+            if not quiet and time.time() - lastReport >= PROGRESS_SECONDS:
+                lastReport = time.time()
+                print("{:,} of {:,} {} done ({:,.1f} per second)...".format(numDone, len(tasks), label, numDone / (lastReport - timecheck)), end = "\r", flush = True)
+            yield result
+        pool.close()
+    except BaseException:
+        ## Ctrl-C, a failed task, or the caller stopped early
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if not quiet:
+        seconds = time.time() - timecheck
+        print("{:,} {} done in {:.2f} seconds ({:,.1f} per second) with {} processes.".format(numDone, label, seconds, numDone / max(seconds, 1e-9), numProcesses))